@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+import binary_protocol
+import parsing
+import server
+import socket_helper
+
+#asyncio version of the central index server. every peer connection is a coroutine on a single event loop
+#instead of a thread, so thousands of long lived idle peers only cost a socket and a small stream object each.
+#requests are answered by server.handle_request so both modes speak exactly the same protocol
+
+log = logging.getLogger("async_server")
+
+#handle each client on the event loop until they exit
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    session = None
+    encoder = None
+    #frames the connection's text requests and keeps them parsed for handle_request
+    parser = parsing.MessageParser(server.MAX_REQUEST_BODY)
+    try:
+        init_request = await socket_helper.read_message_async(reader, server.MAX_REQUEST_BODY, parser)
+        if init_request is None:
+            return
+        init = server.init_client(init_request, parser.request(init_request))
+        if init is None:
+            server.reject_message(writer.write)
+            return
+        (client_host, client_port, upgrade, digests) = init
+        if upgrade is not None:
+            writer.write(server.upgrade_response(upgrade))
+            if upgrade == binary_protocol.VERSION:
+                encoder = binary_protocol.Encoder(digests)
+        #notifications pushed by other connections are only ever buffered, the event loop never waits on the peer.
+        #a peer that lets them pile up in the buffer is dropped
+        session = server.ClientSession(writer.write, encoder, (client_host, client_port), digests, writer.transport.abort,
+                                       writer.transport.get_write_buffer_size)
+        server.leases.grant(session, writer.close)
+        server.metrics.add("connections.active")
+        server.metrics.add("connections.total")
+
+        while True:
+            if encoder is None:
+                request = await socket_helper.read_message_async(reader, server.MAX_REQUEST_BODY, parser)
+            else:
+                request = await socket_helper.read_frame_async(reader, server.MAX_REQUEST_BODY)
+            if request is None: #the peer closed the connection
+                break
+            start = time.perf_counter()
+            sent = 0
+            #pushes from other coroutines are held back while this one writes a response, even across the awaits.
+            #nothing else ever waits on the session lock, so taking it never blocks the event loop
+            session.acquire()
+            try:
+                if encoder is None:
+                    response = server.answer_request(request, client_host, client_port, session, parser.request(request))
+                else:
+                    response = server.handle_binary_request(request, session, client_host, client_port)
+                server.leases.renew(session)
+                if response is None:
+                    break
+                if isinstance(response, bytes):
+                    writer.write(response)
+                    sent = len(response)
+                    await writer.drain()
+                else:
+                    for piece in response:
+                        writer.write(piece)
+                        sent += len(piece)
+                        await writer.drain()
+            finally:
+                session.release()
+                server.record_request(request, encoder is not None, sent, time.perf_counter() - start)
+    except socket_helper.BadMessage:
+        server.reject_message(writer.write, encoder)
+    except ConnectionError:
+        pass
+    finally:
+        if session is not None:
+            server.metrics.add("connections.active", -1)
+            server.leases.release(session)
+            #a peer that went away without an EXIT can't serve its rfcs any more either
+            server.remove_peer_from_system(client_host, client_port)
+            server.subscriptions.remove_subscriber(session)
+            session.close()
+        writer.close()
+
+#look for expired leases every REAP_INTERVAL seconds. the connections of reaped peers are closed, which ends
+#their coroutines
+async def reap_forever():
+    while True:
+        await asyncio.sleep(server.REAP_INTERVAL)
+        server.reap_expired_peers()
+
+async def serve(host: str, port: int):
+    async_server = await asyncio.start_server(handle_client, host, port, backlog=server.LISTEN_BACKLOG, reuse_address=True)
+    log.info("Listening on port %s", port)
+    #kept in a variable so the task is not garbage collected
+    reaper = asyncio.ensure_future(reap_forever())
+    async with async_server:
+        await async_server.serve_forever()
+
+#stats_interval logs the server's metrics every that many seconds, None never does. the event loop is profiled as a
+#whole when profiling is switched on by a signal, which is handled on the loop's thread
+def start_server(host: str = server.SERVER_HOST, port: int = server.SERVER_PORT, lease: float = server.LEASE_SECONDS, stats_interval: float = None):
+    server.leases.duration = lease
+    if stats_interval:
+        server.metrics.dump_every(stats_interval)
+    asyncio.run(serve(host, port))
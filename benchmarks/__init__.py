@@ -0,0 +1 @@
+#benchmarks and load generators. run them from the repository root, for example: python -m benchmarks.server_load
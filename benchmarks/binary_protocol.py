@@ -0,0 +1,67 @@
+import argparse
+import io
+import time
+import binary_protocol
+import server
+import socket_helper
+import parsing
+
+#compares a LIST of the whole index sent with the P2P-CI/1.0 text encoding and the P2P-CI/2.0 binary encoding:
+#the bytes the server puts on the wire and the time a peer takes to read and parse them, per entry. the index
+#is filled in this process and the responses are rendered by the server's own code, so no sockets are involved
+#usage: python -m benchmarks.binary_protocol --entries 100000 --peers 1000
+
+arg_parser = argparse.ArgumentParser(description="wire size and parse time of the text and binary protocols")
+arg_parser.add_argument("--entries", type=int, default=100000, help="number of entries in the index")
+arg_parser.add_argument("--peers", type=int, default=1000, help="number of peers the entries are spread over")
+arg_parser.add_argument("--rounds", type=int, default=5, help="how many times each response is parsed (the best round is kept)")
+
+#replays recorded bytes to a MessageReader as if they arrived on a socket
+class _Replay:
+    def __init__(self, data: bytes):
+        self.stream = io.BytesIO(data)
+
+    def recv_into(self, view) -> int:
+        return self.stream.readinto(view)
+
+def parse_text(data: bytes) -> int:
+    reader = socket_helper.MessageReader(_Replay(data))
+    reader.read_message()
+    return sum(1 for _ in parsing.iter_rfc_lines(reader.iter_chunks()))
+
+def parse_binary(data: bytes) -> int:
+    reader = socket_helper.MessageReader(_Replay(data))
+    decoder = binary_protocol.Decoder()
+    count = 0
+    flags = binary_protocol.MORE
+    while flags & binary_protocol.MORE:
+        (_, flags, entries) = decoder.response(reader.read_frame())
+        count += len(entries)
+    return count
+
+#best seconds per entry over the rounds
+def _time_per_entry(parse, data: bytes, entries: int, rounds: int) -> float:
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        parsed = parse(data)
+        elapsed = time.perf_counter() - start
+        assert parsed == entries, "parsed {} of {} entries".format(parsed, entries)
+        best = elapsed if best is None else min(best, elapsed)
+    return best / entries
+
+def main():
+    args = arg_parser.parse_args()
+    for i in range(args.entries):
+        server.add_rfc("RFC {}".format(i), "Title of RFC {}".format(i), "peer{}.example.com".format(i % args.peers), str(40000 + i % args.peers))
+
+    text = b"".join(server.list_response("ALL"))
+    binary = b"".join(binary_protocol.Encoder().frames(200, server.list_entries("ALL"), server.LIST_CHUNK_SIZE))
+
+    print("{:<12} {:>12} {:>16} {:>16}".format("encoding", "bytes", "bytes per entry", "us per entry"))
+    for name, data, parse in [(server.P2P_VERSION, text, parse_text), (binary_protocol.VERSION, binary, parse_binary)]:
+        per_entry = _time_per_entry(parse, data, args.entries, args.rounds)
+        print("{:<12} {:>12} {:>16.1f} {:>16.3f}".format(name, len(data), len(data) / args.entries, per_entry * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import socket
+import sys
+import time
+import socket_helper
+from benchmarks import common
+
+P2P_VERSION = "P2P-CI/1.0"
+
+#peer churn against the central index server. peers register and add an rfc, then a quarter of them EXIT, a
+#quarter drop their connection without a word, a quarter stay connected but go silent and the rest keep sending
+#HEARTBEATs. a checker looks the rfcs up until the departed peers are gone and reports how long each kind of
+#departure took to leave the index, how many departed peers were still listed after a lease and a reap interval
+#(should be 0), whether every live peer was kept, and the server's threads and memory before and after. it exits
+#with status 1 if any departed peer was still listed or any live peer was dropped, so it can be run as a check.
+#usage: python -m benchmarks.churn --peers 2000 --lease 1
+
+arg_parser = argparse.ArgumentParser(description="how fast departed peers leave the index")
+arg_parser.add_argument("--modes", nargs="+", default=["threaded", "asyncio"], choices=["threaded", "asyncio"])
+arg_parser.add_argument("--peers", type=int, default=1000, help="number of peers that register")
+arg_parser.add_argument("--lease", type=float, default=1.0, help="the server's lease in seconds")
+arg_parser.add_argument("--timeout", type=float, default=15.0, help="seconds to wait for the departed peers to leave")
+
+#how long the reaper may take on top of the lease. the server looks for expired leases once a second
+REAP_SLACK = 1.5
+
+KINDS = ["exit", "drop", "silent", "live"]
+
+class ChurnPeer:
+    __slots__ = ("kind", "upload_port", "socket", "reader")
+
+    def __init__(self, kind: str, upload_port: int):
+        self.kind = kind
+        self.upload_port = upload_port
+        self.socket = None
+        self.reader = None
+
+    def rfc_number(self) -> str:
+        return "RFC {}".format(self.upload_port)
+
+    def send(self, message: str):
+        socket_helper.send_message(self.socket, message.format(version=P2P_VERSION, port=self.upload_port))
+
+def register(port: int, peer: ChurnPeer):
+    peer.socket = socket.create_connection(("localhost", port))
+    peer.reader = socket_helper.MessageReader(peer.socket)
+    peer.send("INIT - {version}\nHost: localhost\nPort: {port}\n")
+    peer.send("ADD " + peer.rfc_number() + " {version}\nHost: localhost\nPort: {port}\nTitle: Churn\n")
+    peer.reader.read_message()
+
+def heartbeat(peer: ChurnPeer):
+    peer.send("HEARTBEAT - {version}\nHost: localhost\nPort: {port}\n")
+    peer.reader.read_message()
+
+#the upload ports of the peers still listed for any of the rfcs
+def listed_ports(checker: socket.socket, reader: socket_helper.MessageReader, peers: list) -> set:
+    body = "".join(peer.rfc_number() + "\n" for peer in peers).encode()
+    socket_helper.send_message(checker, "LOOKUP BATCH {}\nHost: localhost\nPort: 1\n".format(P2P_VERSION), body)
+    response = reader.read_message()
+    (_, _, body) = response.partition(b"\n\n")
+    return {int(line.split()[-1]) for line in body.decode().splitlines() if line.strip()}
+
+def run_mode(mode: str, args) -> dict:
+    port = common.free_port()
+    proc = common.start_server_process(mode, port, ["--lease", str(args.lease)])
+    try:
+        peers = [ChurnPeer(KINDS[i % len(KINDS)], 20000 + i) for i in range(args.peers)]
+        for peer in peers:
+            register(port, peer)
+        checker = socket.create_connection(("localhost", port))
+        checker_reader = socket_helper.MessageReader(checker)
+        socket_helper.send_message(checker, "INIT - {}\nHost: localhost\nPort: 1\n".format(P2P_VERSION))
+        #every lease starts again now, however long registering took
+        for peer in peers:
+            heartbeat(peer)
+        threads_before = common.process_threads(proc.pid)
+        rss_before = common.process_rss_kb(proc.pid)
+
+        start = time.perf_counter()
+        for peer in peers:
+            if peer.kind == "exit":
+                peer.send("EXIT - {version}\nHost: localhost\nPort: {port}\n")
+                peer.socket.close()
+            elif peer.kind == "drop":
+                peer.socket.close()
+        #the kinds of departed peers still listed, and when each kind was last seen
+        gone_after = {}
+        live = [peer for peer in peers if peer.kind == "live"]
+        next_heartbeat = start
+        while time.perf_counter() - start < args.timeout:
+            now = time.perf_counter()
+            #the checker's own requests renew its lease
+            listed = listed_ports(checker, checker_reader, peers)
+            elapsed = time.perf_counter() - start
+            still = {peer.kind for peer in peers if peer.upload_port in listed and peer.kind != "live"}
+            for kind in KINDS[:3]:
+                if kind not in still and kind not in gone_after:
+                    gone_after[kind] = elapsed
+            if elapsed > args.lease + REAP_SLACK:
+                break
+            if now >= next_heartbeat:
+                for peer in live:
+                    heartbeat(peer)
+                next_heartbeat = now + args.lease / 3
+            time.sleep(0.02)
+        #the departed peers listed at the last look, after a lease and a reap interval or at the timeout
+        stale = sum(1 for peer in peers if peer.kind != "live" and peer.upload_port in listed)
+        live_kept = sum(1 for peer in live if peer.upload_port in listed_ports(checker, checker_reader, live))
+        time.sleep(0.5)
+        threads_after = common.process_threads(proc.pid)
+        rss_after = common.process_rss_kb(proc.pid)
+        for peer in peers:
+            peer.socket.close()
+        checker.close()
+    finally:
+        common.stop_process(proc)
+
+    return {
+        "mode": mode,
+        "peers": len(peers),
+        "exit_ms": gone_after.get("exit", -1) * 1000,
+        "drop_ms": gone_after.get("drop", -1) * 1000,
+        "silent_ms": gone_after.get("silent", -1) * 1000,
+        "stale": stale,
+        "live_kept": "{}/{}".format(live_kept, len(live)),
+        "live_lost": len(live) - live_kept,
+        "threads": "{}->{}".format(threads_before, threads_after),
+        "rss_mb": "{:.1f}->{:.1f}".format(rss_before / 1024, rss_after / 1024),
+    }
+
+def main():
+    args = arg_parser.parse_args()
+    common.raise_fd_limit()
+    columns = ["mode", "peers", "exit_ms", "drop_ms", "silent_ms", "stale", "live_kept", "threads", "rss_mb"]
+    print(" ".join("{:>12}".format(c) for c in columns))
+    failures = []
+    for mode in args.modes:
+        result = run_mode(mode, args)
+        print(" ".join("{:>12.1f}".format(result[c]) if isinstance(result[c], float) else "{:>12}".format(result[c]) for c in columns))
+        if result["stale"]:
+            failures.append("{}: {} departed peers still listed".format(mode, result["stale"]))
+        if result["live_lost"]:
+            failures.append("{}: {} live peers dropped".format(mode, result["live_lost"]))
+    for message in failures:
+        print("failed: " + message, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
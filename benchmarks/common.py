@@ -0,0 +1,87 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+#the repository root, so benchmark subprocesses can run server.py no matter where they are started from
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#get a port that is currently free on loopback
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+#raise the open file limit as far as the hard limit allows. returns the new soft limit
+def raise_fd_limit() -> int:
+    try:
+        import resource
+    except ImportError: #not available on windows
+        return -1
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        target = hard if hard != resource.RLIM_INFINITY else 1 << 20
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    return soft
+
+#start server.py in a subprocess and wait until it accepts connections. its output goes to stdout (a file or
+#subprocess.PIPE), thrown away by default
+def start_server_process(mode: str, port: int, extra_args: list = None, timeout: float = 10.0, stdout = subprocess.DEVNULL) -> subprocess.Popen:
+    args = [sys.executable, "server.py", "--mode", mode, "--port", str(port)] + (extra_args or [])
+    proc = subprocess.Popen(args, cwd=REPO_ROOT, stdout=stdout, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=0.5).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server ({}) did not start on port {}".format(mode, port))
+
+def stop_process(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+#read a field such as VmRSS or Threads from /proc/<pid>/status. returns -1 where /proc is not available
+def _proc_status_field(pid: int, field: str) -> int:
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return -1
+
+def process_rss_kb(pid: int) -> int:
+    return _proc_status_field(pid, "VmRSS")
+
+def process_threads(pid: int) -> int:
+    return _proc_status_field(pid, "Threads")
+
+#nearest rank percentile of an already sorted list
+def percentile(sorted_values: list, pct: float):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+#user plus system cpu seconds a process has used. returns -1 where /proc is not available
+def process_cpu_seconds(pid: int) -> float:
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            #the command name can hold spaces, the fields after it can't
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError):
+        return -1
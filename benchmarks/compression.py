@@ -0,0 +1,113 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+import compression
+from benchmarks import common
+
+#what compressing rfc transfers costs and saves, for text content (rfc-like lines of english words) and binary
+#content (random bytes, the way images and archives look to a compressor). reports the compression ratio and the
+#cpu time to compress and decompress each encoding, then the end-to-end time of a GET from a peer's upload server:
+#the first one (cold, the upload server compresses the rfc) and the mean of later ones (warm, the compressed copy is
+#cached). --link caps the uploader's upload rate to stand in for a network link, 0 leaves it at loopback speed.
+#usage: python -m benchmarks.compression --size 4194304 --link 10240
+
+arg_parser = argparse.ArgumentParser(description="compression ratio, cpu cost and transfer time of rfc downloads")
+arg_parser.add_argument("--size", type=int, default=4 * 1024 * 1024, help="bytes in each rfc")
+arg_parser.add_argument("--link", type=float, default=10240, help="upload rate of the uploading peer in kilobytes per second, 0 for unshaped")
+arg_parser.add_argument("--repeats", type=int, default=5, help="warm downloads timed for each encoding")
+
+WORDS = ("the", "peer", "server", "index", "request", "response", "header", "MUST", "SHOULD", "connection", "protocol",
+         "message", "field", "value", "client", "section", "octets", "length", "and", "of", "to", "a", "is", "in", "be")
+
+#english-like lines of text, wrapped at 72 columns like an rfc
+def text_content(size: int) -> bytes:
+    rng = random.Random(1)
+    lines = []
+    total = 0
+    while total < size:
+        line = " ".join(rng.choice(WORDS) for _ in range(11))[:72]
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines).encode()[:size]
+
+def binary_content(size: int) -> bytes:
+    return random.Random(2).randbytes(size)
+
+#cpu seconds per megabyte taken by fn(data), best of three
+def cpu_per_mb(fn, data: bytes) -> float:
+    best = None
+    for _ in range(3):
+        start = time.process_time()
+        fn(data)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / (len(data) / 2**20)
+
+def cpu_costs(contents: dict):
+    print("{:<8} {:<10} {:>8} {:>16} {:>18}".format("content", "encoding", "ratio", "compress ms/MB", "decompress ms/MB"))
+    for (name, data) in contents.items():
+        for encoding in compression.ENCODINGS:
+            compressed = compression.compress(data, encoding)
+            decode = lambda body: compression._decompressor(encoding).decompress(body)
+            print("{:<8} {:<10} {:>8.2f} {:>16.1f} {:>18.1f}".format(name, encoding, len(data) / len(compressed),
+                  cpu_per_mb(lambda d: compression.compress(d, encoding), data) * 1000, cpu_per_mb(decode, compressed) * 1000))
+
+#seconds taken by one GET of RFC 1, the body decompressed and checked against its digest
+def timed_get(downloader, upload_port: int) -> float:
+    start = time.perf_counter()
+    (response,) = downloader._get_from_peer("127.0.0.1", upload_port, ["RFC 1"])
+    elapsed = time.perf_counter() - start
+    if response is None:
+        raise RuntimeError("download failed its digest check")
+    return elapsed
+
+def transfers(args, contents: dict, port: int, directory: str):
+    from peer import Peer
+    from rfc import RFC
+    link = args.link * 1024 if args.link else None
+    print("\nGET over a {} link".format("{:.0f} KB/s".format(args.link) if link else "loopback"))
+    print("{:<8} {:<10} {:>12} {:>12} {:>12}".format("content", "encoding", "cold s", "warm s", "speedup"))
+    for (name, data) in contents.items():
+        #the content lives in a file, so the binary one is never decoded as text
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        identity = None
+        for encoding in (None,) + compression.ENCODINGS:
+            with contextlib.redirect_stdout(io.StringIO()):
+                rfc = RFC("RFC 1", name, "Thu, 01 Jan 1970 00:00:00 GMT", len(data), "application/octet-stream", None, path)
+                uploader = Peer([rfc], server_address=("localhost", port), compression=encoding, upload_rate=link)
+                uploader.start_upload_server()
+                downloader = Peer([], server_address=("localhost", port))
+                cold = timed_get(downloader, uploader.upload_socket_port)
+                #one more download first, so the burst the link's token bucket starts with is spent and the warm
+                #downloads are timed at the link's rate
+                timed_get(downloader, uploader.upload_socket_port)
+                warm = sum(timed_get(downloader, uploader.upload_socket_port) for _ in range(args.repeats)) / args.repeats
+                downloader.exit_cmd()
+                uploader.exit_cmd()
+                uploader.stop_upload_server()
+            if identity is None:
+                identity = warm
+            print("{:<8} {:<10} {:>12.3f} {:>12.3f} {:>11.2f}x".format(name, encoding or "identity", cold, warm, identity / warm))
+
+def main():
+    args = arg_parser.parse_args()
+    contents = {"text": text_content(args.size), "binary": binary_content(args.size)}
+    cpu_costs(contents)
+    port = common.free_port()
+    proc = common.start_server_process("threaded", port)
+    directory = tempfile.mkdtemp(prefix="rfc-compression-")
+    try:
+        transfers(args, contents, port, directory)
+    finally:
+        shutil.rmtree(directory)
+        common.stop_process(proc)
+
+if __name__ == '__main__':
+    main()
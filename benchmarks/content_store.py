@@ -0,0 +1,56 @@
+import argparse
+import gc
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks import common
+
+#compares the memory of a peer's rfc library kept in memory against one kept in a ContentStore, and how long a
+#restarted peer takes to load its stored library. each case runs in its own process so their RSS don't mix.
+#usage: python -m benchmarks.content_store --rfcs 2000 --size 65536
+
+arg_parser = argparse.ArgumentParser(description="RSS of a peer's library in memory and on disk")
+arg_parser.add_argument("--rfcs", type=int, default=2000, help="number of RFCs in the library")
+arg_parser.add_argument("--size", type=int, default=64 * 1024, help="size of each RFC's content in bytes")
+arg_parser.add_argument("--child", choices=["memory", "disk", "reload"], help=argparse.SUPPRESS)
+arg_parser.add_argument("--dir", help=argparse.SUPPRESS)
+
+#build the library in this process and print the RSS it ends up with
+def run_child(args):
+    from rfc import RFC
+    from rfc_store import RFCStore
+    from content_store import ContentStore
+
+    start = time.perf_counter()
+    if args.child == "reload":
+        store = RFCStore([], ContentStore(args.dir))
+    else:
+        store = RFCStore([], ContentStore(args.dir) if args.child == "disk" else None)
+        for i in range(args.rfcs):
+            store.add(RFC("RFC {}".format(i), "Title {}".format(i), "Thu, 01 Jan 1970 00:00:00 GMT", args.size, "text/plain", os.urandom(args.size // 2).hex()))
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    print("{} {} {}".format(len(store), common.process_rss_kb(os.getpid()), elapsed))
+
+def main():
+    args = arg_parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    directory = tempfile.mkdtemp(prefix="rfc-store-")
+    try:
+        print("{:<8} {:>8} {:>10} {:>10}".format("library", "rfcs", "rss_mb", "seconds"))
+        for mode in ["memory", "disk", "reload"]:
+            out = subprocess.run([sys.executable, "-m", "benchmarks.content_store", "--child", mode, "--dir", directory,
+                                  "--rfcs", str(args.rfcs), "--size", str(args.size)],
+                                 cwd=common.REPO_ROOT, capture_output=True, text=True, check=True).stdout.split()
+            print("{:<8} {:>8} {:>10.1f} {:>10.2f}".format(mode, out[0], int(out[1]) / 1024, float(out[2])))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
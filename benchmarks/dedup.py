@@ -0,0 +1,124 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+import socket_helper
+from benchmarks import common
+
+#what content digests save on a library where many rfc numbers share the same content. reports the memory and
+#disk used by a library kept in an RFCStore (which stores each distinct content once) against a plain list of
+#RFCs, the time a peer takes to get every rfc of another peer's library when it has none of it and when it already
+#has the same contents under other rfc numbers, and what hashing bodies as they arrive costs a download.
+#usage: python -m benchmarks.dedup --rfcs 2000 --distinct 500 --size 16384
+
+arg_parser = argparse.ArgumentParser(description="memory, disk and downloads saved by content digests")
+arg_parser.add_argument("--rfcs", type=int, default=2000, help="number of RFCs in the library")
+arg_parser.add_argument("--distinct", type=int, default=500, help="number of distinct contents the RFCs share")
+arg_parser.add_argument("--size", type=int, default=16 * 1024, help="size of each content in bytes")
+arg_parser.add_argument("--body-mb", type=int, default=64, help="megabytes received by the hashing run")
+
+#the library: rfc i has content number i % distinct. contents are built again for each RFC, the way they would
+#arrive from the network, so equal contents are different objects
+def library(args, offset: int = 0) -> list:
+    from rfc import RFC
+    seeds = [random.Random(i).randbytes(args.size // 2).hex() for i in range(args.distinct)]
+    return [RFC("RFC {}".format(i + offset), "Title {}".format(i), "Thu, 01 Jan 1970 00:00:00 GMT", args.size, "text/plain",
+                "".join([seeds[i % args.distinct][:1], seeds[i % args.distinct][1:]])) for i in range(args.rfcs)]
+
+#bytes allocated while building a library with make()
+def traced(make) -> int:
+    tracemalloc.start()
+    kept = make()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+def disk_usage(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+def storage(args):
+    from rfc_store import RFCStore
+    from content_store import ContentStore
+    print("{:<22} {:>12}".format("library", "mb"))
+    print("{:<22} {:>12.1f}".format("list in memory", traced(lambda: library(args)) / 2**20))
+    print("{:<22} {:>12.1f}".format("RFCStore in memory", traced(lambda: RFCStore(library(args))) / 2**20))
+    directory = tempfile.mkdtemp(prefix="rfc-dedup-")
+    try:
+        RFCStore(library(args), ContentStore(directory))
+        print("{:<22} {:>12.1f}".format("ContentStore on disk", disk_usage(directory) / 2**20))
+        print("{:<22} {:>12.1f}".format("contents", args.rfcs * args.size / 2**20))
+    finally:
+        shutil.rmtree(directory)
+
+def downloads(args, port: int):
+    from peer import Peer
+    with contextlib.redirect_stdout(io.StringIO()):
+        uploader = Peer(library(args), server_address=("localhost", port))
+        uploader.start_upload_server()
+        for rfc in uploader.rfcs:
+            uploader.add_cmd(rfc.rfc_number, rfc.title)
+    rfc_numbers = ["RFC {}".format(i) for i in range(args.rfcs)]
+    print("\n{:<22} {:>12} {:>12} {:>12}".format("downloader", "rfcs", "downloaded", "seconds"))
+    #the second downloader has the whole library under other rfc numbers
+    for (name, rfcs) in [("has nothing", []), ("has the contents", library(args, args.rfcs))]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            downloader = Peer(rfcs, server_address=("localhost", port))
+            fetched = []
+            original = downloader._get_from_peer
+            def counting(host, upload_port, numbers, *rest):
+                fetched.extend(numbers)
+                return original(host, upload_port, numbers, *rest)
+            downloader._get_from_peer = counting
+            start = time.perf_counter()
+            got = downloader.get_many(rfc_numbers)
+            elapsed = time.perf_counter() - start
+            downloader.exit_cmd()
+        print("{:<22} {:>12} {:>12} {:>12.2f}".format(name, len(got), len(fetched), elapsed))
+    with contextlib.redirect_stdout(io.StringIO()):
+        uploader.exit_cmd()
+        uploader.stop_upload_server()
+
+#receive body_mb megabytes of 1 MB messages over a socket pair, with and without hashing them as they arrive
+def hashing(args):
+    body = os.urandom(2**20)
+    message = socket_helper.encode_message("P2P-CI/1.0 200 OK\n", body)
+    print("\n{:<22} {:>12}".format("receiving", "mb/s"))
+    for name in ["plain", "sha-256 as it arrives"]:
+        (a, b) = socket.socketpair()
+        def send():
+            for _ in range(args.body_mb):
+                a.sendall(message)
+            a.close()
+        sender = threading.Thread(target=send)
+        reader = socket_helper.MessageReader(b)
+        start = time.perf_counter()
+        sender.start()
+        for _ in range(args.body_mb):
+            reader.read_message(None if name == "plain" else lambda head: hashlib.sha256().update)
+        elapsed = time.perf_counter() - start
+        sender.join()
+        b.close()
+        print("{:<22} {:>12.0f}".format(name, args.body_mb / elapsed))
+
+def main():
+    args = arg_parser.parse_args()
+    storage(args)
+    port = common.free_port()
+    proc = common.start_server_process("threaded", port)
+    try:
+        downloads(args, port)
+    finally:
+        common.stop_process(proc)
+    hashing(args)
+
+if __name__ == '__main__':
+    main()
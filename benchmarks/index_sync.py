@@ -0,0 +1,66 @@
+import argparse
+import contextlib
+import io
+import time
+from peer import Peer
+from rfc import RFC
+from benchmarks import common
+
+#a chatty peer that lists the whole index and looks up an rfc over and over while another peer keeps adding rfcs.
+#compares asking the server every time with keeping a mirror of the index that is synced before every question
+#(cache ttl 0, so it never answers from stale data): the server's cpu time, the bytes the peer receives and the
+#time the peer spends.
+#usage: python -m benchmarks.index_sync --entries 20000 --rounds 50
+
+arg_parser = argparse.ArgumentParser(description="cost of repeated LIST and LOOKUP with and without an index mirror")
+arg_parser.add_argument("--entries", type=int, default=20000, help="number of entries in the index")
+arg_parser.add_argument("--rounds", type=int, default=50, help="number of list + lookup rounds")
+arg_parser.add_argument("--binary", action="store_true", help="talk to the server with P2P-CI/2.0")
+
+#counts the bytes received on the peer's connection to the server
+class _CountingSocket:
+    def __init__(self, sock):
+        self.sock = sock
+        self.received = 0
+
+    def recv_into(self, view) -> int:
+        received = self.sock.recv_into(view)
+        self.received += received
+        return received
+
+def run(port: int, pid: int, args, index_cache_ttl) -> tuple:
+    chatty = Peer([], server_address=("localhost", port), binary=args.binary, index_cache_ttl=index_cache_ttl)
+    counter = _CountingSocket(chatty.server_socket)
+    chatty.server_reader.sock = counter
+    churn = Peer([], server_address=("localhost", port))
+    cpu = common.process_cpu_seconds(pid)
+    start = time.perf_counter()
+    for i in range(args.rounds):
+        churn.add_cmd("RFC {}".format(args.entries + i), "Churn")
+        listed = sum(1 for _ in chatty.iter_list())
+        chatty.lookup_cmd("RFC {}".format(i), "")
+    elapsed = time.perf_counter() - start
+    cpu = common.process_cpu_seconds(pid) - cpu
+    chatty.exit_cmd()
+    churn.exit_cmd()
+    return (listed, elapsed, cpu, counter.received)
+
+def main():
+    args = arg_parser.parse_args()
+    port = common.free_port()
+    proc = common.start_server_process("threaded", port)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            loader = Peer([RFC.from_number_and_title("RFC {}".format(i), "Title {}".format(i)) for i in range(args.entries)], server_address=("localhost", port))
+            for rfc in list(loader.rfcs):
+                loader.add_cmd(rfc.rfc_number, rfc.title)
+        print("{:<10} {:>8} {:>10} {:>14} {:>14}".format("client", "listed", "seconds", "server_cpu_s", "received_mb"))
+        for name, ttl in [("no mirror", None), ("mirror", 0)]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                (listed, elapsed, cpu, received) = run(port, proc.pid, args, ttl)
+            print("{:<10} {:>8} {:>10.2f} {:>14.2f} {:>14.2f}".format(name, listed, elapsed, cpu, received / 1e6))
+    finally:
+        common.stop_process(proc)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import logging
+import os
+import subprocess
+import threading
+import time
+import diagnostics
+import metrics
+from benchmarks import common
+
+#what observability costs the server. first the cost per request, in process, of recording metrics, of the
+#profiler's check while it is off and of logging a request: printing it the way the server used to, a debug
+#message that is filtered out, and one handed to the background log writer. the log output goes to a pipe read by
+#another thread, standing in for a terminal. then the LOOKUPs per second a server answers with --log-level info
+#(requests aren't logged) and debug (every request is logged), with the latencies it reports to STATS.
+#usage: python -m benchmarks.instrumentation --calls 100000 --clients 4 --seconds 3
+
+arg_parser = argparse.ArgumentParser(description="per request cost of metrics, profiling hooks and logging")
+arg_parser.add_argument("--calls", type=int, default=100000, help="calls timed for each in process measurement")
+arg_parser.add_argument("--clients", type=int, default=4, help="peers sending LOOKUPs to the server at once")
+arg_parser.add_argument("--seconds", type=float, default=3.0, help="how long each server run lasts")
+
+REQUEST = b"LOOKUP RFC 123 P2P-CI/1.0\nHost: 127.0.0.1\nPort: 50000\nTitle: \n\n"
+
+#a pipe with a thread reading and throwing away everything written to it. returns the file to write to
+def drained_pipe():
+    (read_fd, write_fd) = os.pipe()
+    def drain():
+        while os.read(read_fd, 65536):
+            pass
+    threading.Thread(target=drain, daemon=True).start()
+    return os.fdopen(write_fd, "w")
+
+#microseconds per call of fn()
+def per_call(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+def in_process(args):
+    import server
+    out = drained_pipe()
+    log = logging.getLogger("bench")
+    def print_request():
+        print("Received LOOKUP request:\n{}\n".format(REQUEST.decode()), file=out, flush=True)
+    def profile_hooks():
+        diagnostics.profiler.end(diagnostics.profiler.begin())
+    rows = [("record metrics", lambda: server.record_request(REQUEST, False, 120, 0.0003)),
+            ("profiler hooks (off)", profile_hooks),
+            ("print, as before", print_request)]
+    print("{:<28} {:>12}".format("per request", "us"))
+    for (name, fn) in rows:
+        print("{:<28} {:>12.2f}".format(name, per_call(fn, args.calls)))
+    diagnostics.setup_logging("info", out)
+    print("{:<28} {:>12.2f}".format("log.debug, filtered", per_call(lambda: server.log_request("LOOKUP", REQUEST), args.calls)))
+    diagnostics.setup_logging("debug", out)
+    print("{:<28} {:>12.2f}".format("log.debug, queued", per_call(lambda: server.log_request("LOOKUP", REQUEST), args.calls)))
+    #back to logging nothing, so the records of the server runs don't end up in the pipe
+    diagnostics.setup_logging("warning", out)
+
+#send LOOKUPs from a peer until the deadline. returns how many were answered
+def lookups(port: int, deadline: float) -> int:
+    from peer import Peer
+    peer = Peer([], server_address=("localhost", port))
+    count = 0
+    while time.time() < deadline:
+        peer.lookup_cmd("RFC 123", "")
+        count += 1
+    peer.exit_cmd()
+    return count
+
+def server_run(args, level: str) -> tuple:
+    from peer import Peer
+    port = common.free_port()
+    proc = common.start_server_process("threaded", port, ["--log-level", level], stdout=subprocess.PIPE)
+    #read the server's output the way a terminal would, so it is never held up by a full pipe
+    threading.Thread(target=lambda: proc.stdout.read(), daemon=True).start()
+    try:
+        counts = [0] * args.clients
+        deadline = time.time() + args.seconds
+        def client(i):
+            counts[i] = lookups(port, deadline)
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        peer = Peer([], server_address=("localhost", port))
+        stats = metrics.parse_stats(peer.stats_cmd().split("\n\n", 1)[1])
+        peer.exit_cmd()
+    finally:
+        common.stop_process(proc)
+    return (sum(counts) / args.seconds, stats["requests.LOOKUP"])
+
+def main():
+    args = arg_parser.parse_args()
+    in_process(args)
+    print("\n{:<12} {:>12} {:>10} {:>10} {:>10}".format("log level", "lookups/s", "p50_ms", "p95_ms", "p99_ms"))
+    for level in ["info", "debug"]:
+        (rate, lookup) = server_run(args, level)
+        print("{:<12} {:>12.0f} {:>10.3f} {:>10.3f} {:>10.3f}".format(level, rate, lookup["p50_ms"], lookup["p95_ms"], lookup["p99_ms"]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+import metrics
+from benchmarks import common
+
+#a reproducible load test of the whole system. starts a server and a swarm of headless peers on loopback, spread
+#over client processes so they aren't held back by one GIL. every peer is made with Peer.with_random_rfcs from a
+#random.Random seeded with --seed, its process and its place, and adds its rfcs to the index. then each peer runs a
+#mix of operations picked by its own seeded random.Random, for --seconds or --requests operations each:
+#  add     ADDs one of its rfcs again
+#  lookup  LOOKUPs a random rfc number
+#  list    LISTs the whole index
+#  get     downloads an rfc from another peer's upload server (of the same client process)
+#  churn   exits and is replaced by a new peer with new rfcs, which has joined once its rfcs are added
+#the same seed gives the same peers, rfcs and sequence of operations. the results are written as json: operations
+#per second and latency percentiles of each kind of operation, the server's memory, threads, cpu time and its own
+#STATS, and the client processes' memory and threads. --compare checks the results against an earlier run and
+#exits with status 1 if any operation got slower by more than --tolerance.
+#usage: python -m benchmarks.load_test --peers 40 --seconds 10 --mix add=1,lookup=6,list=1,get=4,churn=0.2 --output run.json
+
+OPERATIONS = ("add", "lookup", "list", "get", "churn")
+
+arg_parser = argparse.ArgumentParser(description="reproducible load test of a server and a swarm of peers, results as json")
+arg_parser.add_argument("--mode", choices=["threaded", "asyncio", "sharded"], default="threaded", help="how the server runs")
+arg_parser.add_argument("--workers", type=int, default=2, help="worker processes of a sharded server")
+arg_parser.add_argument("--peers", type=int, default=20, help="number of peers")
+arg_parser.add_argument("--processes", type=int, default=min(4, os.cpu_count() or 1), help="client processes the peers are spread over")
+arg_parser.add_argument("--rfcs", type=int, default=20, help="random rfcs each peer starts with")
+arg_parser.add_argument("--mix", default="add=1,lookup=6,list=1,get=4,churn=0.2", help="relative weight of each operation")
+arg_parser.add_argument("--seconds", type=float, default=5.0, help="how long the peers run operations")
+arg_parser.add_argument("--requests", type=int, default=None, help="run exactly this many operations per peer instead of for --seconds")
+arg_parser.add_argument("--seed", type=int, default=1, help="seed of every random choice of the run")
+arg_parser.add_argument("--binary", action="store_true", help="peers talk to the server with P2P-CI/2.0")
+arg_parser.add_argument("--output", help="write the json results to this file as well as stdout")
+arg_parser.add_argument("--compare", help="json results of an earlier run to check these against")
+arg_parser.add_argument("--tolerance", type=float, default=0.2, help="fraction an operation's throughput may drop or p99 may grow before it counts as a regression")
+
+#{operation: weight} from "add=1,lookup=6,..."
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        (name, _, weight) = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise ValueError("unknown operation {!r}, expected one of {}".format(name, ", ".join(OPERATIONS)))
+        weights[name.strip()] = float(weight)
+    return weights
+
+#the peers of one client process and what they have measured. slot i holds the current peer of the i'th place,
+#replaced when the peer churns
+class Swarm:
+    def __init__(self, port: int, process: int, args):
+        self.port = port
+        self.process = process
+        self.args = args
+        self.peers = []
+        #(rfc number, title) of the rfcs of each slot's peer
+        self.rfcs = []
+        #operation -> latencies in seconds, and errors
+        self.latencies = {operation: [] for operation in OPERATIONS}
+        self.errors = {operation: 0 for operation in OPERATIONS}
+        self.lock = threading.Lock()
+
+    #a new peer for a slot, its rfcs drawn from a random.Random seeded by the run's seed, the process, the slot and
+    #how many peers the slot has had, and added to the index
+    def join(self, slot: int, generation: int):
+        from peer import Peer
+        rng = random.Random("{}-{}-{}-{}".format(self.args.seed, self.process, slot, generation))
+        peer = Peer.with_random_rfcs(self.args.rfcs, rng, server_address=("localhost", self.port), binary=self.args.binary)
+        peer.start_upload_server()
+        rfcs = [(rfc.rfc_number, rfc.title) for rfc in peer.rfcs]
+        for (rfc_number, title) in rfcs:
+            peer.add_cmd(rfc_number, title)
+        return (peer, rfcs)
+
+    def leave(self, peer):
+        try:
+            peer.exit_cmd()
+        except OSError:
+            pass
+        peer.stop_upload_server()
+        peer.server_socket.close()
+
+    #run the operations of one slot until the deadline, or for the number of requests
+    def drive(self, slot: int, deadline: float):
+        rng = random.Random("{}-{}-{}-ops".format(self.args.seed, self.process, slot))
+        mix = parse_mix(self.args.mix)
+        (operations, weights) = (list(mix), list(mix.values()))
+        generation = 0
+        done = 0
+        latencies = {operation: [] for operation in OPERATIONS}
+        errors = {operation: 0 for operation in OPERATIONS}
+        while (done < self.args.requests) if self.args.requests is not None else (time.time() < deadline):
+            operation = rng.choices(operations, weights)[0]
+            #the choices are drawn before the operation so they don't depend on how it went
+            target = rng.randrange(len(self.peers))
+            pick = rng.random()
+            number = "RFC {}".format(rng.randint(100, 999))
+            start = time.perf_counter()
+            try:
+                self.run(operation, slot, target, pick, number, generation + 1)
+                latencies[operation].append(time.perf_counter() - start)
+            except Exception: #a peer that churned away, a busy upload server or a lost connection
+                errors[operation] += 1
+            if operation == "churn":
+                generation += 1
+            done += 1
+        with self.lock:
+            for operation in OPERATIONS:
+                self.latencies[operation] += latencies[operation]
+                self.errors[operation] += errors[operation]
+
+    def run(self, operation: str, slot: int, target: int, pick: float, number: str, generation: int):
+        peer = self.peers[slot]
+        rfcs = self.rfcs[slot]
+        if operation == "add":
+            (rfc_number, title) = rfcs[int(pick * len(rfcs))]
+            peer.add_cmd(rfc_number, title)
+        elif operation == "lookup":
+            peer.lookup_cmd(number, "")
+        elif operation == "list":
+            for _ in peer.iter_list():
+                pass
+        elif operation == "get":
+            #another peer's rfc, straight from its upload server. an rfc is downloaded again whenever it is picked,
+            #it isn't kept
+            if target == slot:
+                target = (target + 1) % len(self.peers)
+            (other, other_rfcs) = (self.peers[target], self.rfcs[target])
+            (rfc_number, _) = other_rfcs[int(pick * len(other_rfcs))]
+            (response,) = peer._get_from_peer(other.upload_socket_host, other.upload_socket_port, [rfc_number])
+            if response is None or not response.startswith(b"P2P-CI/1.0 200 "):
+                raise RuntimeError("download failed")
+        else:
+            self.leave(peer)
+            (self.peers[slot], self.rfcs[slot]) = self.join(slot, generation)
+
+#one client process. builds its peers, says it is ready, waits for start and runs them. puts its results on results
+def run_client(port: int, process: int, slots: int, args, ready, start, results):
+    swarm = Swarm(port, process, args)
+    for slot in range(slots):
+        (peer, rfcs) = swarm.join(slot, 0)
+        swarm.peers.append(peer)
+        swarm.rfcs.append(rfcs)
+    ready.put(process)
+    start.wait()
+    deadline = time.time() + args.seconds
+    threads = [threading.Thread(target=swarm.drive, args=(slot, deadline)) for slot in range(slots)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pid = os.getpid()
+    (rss_kb, threads_count) = (common.process_rss_kb(pid), common.process_threads(pid))
+    for peer in swarm.peers:
+        swarm.leave(peer)
+    results.put({"latencies": swarm.latencies, "errors": swarm.errors, "rss_kb": rss_kb, "threads": threads_count})
+
+#count, errors, operations per second and latency percentiles of one operation
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(common.percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(common.percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(common.percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0
+    }
+
+def server_stats(port: int) -> dict:
+    from peer import Peer
+    peer = Peer([], server_address=("localhost", port))
+    stats = metrics.parse_stats(peer.stats_cmd().split("\n\n", 1)[1])
+    peer.exit_cmd()
+    return stats
+
+def run(args) -> dict:
+    parse_mix(args.mix)
+    port = common.free_port()
+    server_args = ["--lease", "60", "--log-level", "warning"] + (["--workers", str(args.workers)] if args.mode == "sharded" else [])
+    proc = common.start_server_process(args.mode, port, server_args)
+    try:
+        ready = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        start = multiprocessing.Event()
+        processes = max(1, min(args.processes, args.peers))
+        #the peers are split between the processes as evenly as they go
+        slots = [args.peers // processes + (1 if i < args.peers % processes else 0) for i in range(processes)]
+        clients = [multiprocessing.Process(target=run_client, args=(port, i, slots[i], args, ready, start, results)) for i in range(processes)]
+        for client in clients:
+            client.start()
+        for _ in clients:
+            ready.get()
+        cpu = common.process_cpu_seconds(proc.pid)
+        began = time.perf_counter()
+        start.set()
+        gathered = [results.get() for _ in clients]
+        elapsed = time.perf_counter() - began
+        for client in clients:
+            client.join()
+        cpu = common.process_cpu_seconds(proc.pid) - cpu
+        server = {"rss_kb": common.process_rss_kb(proc.pid), "threads": common.process_threads(proc.pid), "cpu_s": round(cpu, 3),
+                  "stats": server_stats(port)}
+    finally:
+        common.stop_process(proc)
+
+    ops = {}
+    for operation in OPERATIONS:
+        latencies = [latency for result in gathered for latency in result["latencies"][operation]]
+        errors = sum(result["errors"][operation] for result in gathered)
+        if latencies or errors:
+            ops[operation] = summarize(latencies, errors, elapsed)
+    total = sum(op["count"] for op in ops.values())
+    return {
+        "config": {key: value for (key, value) in vars(args).items() if key not in ("output", "compare", "tolerance")},
+        "elapsed_s": round(elapsed, 3),
+        "total": {"count": total, "errors": sum(op["errors"] for op in ops.values()), "per_s": round(total / elapsed, 1)},
+        "ops": ops,
+        "server": server,
+        "clients": {"processes": len(gathered), "rss_kb": sum(result["rss_kb"] for result in gathered),
+                    "threads": sum(result["threads"] for result in gathered)}
+    }
+
+#the operations that got worse than baseline by more than tolerance, as messages
+def regressions(result: dict, baseline: dict, tolerance: float) -> list:
+    found = []
+    for (operation, before) in baseline["ops"].items():
+        after = result["ops"].get(operation)
+        if after is None:
+            found.append("{}: not run".format(operation))
+            continue
+        if after["per_s"] < before["per_s"] * (1 - tolerance):
+            found.append("{}: {:.1f} per second, was {:.1f}".format(operation, after["per_s"], before["per_s"]))
+        if after["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            found.append("{}: p99 {:.3f} ms, was {:.3f} ms".format(operation, after["p99_ms"], before["p99_ms"]))
+    return found
+
+def main():
+    args = arg_parser.parse_args()
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["config"] != result["config"]:
+            print("warning: the baseline was run with another configuration", file=sys.stderr)
+        found = regressions(result, baseline, args.tolerance)
+        for message in found:
+            print("regression: " + message, file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
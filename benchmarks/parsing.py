@@ -0,0 +1,69 @@
+import argparse
+import os
+import time
+import parsing
+import socket_helper
+
+#compares the str based parsers with the bytes parser on a small GET request, a large LOOKUP/LIST reply and a
+#large GET response, and times socket_helper.MessageReader reading the GET response as it would off a socket, in
+#64 KB and 1 KB pieces: it frames the message with the incremental parser as the pieces come in and the parsed
+#response is then built from the head it already parsed.
+#usage: python -m benchmarks.parsing
+
+arg_parser = argparse.ArgumentParser(description="parse time of the str and bytes protocol parsers")
+arg_parser.add_argument("--entries", type=int, default=10000, help="number of entries in the large LIST reply")
+arg_parser.add_argument("--body", type=int, default=1024 * 1024, help="size of the large GET body in bytes")
+arg_parser.add_argument("--seconds", type=float, default=0.5, help="how long to run each case for")
+
+#average seconds per call of fn, running it for about the given number of seconds
+def _time(fn, seconds: float) -> float:
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / calls
+
+#hands recorded bytes to a MessageReader as if they arrived on a socket, piece_size bytes per recv
+class _Trickle:
+    def __init__(self, data: bytes, piece_size: int):
+        self.data = data
+        self.piece_size = piece_size
+        self.position = 0
+
+    def recv_into(self, view) -> int:
+        size = min(self.piece_size, len(view), len(self.data) - self.position)
+        view[:size] = self.data[self.position:self.position + size]
+        self.position += size
+        return size
+
+def _read(message: bytes, piece_size: int):
+    reader = socket_helper.MessageReader(_Trickle(message, piece_size))
+    return reader.parser.response(reader.read_message())
+
+def main():
+    args = arg_parser.parse_args()
+    small_request = b"GET RFC 123 P2P-CI/1.0\nHost: localhost\nOS: Linux\nConnection: keep-alive\n\n"
+    list_body = b"".join("RFC {} Some RFC Title {} 127.0.0.1 {}\n".format(i, i, 40000 + i % 1000).encode() for i in range(args.entries))
+    list_reply = "P2P-CI/1.0 200 OK\nContent-Length: {}\n\n".format(len(list_body)).encode() + list_body
+    get_body = os.urandom(args.body // 2).hex().encode()
+    get_reply = "P2P-CI/1.0 200 OK\nDate: Thu, 01 Jan 1970 00:00:00 GMT\nOS: Linux\nLast-Modified: Thu, 01 Jan 1970 00:00:00 GMT\nContent-Type: text/plain\nContent-Length: {}\n\n".format(len(get_body)).encode() + get_body
+
+    cases = [
+        ("small request", "str", lambda: parsing.parse_peer_request(small_request.decode())),
+        ("small request", "bytes", lambda: parsing.parse_request_bytes(small_request)),
+        ("large LIST reply", "str", lambda: parsing.parse_s2p_response(list_reply.decode())),
+        ("large LIST reply", "bytes", lambda: parsing.parse_rfc_entries(parsing.parse_response_bytes(list_reply).body)),
+        ("large GET body", "str", lambda: parsing.parse_p2p_reponse(get_reply.decode())),
+        ("large GET body", "bytes", lambda: parsing.parse_response_bytes(get_reply)),
+        ("large GET body", "reader 64K", lambda: _read(get_reply, 64 * 1024)),
+        ("large GET body", "reader 1K", lambda: _read(get_reply, 1024)),
+    ]
+    print("{:<18} {:<12} {:>14}".format("message", "parser", "us per parse"))
+    for name, parser, fn in cases:
+        print("{:<18} {:<12} {:>14.2f}".format(name, parser, _time(fn, args.seconds) * 1e6))
+
+if __name__ == '__main__':
+    main()
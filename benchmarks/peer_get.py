@@ -0,0 +1,71 @@
+import argparse
+import contextlib
+import io
+import time
+from connection_pool import ConnectionPool
+from peer import Peer
+from benchmarks import common
+
+#compares GET throughput with a new connection per request (the old behaviour), pooled keep-alive connections
+#and pipelined GETs over a pooled connection.
+#usage: python -m benchmarks.peer_get --requests 2000
+
+arg_parser = argparse.ArgumentParser(description="requests per second for GETs with and without connection reuse")
+arg_parser.add_argument("--requests", type=int, default=2000, help="number of RFCs downloaded in each run")
+arg_parser.add_argument("--rfcs", type=int, default=50, help="number of RFCs the uploading peer holds")
+arg_parser.add_argument("--pipeline", type=int, default=16, help="GETs sent at once in the pipelined run")
+
+def _rate(count: int, start: float) -> float:
+    return count / (time.perf_counter() - start)
+
+def main():
+    args = arg_parser.parse_args()
+    port = common.free_port()
+    proc = common.start_server_process("threaded", port)
+    results = {}
+    try:
+        #the upload server prints every connection it accepts
+        with contextlib.redirect_stdout(io.StringIO()):
+            uploader = Peer.with_random_rfcs(args.rfcs, server_address=("localhost", port))
+            uploader.start_upload_server()
+            rfcs = list(uploader.rfcs)
+            for rfc in rfcs:
+                uploader.add_cmd(rfc.rfc_number, rfc.title)
+            numbers = [rfcs[i % len(rfcs)].rfc_number for i in range(args.requests)]
+            host, upload_port = uploader.upload_socket_host, uploader.upload_socket_port
+            downloader = Peer.with_random_rfcs(0, server_address=("localhost", port))
+
+            downloader.pool = ConnectionPool(max_idle_per_host=0)
+            start = time.perf_counter()
+            for number in numbers:
+                downloader._get_from_peer(host, upload_port, [number])
+            results["new connection per GET"] = _rate(len(numbers), start)
+
+            start = time.perf_counter()
+            for number in numbers[:len(numbers) // 4]:
+                downloader.get_cmd(number, host)
+            results["get_cmd (LOOKUP + GET), no pool"] = _rate(len(numbers) // 4, start)
+
+            downloader.pool = ConnectionPool()
+            start = time.perf_counter()
+            for number in numbers:
+                downloader._get_from_peer(host, upload_port, [number])
+            results["pooled keep-alive GET"] = _rate(len(numbers), start)
+
+            start = time.perf_counter()
+            for number in numbers[:len(numbers) // 4]:
+                downloader.get_cmd(number, host)
+            results["get_cmd (LOOKUP + GET), pooled"] = _rate(len(numbers) // 4, start)
+
+            start = time.perf_counter()
+            for i in range(0, len(numbers), args.pipeline):
+                downloader._get_from_peer(host, upload_port, numbers[i:i + args.pipeline])
+            results["pipelined x{} GET".format(args.pipeline)] = _rate(len(numbers), start)
+    finally:
+        common.stop_process(proc)
+
+    for name, rate in results.items():
+        print("{:<36} {:>10.0f} requests/s".format(name, rate))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import datetime
+import platform
+import time
+from responses import ResponseBuilder
+from rfc import RFC
+
+#responses per second the upload server can render for 200 and 404 replies, rendering every header from scratch
+#(the way _res_msg used to) against the cached ResponseBuilder.
+#usage: python -m benchmarks.responses --responses 200000
+
+arg_parser = argparse.ArgumentParser(description="render rate of upload server responses")
+arg_parser.add_argument("--responses", type=int, default=200000, help="number of responses rendered for each case")
+
+#how responses were rendered before ResponseBuilder
+def uncached_response(version: str, status_code: int, phrase: str, rfc: RFC = None) -> bytes:
+    current_date = datetime.datetime.now(datetime.timezone.utc)
+    rfc_date = current_date.strftime("%a, %d %b %Y %H:%M:%S GMT")
+    msg = "{} {} {}\nDate: {}\nOS: {}\n".format(version, status_code, phrase, rfc_date, platform.platform())
+    if rfc is not None:
+        msg += "Last-Modified: {}\nContent-Length: {}\nContent-Type: {}\n\n{}".format(rfc.last_modified, len(rfc.content.encode()), rfc.content_type, rfc.content)
+    else:
+        msg += "\n"
+    return msg.encode()
+
+def cached_response(builder: ResponseBuilder, status_code: int, phrase: str, rfc: RFC = None) -> bytes:
+    if rfc is None:
+        return builder.message(status_code, phrase)
+    return builder.head(status_code, phrase) + builder.rfc_headers(rfc) + rfc.content.encode()
+
+def _rate(render, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        render()
+    return count / (time.perf_counter() - start)
+
+def main():
+    args = arg_parser.parse_args()
+    rfc = RFC.generate_random_rfc()
+    builder = ResponseBuilder("P2P-CI/1.0")
+    cases = [
+        ("200 uncached", lambda: uncached_response("P2P-CI/1.0", 200, "OK", rfc)),
+        ("200 cached", lambda: cached_response(builder, 200, "OK", rfc)),
+        ("404 uncached", lambda: uncached_response("P2P-CI/1.0", 404, "Not Found")),
+        ("404 cached", lambda: cached_response(builder, 404, "Not Found")),
+    ]
+    for name, render in cases:
+        print("{:<14} {:>12.0f} responses/s".format(name, _rate(render, args.responses)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import time
+import tracemalloc
+from rfc import RFC
+from rfc_store import RFCStore
+
+#compares the memory of the slotted RFC record against the old dict backed one, and how long it takes to find
+#rfcs in an RFCStore compared to scanning a list the way the upload server used to.
+#usage: python -m benchmarks.rfc_memory --rfcs 100000
+
+arg_parser = argparse.ArgumentParser(description="memory footprint of RFC records and lookup cost of the local store")
+arg_parser.add_argument("--rfcs", type=int, default=100000, help="number of RFC records to create")
+arg_parser.add_argument("--lookups", type=int, default=1000, help="number of lookups to time")
+
+#the RFC record as it was before it had __slots__
+class DictRFC:
+    def __init__(self, rfc_number, title, last_modified, content_length, content_type, content):
+        self.rfc_number = rfc_number
+        self.title = title
+        self.last_modified = last_modified
+        self.content_length = content_length
+        self.content_type = content_type
+        self.content = content
+
+#bytes allocated by build(), not counting the field values which were created beforehand
+def _allocated(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+def main():
+    args = arg_parser.parse_args()
+    fields = [("RFC {}".format(i), "Title {}".format(i), "Thu, 01 Jan 1970 00:00:00 GMT", 10, "text/plain", "content") for i in range(args.rfcs)]
+
+    dict_bytes = _allocated(lambda: [DictRFC(*f) for f in fields])
+    slot_bytes = _allocated(lambda: [RFC(*f) for f in fields])
+    print("{:<28} {:>10.1f} bytes per record".format("dict backed RFC", dict_bytes / args.rfcs))
+    print("{:<28} {:>10.1f} bytes per record".format("slotted RFC", slot_bytes / args.rfcs))
+
+    rfcs = [RFC(*f) for f in fields]
+    store_bytes = _allocated(lambda: RFCStore(rfcs))
+    print("{:<28} {:>10.1f} bytes per record".format("RFCStore index", store_bytes / args.rfcs))
+
+    store = RFCStore(rfcs)
+    wanted = [fields[(i * 7919) % args.rfcs][0] for i in range(args.lookups)]
+    start = time.perf_counter()
+    for rfc_number in wanted:
+        next((rfc for rfc in rfcs if rfc.rfc_number == rfc_number), None)
+    scan_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for rfc_number in wanted:
+        store.get(rfc_number)
+    store_time = time.perf_counter() - start
+    print("{:<28} {:>10.2f} us per lookup".format("list scan", scan_time / args.lookups * 1e6))
+    print("{:<28} {:>10.2f} us per lookup".format("RFCStore.get", store_time / args.lookups * 1e6))
+
+if __name__ == '__main__':
+    main()
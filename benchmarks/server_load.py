@@ -0,0 +1,106 @@
+import argparse
+import socket
+import threading
+import time
+import socket_helper
+from benchmarks import common
+
+P2P_VERSION = "P2P-CI/1.0"
+
+#load generator for the central index server. for each server mode it opens many idle peer connections,
+#then measures LOOKUP latency from a few active peers while the idle ones stay connected.
+#usage: python -m benchmarks.server_load --connections 10000 --modes threaded asyncio
+
+arg_parser = argparse.ArgumentParser(description="compare connection count, latency and memory of the server modes")
+arg_parser.add_argument("--modes", nargs="+", default=["threaded", "asyncio"], choices=["threaded", "asyncio"])
+arg_parser.add_argument("--connections", type=int, default=2000, help="number of idle peer connections to hold open")
+arg_parser.add_argument("--active", type=int, default=8, help="number of peers sending LOOKUP requests")
+arg_parser.add_argument("--requests", type=int, default=500, help="LOOKUP requests sent by each active peer")
+
+def _init_msg(upload_port: int) -> bytes:
+    return socket_helper.encode_message("INIT - {}\nHost: localhost\nPort: {}\n".format(P2P_VERSION, upload_port))
+
+#open idle peer connections. stops early if the client or server runs out of resources
+def open_idle_connections(port: int, count: int) -> list:
+    sockets = []
+    for i in range(count):
+        try:
+            s = socket.create_connection(("localhost", port), timeout=5)
+            s.sendall(_init_msg(10000 + i))
+        except OSError:
+            break
+        sockets.append(s)
+    return sockets
+
+#one active peer: register, add an rfc, then time LOOKUP round trips
+def run_active_peer(port: int, peer_id: int, num_requests: int, latencies: list, lock: threading.Lock):
+    s = socket.create_connection(("localhost", port))
+    upload_port = 60000 + peer_id
+    reader = socket_helper.MessageReader(s)
+    s.sendall(_init_msg(upload_port))
+    socket_helper.send_message(s, "ADD RFC {} {}\nHost: localhost\nPort: {}\nTitle: Load Test\n".format(peer_id, P2P_VERSION, upload_port))
+    reader.read_message()
+    lookup = socket_helper.encode_message("LOOKUP RFC {} {}\nHost: localhost\nPort: {}\nTitle: \n".format(peer_id, P2P_VERSION, upload_port))
+    own = []
+    for _ in range(num_requests):
+        start = time.perf_counter()
+        s.sendall(lookup)
+        reader.read_message()
+        own.append(time.perf_counter() - start)
+    socket_helper.send_message(s, "EXIT - {}\nHost: localhost\nPort: {}\n".format(P2P_VERSION, upload_port))
+    s.close()
+    with lock:
+        latencies.extend(own)
+
+def run_mode(mode: str, args) -> dict:
+    port = common.free_port()
+    #the idle connections never send a HEARTBEAT, leases would drop them part way through a long run
+    proc = common.start_server_process(mode, port, ["--lease", "0"])
+    try:
+        base_rss = common.process_rss_kb(proc.pid)
+        start = time.perf_counter()
+        idle = open_idle_connections(port, args.connections)
+        connect_time = time.perf_counter() - start
+        time.sleep(1) #let the server finish handling the INIT messages
+        idle_rss = common.process_rss_kb(proc.pid)
+        idle_threads = common.process_threads(proc.pid)
+
+        latencies = []
+        lock = threading.Lock()
+        workers = [threading.Thread(target=run_active_peer, args=(port, i, args.requests, latencies, lock)) for i in range(args.active)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        for s in idle:
+            s.close()
+    finally:
+        common.stop_process(proc)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "connections": len(idle),
+        "connect_s": connect_time,
+        "rss_base_mb": base_rss / 1024,
+        "rss_idle_mb": idle_rss / 1024,
+        "threads": idle_threads,
+        "lookups_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": common.percentile(latencies, 50) * 1000,
+        "p99_ms": common.percentile(latencies, 99) * 1000,
+    }
+
+def main():
+    args = arg_parser.parse_args()
+    fd_limit = common.raise_fd_limit()
+    print("open file limit: {}".format(fd_limit))
+    columns = ["mode", "connections", "connect_s", "rss_base_mb", "rss_idle_mb", "threads", "lookups_per_s", "p50_ms", "p99_ms"]
+    print(" ".join("{:>13}".format(c) for c in columns))
+    for mode in args.modes:
+        result = run_mode(mode, args)
+        print(" ".join("{:>13.2f}".format(result[c]) if isinstance(result[c], float) else "{:>13}".format(result[c]) for c in columns))
+
+if __name__ == '__main__':
+    main()
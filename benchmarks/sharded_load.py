@@ -0,0 +1,103 @@
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+import socket_helper
+from benchmarks import common
+
+P2P_VERSION = "P2P-CI/1.0"
+
+#load test of the sharded server. the index is filled with rfcs, then client processes (so the clients aren't held
+#back by one GIL) send LOOKUPs with an ADD every tenth request as fast as the server answers them, for the threaded
+#server and for the sharded server with more and more workers. throughput should grow close to linearly with the
+#workers, as long as the machine has a core for every worker and every client process.
+#usage: python -m benchmarks.sharded_load --workers 1 2 4 8 --clients 16
+
+arg_parser = argparse.ArgumentParser(description="throughput of the sharded server as workers are added")
+arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts of the sharded runs")
+arg_parser.add_argument("--clients", type=int, default=2 * (os.cpu_count() or 1), help="client processes, each with one connection")
+arg_parser.add_argument("--rfcs", type=int, default=20000, help="rfcs in the index")
+arg_parser.add_argument("--seconds", type=float, default=5.0, help="how long each run sends requests")
+
+def _connect(port: int, upload_port: int):
+    s = socket.create_connection(("localhost", port))
+    socket_helper.send_message(s, "INIT - {}\nHost: localhost\nPort: {}\n".format(P2P_VERSION, upload_port))
+    return (s, socket_helper.MessageReader(s))
+
+def fill_index(port: int, rfcs: int):
+    (s, reader) = _connect(port, 30000)
+    #sent in pipelined batches, a round trip for each would take longer than the runs
+    for start in range(0, rfcs, 500):
+        for i in range(start, min(start + 500, rfcs)):
+            socket_helper.send_message(s, "ADD RFC {} {}\nHost: localhost\nPort: 30000\nTitle: Load\n".format(i, P2P_VERSION))
+        for i in range(start, min(start + 500, rfcs)):
+            reader.read_message()
+    return s
+
+#one client process: requests back to back from start_at until the deadline. puts (requests, sorted latencies) on
+#results
+def run_client(port: int, client_id: int, rfcs: int, start_at: float, deadline: float, results):
+    upload_port = 40000 + client_id
+    (s, reader) = _connect(port, upload_port)
+    lookups = [socket_helper.encode_message("LOOKUP RFC {} {}\nHost: localhost\nPort: {}\nTitle: \n".format(i, P2P_VERSION, upload_port))
+               for i in range(client_id, rfcs, 97)]
+    latencies = []
+    count = 0
+    time.sleep(max(0.0, start_at - time.time()))
+    while time.time() < deadline:
+        if count % 10 == 9:
+            request = socket_helper.encode_message("ADD RFC {} {}\nHost: localhost\nPort: {}\nTitle: Client\n".format(rfcs + count, P2P_VERSION, upload_port))
+        else:
+            request = lookups[count % len(lookups)]
+        start = time.perf_counter()
+        s.sendall(request)
+        reader.read_message()
+        latencies.append(time.perf_counter() - start)
+        count += 1
+    s.close()
+    latencies.sort()
+    results.put((count, latencies))
+
+def run(mode: str, workers: int, args) -> dict:
+    port = common.free_port()
+    proc = common.start_server_process(mode, port, ["--workers", str(workers)] if mode == "sharded" else [])
+    try:
+        loader = fill_index(port, args.rfcs)
+        results = multiprocessing.Queue()
+        #clients start together once every process is up
+        start_at = time.time() + 1.0
+        clients = [multiprocessing.Process(target=run_client, args=(port, i, args.rfcs, start_at, start_at + args.seconds, results)) for i in range(args.clients)]
+        for client in clients:
+            client.start()
+        gathered = [results.get() for _ in clients]
+        for client in clients:
+            client.join()
+        loader.close()
+    finally:
+        common.stop_process(proc)
+    requests = sum(count for (count, _) in gathered)
+    latencies = sorted(latency for (_, own) in gathered for latency in own)
+    return {
+        "mode": mode,
+        "workers": workers,
+        "requests_per_s": requests / args.seconds,
+        "p50_ms": common.percentile(latencies, 50) * 1000,
+        "p99_ms": common.percentile(latencies, 99) * 1000,
+    }
+
+def main():
+    args = arg_parser.parse_args()
+    print("cores: {}, client processes: {}".format(os.cpu_count(), args.clients))
+    columns = ["mode", "workers", "requests_per_s", "speedup", "p50_ms", "p99_ms"]
+    print(" ".join("{:>15}".format(c) for c in columns))
+    base = None
+    for (mode, workers) in [("threaded", 1)] + [("sharded", workers) for workers in args.workers]:
+        result = run(mode, workers, args)
+        if base is None:
+            base = result["requests_per_s"]
+        result["speedup"] = result["requests_per_s"] / base if base else 0.0
+        print(" ".join("{:>15.2f}".format(result[c]) if isinstance(result[c], float) else "{:>15}".format(result[c]) for c in columns))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import contextlib
+import io
+import threading
+import time
+from jsobject import JSObject
+from peer import Peer
+from subscriptions import Subscriptions
+from benchmarks import common
+
+#how the cost of finding the subscribers of a change grows with the number of subscriptions (it shouldn't), and
+#how long a subscribed peer waits to hear about an ADD compared to polling LOOKUP every poll interval.
+#usage: python -m benchmarks.subscriptions --subscribers 100000
+
+arg_parser = argparse.ArgumentParser(description="fan-out cost and notification latency of subscriptions")
+arg_parser.add_argument("--subscribers", type=int, default=100000, help="most subscriptions in the fan-out run")
+arg_parser.add_argument("--changes", type=int, default=20000, help="changes matched in each fan-out run")
+arg_parser.add_argument("--adds", type=int, default=50, help="ADDs timed in the latency run")
+arg_parser.add_argument("--poll-interval", type=float, default=0.1, help="seconds between LOOKUPs of the polling peer")
+
+class _Subscriber:
+    def push(self, entry, added):
+        pass
+
+#microseconds to find the subscribers of a change with the given number of rfc number and title prefix subscriptions
+def fan_out_us(subscribers: int, changes: int) -> float:
+    subscriptions = Subscriptions()
+    for i in range(subscribers):
+        if i % 2:
+            subscriptions.subscribe(_Subscriber(), rfc_number="RFC {}".format(i))
+        else:
+            subscriptions.subscribe(_Subscriber(), title_prefix="Title {}".format(i))
+    entries = [JSObject(rfc_number="RFC {}".format(i), rfc_title="Title {} of an RFC".format(i)) for i in range(changes)]
+    start = time.perf_counter()
+    for entry in entries:
+        subscriptions.matching(entry)
+    return (time.perf_counter() - start) / changes * 1e6
+
+def latency_ms(port: int, args) -> tuple:
+    adder = Peer([], server_address=("localhost", port))
+    subscriber = Peer([], server_address=("localhost", port))
+    poller = Peer([], server_address=("localhost", port))
+    heard = {}
+    done = threading.Event()
+    subscriber.on_notify = lambda entry, added: heard.setdefault(entry.rfc_number, time.perf_counter())
+    for i in range(args.adds):
+        subscriber.subscribe_cmd("RFC {}".format(i))
+
+    def poll():
+        for i in range(args.adds):
+            while "200" not in poller.lookup_cmd("RFC {}".format(i), "").split("\n")[0]:
+                time.sleep(args.poll_interval)
+            heard.setdefault(("poll", i), time.perf_counter())
+        done.set()
+
+    added = {}
+    poll_thread = threading.Thread(target=poll)
+    poll_thread.start()
+    for i in range(args.adds):
+        added[i] = time.perf_counter()
+        adder.add_cmd("RFC {}".format(i), "Latency")
+        time.sleep(args.poll_interval * 1.37) #not in step with the poller
+    done.wait()
+    time.sleep(0.5)
+    pushed = sorted((heard["RFC {}".format(i)] - added[i]) * 1000 for i in range(args.adds) if "RFC {}".format(i) in heard)
+    polled = sorted((heard[("poll", i)] - added[i]) * 1000 for i in range(args.adds))
+    for peer in (adder, subscriber, poller):
+        peer.exit_cmd()
+    return (pushed, polled)
+
+def main():
+    args = arg_parser.parse_args()
+    print("{:>12} {:>16}".format("subscribers", "us per change"))
+    count = 1000
+    while count <= args.subscribers:
+        print("{:>12} {:>16.2f}".format(count, fan_out_us(count, args.changes)))
+        count *= 10
+
+    port = common.free_port()
+    proc = common.start_server_process("threaded", port)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            (pushed, polled) = latency_ms(port, args)
+        print("{:<10} {:>8} {:>10} {:>10}".format("client", "heard", "p50_ms", "p99_ms"))
+        for name, values in [("subscribe", pushed), ("poll", polled)]:
+            print("{:<10} {:>8} {:>10.2f} {:>10.2f}".format(name, len(values), common.percentile(values, 50), common.percentile(values, 99)))
+    finally:
+        common.stop_process(proc)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import socket
+import threading
+import time
+import socket_helper
+from peer import Peer
+from rfc import RFC
+from benchmarks import common
+
+#floods one peer's upload server with concurrent downloaders, each downloading an rfc over a new connection again
+#and again, and reports the downloads served per second, the downloads turned away with 503, the download latency
+#and the uploading peer's threads and memory as the number of downloaders grows, for a few upload pool sizes. the
+#uploader runs in its own process so its threads and memory can be measured.
+#usage: python -m benchmarks.upload_load --downloaders 10 100 1000
+
+arg_parser = argparse.ArgumentParser(description="uploads per second and memory of a flooded upload server")
+arg_parser.add_argument("--downloaders", type=int, nargs="+", default=[1, 10, 100, 500], help="numbers of concurrent downloaders")
+arg_parser.add_argument("--max-uploads", type=int, nargs="+", default=[8, Peer.MAX_UPLOADS, 128], help="upload pool sizes to compare")
+arg_parser.add_argument("--size", type=int, default=64 * 1024, help="bytes in the rfc being downloaded")
+arg_parser.add_argument("--seconds", type=float, default=3.0, help="how long each run downloads")
+
+#the uploading peer's process. puts its upload port on ready and serves until stop is set
+def run_uploader(server_port: int, max_uploads: int, size: int, ready, stop):
+    with contextlib.redirect_stdout(io.StringIO()):
+        rfc = RFC("RFC 1", "Load", "Mon, 01 Jan 2024 00:00:00 GMT", size, "text/plain", "x" * size)
+        uploader = Peer([rfc], server_address=("localhost", server_port), max_uploads=max_uploads)
+        uploader.start_upload_server()
+        ready.put(uploader.upload_socket_port)
+        stop.wait()
+        uploader.stop_upload_server()
+
+#download over a new connection each time until the deadline. adds to counts and latencies
+def download(upload_port: int, deadline: float, counts: dict, latencies: list, lock: threading.Lock):
+    request = socket_helper.encode_message("GET RFC 1 P2P-CI/1.0\nHost: localhost\nOS: bench\n")
+    own = {"200": 0, "503": 0, "error": 0}
+    own_latencies = []
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            with socket.create_connection(("localhost", upload_port), timeout=30) as s:
+                s.sendall(request)
+                response = socket_helper.MessageReader(s).read_message()
+            status = response.split(b" ", 2)[1].decode() if response else "error"
+        except OSError:
+            status = "error"
+        own[status] = own.get(status, 0) + 1
+        if status == "200":
+            own_latencies.append(time.perf_counter() - start)
+        else:
+            time.sleep(0.01) #a real downloader would go to another holder
+    with lock:
+        for status, count in own.items():
+            counts[status] = counts.get(status, 0) + count
+        latencies.extend(own_latencies)
+
+def run(server_port: int, max_uploads: int, downloaders: int, args) -> dict:
+    ready = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    uploader = multiprocessing.Process(target=run_uploader, args=(server_port, max_uploads, args.size, ready, stop))
+    uploader.start()
+    try:
+        upload_port = ready.get()
+        counts = {}
+        latencies = []
+        lock = threading.Lock()
+        #threads and memory are sampled halfway through, while every downloader is busy
+        deadline = time.time() + args.seconds
+        threads = [threading.Thread(target=download, args=(upload_port, deadline, counts, latencies, lock)) for _ in range(downloaders)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds / 2)
+        uploader_threads = common.process_threads(uploader.pid)
+        uploader_rss = common.process_rss_kb(uploader.pid)
+        for thread in threads:
+            thread.join()
+    finally:
+        stop.set()
+        uploader.join(5)
+        if uploader.is_alive():
+            uploader.kill()
+    latencies.sort()
+    return {
+        "max_uploads": max_uploads,
+        "downloaders": downloaders,
+        "uploads_per_s": counts.get("200", 0) / args.seconds,
+        "busy_503": counts.get("503", 0),
+        "errors": counts.get("error", 0),
+        "p50_ms": common.percentile(latencies, 50) * 1000,
+        "p99_ms": common.percentile(latencies, 99) * 1000,
+        "threads": uploader_threads,
+        "rss_mb": uploader_rss / 1024,
+    }
+
+def main():
+    args = arg_parser.parse_args()
+    common.raise_fd_limit()
+    port = common.free_port()
+    proc = common.start_server_process("threaded", port)
+    columns = ["max_uploads", "downloaders", "uploads_per_s", "busy_503", "errors", "p50_ms", "p99_ms", "threads", "rss_mb"]
+    print(" ".join("{:>13}".format(c) for c in columns))
+    try:
+        for max_uploads in args.max_uploads:
+            for downloaders in args.downloaders:
+                result = run(port, max_uploads, downloaders, args)
+                print(" ".join("{:>13.2f}".format(result[c]) if isinstance(result[c], float) else "{:>13}".format(result[c]) for c in columns))
+    finally:
+        common.stop_process(proc)
+
+if __name__ == '__main__':
+    main()
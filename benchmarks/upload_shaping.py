@@ -0,0 +1,112 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import socket
+import threading
+import time
+import socket_helper
+from peer import Peer
+from rfc import RFC
+from benchmarks import common
+
+#how an upload server's bandwidth is split between concurrent downloaders. one greedy downloader opens several
+#connections and the others one each, all downloading a big rfc over and over. each downloader connects from its
+#own loopback address (127.0.0.2, 127.0.0.3, ...) so the uploader sees them as different peers. reports each
+#downloader's throughput, the total and jain's fairness index (1.0 is a perfectly even split) without shaping, with
+#a global rate and with a global and a per peer rate.
+#usage: python -m benchmarks.upload_shaping --downloaders 4 --greedy-connections 4 --rate 8192
+
+arg_parser = argparse.ArgumentParser(description="fairness of the upload server's bandwidth between downloaders")
+arg_parser.add_argument("--downloaders", type=int, default=4, help="number of downloading peers")
+arg_parser.add_argument("--greedy-connections", type=int, default=4, help="connections opened by the greedy downloader")
+arg_parser.add_argument("--rate", type=float, default=8192, help="global upload rate in kilobytes per second")
+arg_parser.add_argument("--peer-rate", type=float, default=None, help="per peer upload rate in kilobytes per second, the global rate over the downloaders by default")
+arg_parser.add_argument("--size", type=int, default=256 * 1024, help="bytes in the rfc being downloaded")
+arg_parser.add_argument("--seconds", type=float, default=4.0, help="how long each run downloads")
+
+def run_uploader(server_port: int, rate: float, peer_rate: float, size: int, ready, stop):
+    with contextlib.redirect_stdout(io.StringIO()):
+        rfc = RFC("RFC 1", "Shaping", "Mon, 01 Jan 2024 00:00:00 GMT", size, "text/plain", "x" * size)
+        uploader = Peer([rfc], server_address=("localhost", server_port), upload_rate=rate, peer_upload_rate=peer_rate)
+        uploader.start_upload_server()
+        ready.put(uploader.upload_socket_port)
+        stop.wait()
+        uploader.stop_upload_server()
+
+#the loopback address downloader number i connects from, falling back to the usual one where only 127.0.0.1 works
+def source_address(i: int) -> str:
+    address = "127.0.0.{}".format(2 + i)
+    try:
+        with socket.socket() as s:
+            s.bind((address, 0))
+        return address
+    except OSError:
+        return "127.0.0.1"
+
+#download the rfc over a kept alive connection until the deadline, connecting again if the uploader closes it. adds
+#the bytes received to received[i]
+def download(upload_port: int, source: str, i: int, deadline: float, received: list, lock: threading.Lock):
+    request = socket_helper.encode_message("GET RFC 1 P2P-CI/1.0\nHost: localhost\nOS: bench\nConnection: keep-alive\n")
+    total = 0
+    while time.time() < deadline:
+        with socket.create_connection(("127.0.0.1", upload_port), timeout=30, source_address=(source, 0)) as s:
+            reader = socket_helper.MessageReader(s)
+            while time.time() < deadline:
+                s.sendall(request)
+                response = reader.read_message()
+                if response is None:
+                    break
+                total += len(response)
+    with lock:
+        received[i] += total
+
+def run(server_port: int, rate: float, peer_rate: float, args) -> list:
+    ready = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    uploader = multiprocessing.Process(target=run_uploader, args=(server_port, rate, peer_rate, args.size, ready, stop))
+    uploader.start()
+    try:
+        upload_port = ready.get()
+        received = [0] * args.downloaders
+        lock = threading.Lock()
+        deadline = time.time() + args.seconds
+        threads = []
+        for i in range(args.downloaders):
+            source = source_address(i)
+            for _ in range(args.greedy_connections if i == 0 else 1):
+                threads.append(threading.Thread(target=download, args=(upload_port, source, i, deadline, received, lock)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        stop.set()
+        uploader.join(5)
+        if uploader.is_alive():
+            uploader.kill()
+    return [total / args.seconds / 1024 for total in received]
+
+def jain_index(values: list) -> float:
+    if not any(values):
+        return 0.0
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values))
+
+def main():
+    args = arg_parser.parse_args()
+    rate = args.rate * 1024
+    peer_rate = (args.peer_rate if args.peer_rate else args.rate / args.downloaders) * 1024
+    port = common.free_port()
+    proc = common.start_server_process("threaded", port)
+    runs = [("unshaped", None, None), ("global rate", rate, None), ("global + per peer", rate, peer_rate)]
+    print("downloader 0 is greedy with {} connections, rates in KB/s".format(args.greedy_connections))
+    print("{:<18} {}".format("run", " ".join("{:>10}".format("peer {}".format(i)) for i in range(args.downloaders))) + " {:>10} {:>8}".format("total", "jain"))
+    try:
+        for (name, run_rate, run_peer_rate) in runs:
+            rates = run(port, run_rate, run_peer_rate, args)
+            print("{:<18} {}".format(name, " ".join("{:>10.0f}".format(r) for r in rates)) + " {:>10.0f} {:>8.3f}".format(sum(rates), jain_index(rates)))
+    finally:
+        common.stop_process(proc)
+
+if __name__ == '__main__':
+    main()
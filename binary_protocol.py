@@ -0,0 +1,327 @@
+import re
+from parsing import RFCEntry
+
+#P2P-CI/2.0 is a compact binary encoding of the messages between a peer and the server. a peer asks for it with
+#an "Upgrade: P2P-CI/2.0" header on its INIT and the server answers "101 Switching Protocols" if it speaks it.
+#from then on every message on that connection is a frame: a varint with the length of the payload followed by
+#the payload. numbers are varints, strings are a varint length followed by utf-8 bytes, and "RFC <n>" numbers
+#are sent as just n. instead of repeating a host and port on every entry, each side of the connection numbers
+#the peers it has seen in order: a response introduces the peers it mentions for the first time and its entries
+#refer to peers by that number from then on
+VERSION = "P2P-CI/2.0"
+
+#request opcodes, the first byte of a request payload
+ADD = 1
+LOOKUP = 2
+LOOKUP_BATCH = 3
+LIST = 4
+EXIT = 5
+SYNC = 6
+SUBSCRIBE = 7
+UNSUBSCRIBE = 8
+HEARTBEAT = 9
+STATS = 10
+
+#what a SUBSCRIBE or UNSUBSCRIBE is keyed by, its first field
+BY_NUMBER = 0
+BY_TITLE_PREFIX = 1
+
+#the fields of each request after the opcode. n is an rfc number, s a string, v a varint, N a list of rfc numbers
+#and d a content digest: a varint length and the raw sha-256, with a length of 0 for no digest. a trailing d may be
+#left out altogether by peers that don't know about digests
+REQUEST_FIELDS = {
+    ADD: "nsd",
+    LOOKUP: "ns",
+    LOOKUP_BATCH: "N",
+    LIST: "svs",
+    EXIT: "",
+    SYNC: "vv",
+    SUBSCRIBE: "vs",
+    UNSUBSCRIBE: "vs",
+    HEARTBEAT: "",
+    STATS: ""
+}
+
+#the name each opcode has in the text protocol
+COMMANDS = {ADD: "ADD", LOOKUP: "LOOKUP", LOOKUP_BATCH: "LOOKUP BATCH", LIST: "LIST", EXIT: "EXIT", SYNC: "SYNC",
+            SUBSCRIBE: "SUBSCRIBE", UNSUBSCRIBE: "UNSUBSCRIBE", HEARTBEAT: "HEARTBEAT", STATS: "STATS"}
+
+#flags of a response frame. MORE says more frames of the same response follow (a LIST is sent in several frames),
+#REMOVED that the frame's entries were removed from the index rather than added (in a SYNC), VERSION that the
+#index epoch and version follow the flags as two varints, FULL that a SYNC holds the whole index, NOTIFY that
+#the frame is not a response but a change pushed for a subscription and LEASE that the server's lease in
+#milliseconds follows (after the epoch and version if there are any). DIGESTS says every entry is followed by the
+#digest of its content, encoded like the d field of a request. it is only set for peers that asked for digests.
+#TEXT says a string follows (after the lease if there is one), the body of a response that isn't entries, like
+#the metrics of a STATS
+MORE = 1
+REMOVED = 2
+VERSION_FLAG = 4
+FULL = 8
+NOTIFY = 16
+LEASE = 32
+DIGESTS = 64
+TEXT = 128
+
+#phrases of the status codes a 2.0 server answers with. they are not sent on the wire
+PHRASES = {200: "OK", 400: "Bad Request", 404: "Not Found"}
+
+RFC_NUMBER = re.compile(r"RFC [1-9][0-9]*\Z")
+
+def encode_varint(value: int, out: bytearray):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+#decode the varint at data[pos]. returns (value, position after it)
+def decode_varint(data, pos: int):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return (value, pos)
+        shift += 7
+
+def encode_str(value: str, out: bytearray):
+    data = value.encode()
+    encode_varint(len(data), out)
+    out += data
+
+def decode_str(data, pos: int):
+    (length, pos) = decode_varint(data, pos)
+    return (str(data[pos:pos + length], "utf-8"), pos + length)
+
+#"RFC <n>" is sent as the varint 2n+1, anything else as 2 * its length followed by its utf-8 bytes
+def encode_rfc_number(rfc_number: str, out: bytearray):
+    if RFC_NUMBER.match(rfc_number):
+        encode_varint(int(rfc_number[4:]) * 2 + 1, out)
+    else:
+        data = rfc_number.encode()
+        encode_varint(len(data) * 2, out)
+        out += data
+
+def decode_rfc_number(data, pos: int):
+    (value, pos) = decode_varint(data, pos)
+    if value & 1:
+        return ("RFC {}".format(value >> 1), pos)
+    length = value >> 1
+    return (str(data[pos:pos + length], "utf-8"), pos + length)
+
+#a hex digest, or None for no digest
+def encode_digest(digest: str, out: bytearray):
+    data = bytes.fromhex(digest) if digest else b""
+    encode_varint(len(data), out)
+    out += data
+
+def decode_digest(data, pos: int):
+    (length, pos) = decode_varint(data, pos)
+    return (bytes(data[pos:pos + length]).hex() if length else None, pos + length)
+
+#prefix a payload with its length
+def encode_frame(payload) -> bytes:
+    out = bytearray()
+    encode_varint(len(payload), out)
+    out += payload
+    return bytes(out)
+
+#frame a request. the fields are given in the order REQUEST_FIELDS lists them
+def encode_request(opcode: int, *fields) -> bytes:
+    out = bytearray((opcode,))
+    for kind, field in zip(REQUEST_FIELDS[opcode], fields):
+        if kind == "n":
+            encode_rfc_number(field, out)
+        elif kind == "s":
+            encode_str(field, out)
+        elif kind == "v":
+            encode_varint(field, out)
+        elif kind == "d":
+            encode_digest(field, out)
+        else:
+            encode_varint(len(field), out)
+            for rfc_number in field:
+                encode_rfc_number(rfc_number, out)
+    return encode_frame(out)
+
+#decode a request payload. returns (opcode, fields). raises ValueError if it is malformed
+def decode_request(payload):
+    try:
+        opcode = payload[0]
+        pos = 1
+        fields = []
+        for kind in REQUEST_FIELDS[opcode]:
+            if kind == "n":
+                (field, pos) = decode_rfc_number(payload, pos)
+            elif kind == "s":
+                (field, pos) = decode_str(payload, pos)
+            elif kind == "v":
+                (field, pos) = decode_varint(payload, pos)
+            elif kind == "d":
+                (field, pos) = decode_digest(payload, pos) if pos < len(payload) else (None, pos)
+            else:
+                (count, pos) = decode_varint(payload, pos)
+                field = []
+                for _ in range(count):
+                    (rfc_number, pos) = decode_rfc_number(payload, pos)
+                    field.append(rfc_number)
+            fields.append(field)
+        #a string or digest cut short by the end of the payload is sliced short without an error, but leaves pos
+        #past the end
+        if pos > len(payload):
+            raise IndexError("field runs past the end of the payload")
+        return (opcode, fields)
+    except (IndexError, KeyError, UnicodeDecodeError) as ex:
+        raise ValueError("malformed P2P-CI/2.0 request") from ex
+
+#encodes the responses sent on one connection. it remembers which peers it has already introduced, so each
+#peer's host and port cross the connection once however many entries mention it. digests sends the digest of
+#every entry's content along with it
+class Encoder:
+    def __init__(self, digests: bool = False):
+        #(hostname, port) -> the number the peer was introduced with
+        self.peer_ids = {}
+        self.digests = digests
+
+    #one response frame holding entries of the server's index (objects with rfc_number, rfc_title, peer_hostname
+    #and peer_port). more says whether more frames of the same response follow. version is an (epoch, version)
+    #pair to send with the frame, lease the seconds a peer's lease lasts and text a string to send with it
+    def frame(self, status_code: int, entries = (), more: bool = False, flags: int = 0, version: tuple = None, lease: float = None,
+              text: str = None) -> bytes:
+        new_peers = bytearray()
+        new_peer_count = 0
+        body = bytearray()
+        entry_count = 0
+        for entry in entries:
+            peer = (entry.peer_hostname, entry.peer_port)
+            peer_id = self.peer_ids.get(peer)
+            if peer_id is None:
+                peer_id = self.peer_ids[peer] = len(self.peer_ids)
+                encode_str(entry.peer_hostname, new_peers)
+                encode_varint(int(entry.peer_port), new_peers)
+                new_peer_count += 1
+            encode_rfc_number(entry.rfc_number, body)
+            encode_str(entry.rfc_title, body)
+            encode_varint(peer_id, body)
+            if self.digests:
+                encode_digest(entry.digest, body)
+            entry_count += 1
+
+        out = bytearray()
+        encode_varint(status_code, out)
+        if more:
+            flags |= MORE
+        if version is not None:
+            flags |= VERSION_FLAG
+        if lease is not None:
+            flags |= LEASE
+        if self.digests:
+            flags |= DIGESTS
+        if text is not None:
+            flags |= TEXT
+        out.append(flags)
+        if version is not None:
+            encode_varint(version[0], out)
+            encode_varint(version[1], out)
+        if lease is not None:
+            encode_varint(int(lease * 1000), out)
+        if text is not None:
+            encode_str(text, out)
+        encode_varint(new_peer_count, out)
+        out += new_peers
+        encode_varint(entry_count, out)
+        out += body
+        return encode_frame(out)
+
+    #the frames of a response holding any number of entries, each frame about chunk_size bytes of entries. more
+    #is set on the last frame too if the response goes on after these entries
+    def frames(self, status_code: int, entries, chunk_size: int, more: bool = False, flags: int = 0):
+        batch = []
+        size = 0
+        for entry in entries:
+            batch.append(entry)
+            #a rough size is enough to bound the frames
+            size += len(entry.rfc_number) + len(entry.rfc_title) + (37 if self.digests else 4)
+            if size >= chunk_size:
+                yield self.frame(status_code, batch, True, flags)
+                batch = []
+                size = 0
+        yield self.frame(status_code, batch, more, flags)
+
+    #the frames of a SYNC response. changes are (entry, added) pairs. the first frame carries the epoch and version
+    #the peer is brought up to, then come the added entries and last the removed ones. the order doesn't matter
+    #because changes holds at most one change per entry
+    def sync_frames(self, epoch: int, version: int, full: bool, changes, chunk_size: int):
+        yield self.frame(200, more=True, flags=FULL if full else 0, version=(epoch, version))
+        removed = []
+        def added():
+            for (entry, was_added) in changes:
+                if was_added:
+                    yield entry
+                else:
+                    removed.append(entry)
+        yield from self.frames(200, added(), chunk_size, more=True)
+        yield from self.frames(200, removed, chunk_size, flags=REMOVED)
+
+#decodes the responses received on one connection, keeping the peers the other side has introduced
+class Decoder:
+    def __init__(self):
+        #peer number -> (hostname, port)
+        self.peers = []
+        #the index epoch and version sent with the last frame that had them
+        self.epoch = None
+        self.version = None
+        #the lease in seconds sent with the last frame that had one
+        self.lease = None
+        #the string sent with the last frame that had one
+        self.text = None
+
+    #decode a response payload. returns (status_code, flags, entries) where entries are parsing.RFCEntry objects
+    def response(self, payload):
+        (status_code, pos) = decode_varint(payload, 0)
+        flags = payload[pos]
+        pos += 1
+        if flags & VERSION_FLAG:
+            (self.epoch, pos) = decode_varint(payload, pos)
+            (self.version, pos) = decode_varint(payload, pos)
+        if flags & LEASE:
+            (lease_ms, pos) = decode_varint(payload, pos)
+            self.lease = lease_ms / 1000
+        if flags & TEXT:
+            (self.text, pos) = decode_str(payload, pos)
+        (new_peer_count, pos) = decode_varint(payload, pos)
+        for _ in range(new_peer_count):
+            (hostname, pos) = decode_str(payload, pos)
+            (port, pos) = decode_varint(payload, pos)
+            self.peers.append((hostname, str(port)))
+        (entry_count, pos) = decode_varint(payload, pos)
+        entries = []
+        peers = self.peers
+        digests = flags & DIGESTS
+        digest = None
+        #this loop runs for every entry of a LIST, so one byte varints (the usual title lengths and peer numbers)
+        #are decoded inline instead of with a call each
+        for _ in range(entry_count):
+            (rfc_number, pos) = decode_rfc_number(payload, pos)
+            length = payload[pos]
+            if length < 0x80:
+                pos += 1
+            else:
+                (length, pos) = decode_varint(payload, pos)
+            rfc_title = payload[pos:pos + length].decode()
+            pos += length
+            peer_id = payload[pos]
+            if peer_id < 0x80:
+                pos += 1
+            else:
+                (peer_id, pos) = decode_varint(payload, pos)
+            (hostname, port) = peers[peer_id]
+            if digests:
+                (digest, pos) = decode_digest(payload, pos)
+            entries.append(RFCEntry(rfc_number, rfc_title, hostname, port, digest))
+        #like a payload that ends too early anywhere else
+        if pos > len(payload):
+            raise IndexError("field runs past the end of the payload")
+        return (status_code, flags, entries)
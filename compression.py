@@ -0,0 +1,136 @@
+import collections
+import hashlib
+import lzma
+import threading
+import zlib
+import socket_helper
+
+#content encodings of GET responses. a downloader lists the ones it can decode in an Accept-Encoding header, and
+#an upload server that compresses answers with a body in one of them and a Content-Encoding header naming it.
+#deflate is zlib's format, quick to compress. xz is lzma's, smaller but many times slower to compress
+ENCODINGS = ("deflate", "xz")
+#what every downloader sends, all the encodings it can decode
+ACCEPT_ENCODING = ", ".join(ENCODINGS)
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "deflate":
+        return zlib.compress(data)
+    return lzma.compress(data, lzma.FORMAT_XZ)
+
+def _decompressor(encoding: str):
+    if encoding == "deflate":
+        return zlib.decompressobj()
+    return lzma.LZMADecompressor(lzma.FORMAT_XZ)
+
+#the encodings listed in an Accept-Encoding header, ignoring weights
+def parse_accept_encoding(value: str) -> list:
+    if not value:
+        return []
+    return [token.split(";")[0].strip().lower() for token in value.split(",")]
+
+#decodes one response body as it arrives. it is handed to MessageReader.read_message as start(), which picks the
+#decoding from the response's Content-Encoding header. the body is then fed in a piece at a time as it is
+#received, each piece is decompressed straight away and the decoded content is hashed, so a downloaded rfc is
+#never gone over a second time to be checked. a body that decodes to more than max_size bytes fails as soon as it
+#gets there, so a small body from a malicious peer can't expand to fill memory. it is the same limit a body sent as
+#it is has
+class BodyDecoder:
+    def __init__(self, max_size: int = socket_helper.MAX_BODY):
+        self.hasher = hashlib.sha256()
+        self.decompressor = None
+        #how many more decoded bytes the body may have
+        self.remaining = max_size
+        #the decoded pieces, only kept when the body is encoded
+        self.pieces = []
+        #set if the body is in an encoding this peer can't decode or doesn't decode cleanly
+        self.failed = False
+
+    #called with the header block of the response. returns the function the body is fed to
+    def start(self, head: bytes):
+        encoding = socket_helper.header_value(head, b"Content-Encoding")
+        if encoding is not None:
+            encoding = encoding.decode().strip().lower()
+            if encoding in ENCODINGS:
+                self.decompressor = _decompressor(encoding)
+            elif encoding != "identity":
+                self.failed = True
+        return self.feed
+
+    def feed(self, data):
+        if self.failed:
+            return
+        if self.decompressor is None:
+            self.hasher.update(data)
+            return
+        try:
+            #one byte past the limit is enough to tell it was passed. decoding stops short of max_length only once
+            #the input is used up, so nothing is left behind in the decompressor when the limit isn't passed
+            decoded = self.decompressor.decompress(data, self.remaining + 1)
+        except (zlib.error, lzma.LZMAError, EOFError): #EOFError is lzma's for data after the end of the stream
+            self.failed = True
+            return
+        if len(decoded) > self.remaining:
+            self.failed = True
+            self.pieces = []
+            return
+        self.remaining -= len(decoded)
+        self.hasher.update(decoded)
+        self.pieces.append(decoded)
+
+    #the sha-256 of the decoded content in hex
+    def digest(self) -> str:
+        return self.hasher.hexdigest()
+
+    #the message as if it had been sent without an encoding: the decoded body, with a Content-Length to match and
+    #no Content-Encoding. message is the whole message as received. returns None if the body could not be decoded
+    def decoded_message(self, message: bytes):
+        if self.failed:
+            return None
+        if self.decompressor is None:
+            return message
+        #cut short, or (with deflate, which keeps it aside where xz raises EOFError) followed by more data
+        if not self.decompressor.eof or self.decompressor.unused_data:
+            return None
+        body = b"".join(self.pieces)
+        head = message[:message.find(socket_helper.HEADER_END)]
+        lines = [line for line in head.split(b"\n") if not line.lower().startswith((b"content-encoding:", b"content-length:"))]
+        return b"\n".join(lines) + "\nContent-Length: {}\n\n".format(len(body)).encode() + body
+
+#compressed copies of the rfcs an upload server sends, so an rfc that is downloaded over and over is compressed
+#once. copies are keyed by the digest of the content and the encoding and the least recently used ones are dropped
+#once they add up to more than max_bytes. contents that don't shrink by at least a tenth are remembered as not
+#worth compressing (already compressed formats like images never do), so they aren't tried again either
+class CompressionCache:
+    #contents smaller than this are always sent as they are, the encoding would save next to nothing
+    MIN_SIZE = 1024
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        #(digest, encoding) -> compressed bytes, or None for a content not worth compressing
+        self.entries = collections.OrderedDict()
+        self.size = 0
+
+    #the compressed copy of an rfc's content, or None if it is sent as it is
+    def get(self, rfc, encoding: str):
+        if rfc.content_size() < self.MIN_SIZE:
+            return None
+        key = (rfc.content_digest(), encoding)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        #compressed outside the lock so other downloads aren't held up. two uploads of the same new rfc may both
+        #compress it, which does no harm
+        content = rfc.read_content()
+        compressed = compress(content, encoding)
+        if len(compressed) > len(content) * 0.9:
+            compressed = None
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = compressed
+                self.size += len(compressed) if compressed is not None else 0
+                while self.size > self.max_bytes and len(self.entries) > 1:
+                    (_, dropped) = self.entries.popitem(last=False)
+                    self.size -= len(dropped) if dropped is not None else 0
+        return compressed
@@ -0,0 +1,85 @@
+import socket
+import threading
+import time
+import socket_helper
+
+#a connection to a peer's upload server along with the reader that holds any bytes received past the last message
+class Connection:
+    def __init__(self, host: str, port: int, timeout: float = None):
+        self.address = (host, port)
+        self.sock = socket.create_connection(self.address, timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = socket_helper.MessageReader(self.sock)
+        self.last_used = time.monotonic()
+        #a connection that came out of the pool may have been closed by the other side while it sat idle
+        self.reused = False
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+#keeps idle connections to upload servers, keyed by (host, port), so that downloads from the same peer don't pay
+#for a new tcp connection every time. connections idle for longer than idle_timeout are closed the next time the
+#pool is used, and at most max_idle_per_host idle connections are kept for each peer
+class ConnectionPool:
+    def __init__(self, max_idle_per_host: int = 4, idle_timeout: float = 30.0, connect_timeout: float = 10.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.lock = threading.Lock()
+        #(host, port) -> idle connections, most recently used last
+        self.idle = {}
+        #expired connections are looked for at most once a second
+        self.next_eviction = 0.0
+
+    #get a connection to the upload server at host:port, reusing an idle one if there is one
+    def acquire(self, host: str, port: int) -> Connection:
+        address = (host, int(port))
+        with self.lock:
+            self._evict_expired(time.monotonic())
+            connections = self.idle.get(address)
+            if connections:
+                connection = connections.pop()
+                if not connections:
+                    del self.idle[address]
+                connection.reused = True
+                return connection
+        return Connection(address[0], address[1], self.connect_timeout)
+
+    #give a connection back once its response has been read completely. connections that can't be reused are closed
+    def release(self, connection: Connection, reusable: bool = True):
+        if not reusable or self.max_idle_per_host <= 0:
+            connection.close()
+            return
+        connection.last_used = time.monotonic()
+        with self.lock:
+            connections = self.idle.setdefault(connection.address, [])
+            if len(connections) >= self.max_idle_per_host:
+                connection.close()
+                return
+            connections.append(connection)
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+    #close connections that have been idle for too long. the oldest connections are at the front of each list
+    def _evict_expired(self, now: float):
+        if now < self.next_eviction:
+            return
+        self.next_eviction = now + min(1.0, self.idle_timeout)
+        for address in list(self.idle):
+            connections = self.idle[address]
+            expired = 0
+            while expired < len(connections) and now - connections[expired].last_used > self.idle_timeout:
+                connections[expired].close()
+                expired += 1
+            if expired:
+                del connections[:expired]
+            if not connections:
+                del self.idle[address]
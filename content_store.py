@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+from rfc import RFC, content_digest
+
+#keeps rfc contents on disk instead of in memory, so a peer can share far more than fits in its memory and the
+#upload server can send contents straight from the file with sendfile. contents are stored by their sha-256: each
+#distinct content is one file named after its digest, shared by every rfc with that content, and removed once no
+#rfc uses it any more. the metadata of each rfc is appended to an index file, which is read back (and compacted)
+#when the store is opened again, so a peer keeps its library across restarts
+class ContentStore:
+    INDEX_FILE = "index.jsonl"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, self.INDEX_FILE)
+        self.lock = threading.Lock()
+        #rfc_number -> digest of its content
+        self.digests = {}
+        #digest -> number of rfcs with that content
+        self.references = {}
+
+    #the file holding the content with the given digest
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest + ".blob")
+
+    #where stores written before contents were stored by digest kept an rfc's content. the rfc number is hex encoded
+    #so that any rfc number is a safe file name
+    def _legacy_path(self, rfc_number: str) -> str:
+        return os.path.join(self.directory, rfc_number.encode().hex() + ".rfc")
+
+    #write an rfc's content to the store, unless the same content is there already. from then on the rfc reads its
+    #content from the file
+    def put(self, rfc: RFC):
+        content = rfc.read_content()
+        digest = rfc.content_digest()
+        path = self._blob_path(digest)
+        with self.lock:
+            if not os.path.exists(path):
+                #write to a temporary file first so a crash never leaves a half written content behind
+                with open(path + ".tmp", "wb") as f:
+                    f.write(content)
+                os.replace(path + ".tmp", path)
+            #the new reference is counted before the old one is dropped, they may be to the same file
+            self.references[digest] = self.references.get(digest, 0) + 1
+            self._drop_reference(self.digests.get(rfc.rfc_number))
+            self.digests[rfc.rfc_number] = digest
+        self._append_record({
+            "rfc_number": rfc.rfc_number,
+            "title": rfc.title,
+            "last_modified": rfc.last_modified,
+            "content_type": rfc.content_type,
+            "content_length": len(content),
+            "digest": digest
+        })
+        rfc.content = None
+        rfc.content_path = path
+        rfc.content_length = len(content)
+
+    def remove(self, rfc_number: str):
+        self._append_record({"rfc_number": rfc_number, "removed": True})
+        with self.lock:
+            self._drop_reference(self.digests.pop(rfc_number, None))
+
+    #the rfcs in the store. the index is rewritten without the records that have been replaced or removed, and
+    #content files no rfc uses any more (left behind by a crash) are deleted
+    def load(self) -> list[RFC]:
+        records = {}
+        with self.lock:
+            try:
+                with open(self.index_path) as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError: #a line cut short by a crash
+                            continue
+                        if record.get("removed"):
+                            records.pop(record["rfc_number"], None)
+                        else:
+                            records[record["rfc_number"]] = record
+            except FileNotFoundError:
+                pass
+
+            self.digests = {}
+            self.references = {}
+            rfcs = []
+            for record in list(records.values()):
+                if "digest" not in record:
+                    self._move_legacy_content(record)
+                path = self._blob_path(record.get("digest", ""))
+                if not os.path.exists(path):
+                    del records[record["rfc_number"]]
+                    continue
+                digest = record["digest"]
+                self.digests[record["rfc_number"]] = digest
+                self.references[digest] = self.references.get(digest, 0) + 1
+                rfcs.append(RFC(record["rfc_number"], record["title"], record["last_modified"], record["content_length"], record["content_type"], None, path, digest))
+
+            for name in os.listdir(self.directory):
+                if name.endswith(".blob") and name[:-len(".blob")] not in self.references:
+                    os.remove(os.path.join(self.directory, name))
+
+            with open(self.index_path + ".tmp", "w") as f:
+                for record in records.values():
+                    f.write(json.dumps(record) + "\n")
+            os.replace(self.index_path + ".tmp", self.index_path)
+        return rfcs
+
+    #move a content kept under its rfc number by an older store to the file named after its digest. the record is
+    #left without a digest if the content is missing
+    def _move_legacy_content(self, record: dict):
+        legacy_path = self._legacy_path(record["rfc_number"])
+        try:
+            with open(legacy_path, "rb") as f:
+                digest = content_digest(f.read())
+        except FileNotFoundError:
+            return
+        if os.path.exists(self._blob_path(digest)):
+            os.remove(legacy_path)
+        else:
+            os.replace(legacy_path, self._blob_path(digest))
+        record["digest"] = digest
+
+    #forget that one rfc uses the content with the given digest, deleting its file once no rfc does. the lock must
+    #be held
+    def _drop_reference(self, digest: str):
+        if digest is None:
+            return
+        count = self.references[digest] - 1
+        if count > 0:
+            self.references[digest] = count
+            return
+        del self.references[digest]
+        try:
+            os.remove(self._blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _append_record(self, record: dict):
+        with self.lock:
+            with open(self.index_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
@@ -0,0 +1,183 @@
+import atexit
+import cProfile
+import io
+import logging
+import logging.handlers
+import os
+import pstats
+import queue
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+log = logging.getLogger(__name__)
+
+#the levels --log-level takes. per request messages are logged at debug, connections coming and going at info
+LOG_LEVELS = ("debug", "info", "warning", "error")
+
+#the thread writing log records out and the process it was started in. a forked worker has a copy of it but not
+#its thread
+_listener = None
+_listener_pid = None
+
+#log records at level and above to stream (stdout by default). records are handed to a background thread through a
+#queue, so a request never waits on the terminal or a file to log. can be called again, in a forked process too
+def setup_logging(level: str = "info", stream = None):
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    handler = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener_pid = os.getpid()
+    _listener.start()
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(_QueueHandler(records))
+    root.setLevel(level.upper())
+
+#hands records to the writing thread as they are. the stock QueueHandler formats every record and copies it on
+#the thread that logs it, so it can be sent to another process, which records kept in this process don't need
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+#write out the records still queued when the process exits
+@atexit.register
+def _stop_logging():
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+#cProfile and tracemalloc switched on and off while a server or peer runs, to see where its time and memory go
+#without restarting it. cProfile only follows the thread that enabled it: the thread that switches profiling on
+#is profiled as a whole (the event loop of the asyncio server, so every request) and threads that serve requests
+#profile each request they serve between begin() and end() while profiling is on. profiling must be switched off
+#by the thread that switched it on. when it is, the profiles are merged, written to a .prof file in directory
+#and the functions taking the most time are logged. when memory tracing is switched off the lines that allocated
+#the most memory still in use are logged
+class Profiler:
+    #how many functions or lines are logged
+    TOP = 25
+    #frames of the stack kept for each traced allocation
+    TRACE_FRAMES = 1
+
+    def __init__(self, directory: str = "."):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.profiling = False
+        #the profile of the thread that switched profiling on, and that thread
+        self.profile = None
+        self.owner = None
+        #the profiles of the requests served since then
+        self.profiles = []
+
+    #switch profiling on if it is off and off if it is on. returns the file the profile was written to when it is
+    #switched off, None otherwise
+    def toggle_profiling(self):
+        if self.profiling:
+            return self.stop_profiling()
+        self.start_profiling()
+        return None
+
+    def start_profiling(self):
+        with self.lock:
+            if self.profiling:
+                return
+            self.profiles = []
+            self.owner = threading.current_thread()
+            self.profile = cProfile.Profile()
+            self.profiling = True
+        try:
+            self.profile.enable()
+        except ValueError: #another profiler is already enabled, from python 3.12 there can only be one
+            with self.lock:
+                (self.profiling, self.profile, self.owner) = (False, None, None)
+            log.warning("can't switch profiling on, another profiler is running")
+            return
+        log.info("profiling on")
+
+    #returns the file the profile was written to, None if nothing was profiled
+    def stop_profiling(self):
+        with self.lock:
+            if not self.profiling:
+                return None
+            self.profiling = False
+            profiles = [self.profile] + self.profiles
+            self.profiles = []
+            self.owner = None
+        profiles[0].disable()
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError: #the profile is empty
+                pass
+        if stats is None:
+            log.info("profiling off, nothing was profiled")
+            return None
+        path = os.path.join(self.directory, "profile-{}-{}.prof".format(os.getpid(), time.strftime("%Y%m%d-%H%M%S")))
+        stats.dump_stats(path)
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(self.TOP)
+        log.info("profiling off, profile of %d requests written to %s\n%s", len(profiles) - 1, path, out.getvalue())
+        return path
+
+    #start profiling the request the calling thread is about to serve. returns the profile to hand to end(), None
+    #when profiling is off (which costs nothing more than the check) or the thread is already profiled. from python
+    #3.12 only one profiler can be enabled at a time, and the one that switched profiling on sees every thread, so
+    #the request is left to it
+    def begin(self):
+        if not self.profiling or threading.current_thread() is self.owner:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError: #another profiler is already enabled
+            return None
+        return profile
+
+    def end(self, profile):
+        if profile is None:
+            return
+        profile.disable()
+        with self.lock:
+            if self.profiling:
+                self.profiles.append(profile)
+
+    #switch memory tracing on if it is off and off if it is on. returns whether it is on now
+    def toggle_tracing(self) -> bool:
+        if tracemalloc.is_tracing():
+            self.stop_tracing()
+            return False
+        tracemalloc.start(self.TRACE_FRAMES)
+        log.info("memory tracing on")
+        return True
+
+    #log the lines that allocated the most memory still in use since tracing was switched on, and switch it off
+    def stop_tracing(self):
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot()
+        (current, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        top = snapshot.statistics("lineno")[:self.TOP]
+        log.info("memory tracing off, %.1f KB in use (peak %.1f KB) allocated while tracing\n%s",
+                 current / 1024, peak / 1024, "\n".join(str(stat) for stat in top))
+
+#the profiler of this process
+profiler = Profiler()
+
+#switch profiling on and off with SIGUSR1 and memory tracing with SIGUSR2, where there are such signals (not on
+#windows). must be called from the main thread, which is where the handlers run
+def install_signal_handlers():
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.toggle_profiling())
+        signal.signal(signal.SIGUSR2, lambda signum, frame: profiler.toggle_tracing())
@@ -0,0 +1,58 @@
+import time
+from parsing import RFCEntry
+from rfc_index import RFCIndex
+
+#a peer's copy of the server's index. it is brought up to date with SYNC, which only sends what changed since the
+#version the mirror has, and answers list and lookup locally in between, so a peer asking the same questions
+#over and over doesn't make the server walk and send its index every time
+class IndexMirror:
+    def __init__(self):
+        #the mirror keeps no change log of its own, it only follows the server's versions
+        self.index = RFCIndex(change_log_size=0)
+        #the epoch and version of the server's index this mirror matches. version 0 means nothing was synced yet
+        self.epoch = 0
+        self.version = 0
+        #time.monotonic() of the last sync, None before the first one
+        self.synced_at = None
+
+    #apply the answer to a SYNC. changes are (entry, added) pairs of parsing.RFCEntry. a full sync replaces the
+    #whole mirror. returns the number of changes applied
+    def apply(self, epoch: int, version: int, full: bool, changes) -> int:
+        index = RFCIndex(change_log_size=0) if full else self.index
+        applied = 0
+        for (entry, added) in changes:
+            if added:
+                index.add(entry.rfc_number, entry.rfc_title, entry.hostname, entry.upload_port_number, entry.digest)
+            else:
+                index.remove(entry.rfc_number, entry.rfc_title, entry.hostname, entry.upload_port_number)
+            applied += 1
+        self.index = index
+        (self.epoch, self.version) = (epoch, version)
+        self.synced_at = time.monotonic()
+        return applied
+
+    #True if the mirror was synced less than max_age seconds ago
+    def is_fresh(self, max_age: float) -> bool:
+        return self.synced_at is not None and time.monotonic() - self.synced_at < max_age
+
+    #find every entry for an rfc number. an empty title matches any title
+    def lookup(self, rfc_number: str, rfc_title: str = "") -> list:
+        return [self._entry(entry) for entry in self.index.lookup(rfc_number, rfc_title)]
+
+    def lookup_many(self, rfc_numbers: list) -> list:
+        return [self._entry(entry) for entry in self.index.lookup_many(rfc_numbers)]
+
+    #the entries a LIST with the same arguments would get from the server
+    def iter_list(self, pattern: str = "ALL", limit: int = None, after: str = None):
+        if pattern == "ALL":
+            entries = self.index.iter_entries("", after, limit)
+        elif pattern.endswith("*"):
+            entries = self.index.iter_entries(pattern[:-1], after, limit)
+        else:
+            entries = self.index.lookup(pattern)
+        for entry in entries:
+            yield self._entry(entry)
+
+    @staticmethod
+    def _entry(entry) -> RFCEntry:
+        return RFCEntry(entry.rfc_number, entry.rfc_title, entry.peer_hostname, entry.peer_port, entry.digest)
@@ -0,0 +1,65 @@
+import heapq
+import itertools
+import threading
+import time
+
+#leases of the peers connected to the server. every request from a peer (a HEARTBEAT when it has nothing else to
+#say) renews its lease, and a peer whose lease runs out is taken to be dead. renewing only moves the expiry in a
+#dict. the heap holds at most about one entry per peer, ordered by the expiry it had when the entry was pushed:
+#when an entry comes off the heap the real expiry is checked and a peer that renewed in the meantime is pushed
+#back with its new expiry. finding the expired peers therefore only ever looks at peers that were due, never at
+#every peer
+class LeaseTable:
+    def __init__(self, duration: float):
+        #seconds a lease lasts. zero turns leases off
+        self.duration = duration
+        self.lock = threading.Lock()
+        #peer -> expiry time (time.monotonic())
+        self.expiry = {}
+        #peer -> function that closes the peer's connection
+        self.closers = {}
+        #(expiry when pushed, sequence number, peer). the sequence number keeps peers with the same expiry from
+        #being compared
+        self.heap = []
+        self.sequence = itertools.count()
+
+    #start the lease of a newly connected peer. close() is called if the lease expires
+    def grant(self, peer, close):
+        if self.duration <= 0:
+            return
+        expiry = time.monotonic() + self.duration
+        with self.lock:
+            self.expiry[peer] = expiry
+            self.closers[peer] = close
+            heapq.heappush(self.heap, (expiry, next(self.sequence), peer))
+
+    def renew(self, peer):
+        if self.duration <= 0:
+            return
+        #a plain dict write, the heap catches up when the old expiry comes due
+        with self.lock:
+            if peer in self.expiry:
+                self.expiry[peer] = time.monotonic() + self.duration
+
+    #forget a peer that left by itself. its heap entry is dropped when it comes due
+    def release(self, peer):
+        with self.lock:
+            self.expiry.pop(peer, None)
+            self.closers.pop(peer, None)
+
+    #take every peer whose lease has run out out of the table. returns [(peer, close)]
+    def pop_expired(self) -> list:
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                (_, _, peer) = heapq.heappop(self.heap)
+                expiry = self.expiry.get(peer)
+                if expiry is None: #released, or a stale entry of a peer that already expired
+                    continue
+                if expiry > now: #renewed since the entry was pushed
+                    heapq.heappush(self.heap, (expiry, next(self.sequence), peer))
+                    continue
+                del self.expiry[peer]
+                expired.append((peer, self.closers.pop(peer)))
+        return expired
@@ -0,0 +1,126 @@
+import logging
+import math
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+#latencies are counted in buckets that grow by a quarter of a doubling from 1 microsecond, so a percentile is known
+#to within a fifth of its value whatever the latencies are, in a small fixed amount of memory. the last bucket
+#starts at about an hour and holds anything slower
+BUCKETS_PER_DOUBLING = 4
+BUCKET_COUNT = 128
+
+#the latencies of one kind of request. bucket 0 holds latencies under a microsecond and bucket i > 0 latencies
+#from 2**((i - 1) / 4) up to 2**(i / 4) microseconds
+class Histogram:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKET_COUNT
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        micros = seconds * 1e6
+        bucket = int(math.log2(micros) * BUCKETS_PER_DOUBLING) + 1 if micros >= 1 else 0
+        self.buckets[min(bucket, BUCKET_COUNT - 1)] += 1
+
+    #the latency in seconds that p percent of the observed ones are at or under, rounded up to the end of its
+    #bucket (but never past the slowest one seen)
+    def percentile(self, p: float) -> float:
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for (bucket, count) in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(2 ** (bucket / BUCKETS_PER_DOUBLING) / 1e6, self.max)
+        return self.max
+
+    #count, mean, p50, p95, p99 and max, the latencies in milliseconds
+    def summary(self) -> dict:
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p95_ms": round(self.percentile(95) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3)
+        }
+
+#the metrics of a server or a peer: counters (requests, bytes, connections, which may go down as well as up),
+#latency histograms keyed by name and gauges, functions read when the metrics are. recording a metric only takes
+#a lock around a dict update, so it can be done on every request
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        #name -> function returning the gauge's current value
+        self.gauges = {}
+        self.started = time.monotonic()
+
+    def add(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    #record the latency of one request of the kind name. the histogram's count doubles as the counter of requests
+    #of that kind. counters (name -> value) are added to under the same lock, which is cheaper than add() for each
+    def observe(self, name: str, seconds: float, counters: dict = None):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+            if counters is not None:
+                for (counter, value) in counters.items():
+                    self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def gauge(self, name: str, read):
+        self.gauges[name] = read
+
+    #every metric by name. counters and gauges are numbers, histograms are dicts like Histogram.summary's
+    def snapshot(self) -> dict:
+        with self.lock:
+            values = dict(self.counters)
+            values.update((name, histogram.summary()) for (name, histogram) in self.histograms.items())
+        for (name, read) in self.gauges.items():
+            values[name] = read()
+        values["uptime"] = round(time.monotonic() - self.started, 3)
+        return values
+
+    #the metrics as the body of a STATS response, a "name value" line for each in name order. a histogram's value
+    #is its summary as key=value pairs
+    def render(self) -> str:
+        lines = []
+        for (name, value) in sorted(self.snapshot().items()):
+            if isinstance(value, dict):
+                value = " ".join("{}={}".format(key, item) for (key, item) in value.items())
+            lines.append("{} {}\n".format(name, value))
+        return "".join(lines)
+
+    #log every metric each interval seconds from a daemon thread, until stop (a threading.Event) is set
+    def dump_every(self, interval: float, stop: threading.Event = None):
+        stop = stop if stop is not None else threading.Event()
+        def dump():
+            while not stop.wait(interval):
+                log.info("stats:\n%s", self.render())
+        threading.Thread(target=dump, daemon=True).start()
+
+#parse the body of a STATS response back into the dict Metrics.snapshot returned
+def parse_stats(body: str) -> dict:
+    values = {}
+    for line in body.splitlines():
+        (name, _, value) = line.partition(" ")
+        if "=" in value:
+            values[name] = {key: float(item) if "." in item else int(item) for (key, _, item) in (pair.partition("=") for pair in value.split())}
+        elif value:
+            values[name] = float(value) if "." in value else int(value)
+    return values
@@ -27,16 +27,37 @@ lookup_parser.add_argument("title", help='The title of the RFC, for example: "A
 #parser for "LIST" command
 list_parser = subparsers.add_parser("list", help="request the whole index of RFCs from the server")
 list_parser.add_argument("--local", action="store_true", help="Specify this flag if you only wish to see RFC files that are stored locally")
+list_parser.add_argument("pattern", nargs="?", default="ALL", help='Which RFCs to list: ALL, an RFC number or a prefix ending with *, for example: "RFC 1*"')
+list_parser.add_argument("--limit", type=int, help="List at most about this many RFCs (the last RFC number is always listed completely)")
+list_parser.add_argument("--after", help='Only list RFC numbers that sort after this one, for example the last RFC number of the previous page')
 
 #parser for "get" command
 get_parser = subparsers.add_parser("get", help="get an RFC from the specified peer")
-get_parser.add_argument("rfc", help='The RFC number you are requesting, for example: "RFC 123"')
-get_parser.add_argument("host", help="The host that the specified RFC is located on")
+get_parser.add_argument("rfc", nargs="?", help='The RFC number you are requesting, for example: "RFC 123"')
+get_parser.add_argument("host", nargs="?", help="The host that the specified RFC is located on")
+get_parser.add_argument("--swarm", action="store_true", help="Download pieces of the RFC from every peer that has it at once (the host can be left out)")
+get_parser.add_argument("--batch", help="A file with one RFC number per line. All of them are downloaded in parallel from whichever peers have them")
+
+#parsers for the "subscribe" and "unsubscribe" commands
+subscribe_parser = subparsers.add_parser("subscribe", help="be told when an RFC is added to or removed from the server's index")
+subscribe_parser.add_argument("rfc", nargs="?", help='The RFC number to be told about, for example: "RFC 123"')
+subscribe_parser.add_argument("--title", help="Be told about every RFC whose title starts with this instead")
+unsubscribe_parser = subparsers.add_parser("unsubscribe", help="stop being told about an RFC or title prefix")
+unsubscribe_parser.add_argument("rfc", nargs="?", help='The RFC number, for example: "RFC 123"')
+unsubscribe_parser.add_argument("--title", help="The title prefix that was subscribed to")
 
 #parser for "details" command
 details_parser = subparsers.add_parser("details", help="view host and port of this process or details of an rfc")
 details_parser.add_argument("what", help="The thing that you want details for. Can be either 'self' or an RFC number located on your system. ex: 'RFC 456'")
 
+#parser for "stats" command
+stats_parser = subparsers.add_parser("stats", help="view the server's request counts, latencies, bytes and connections")
+stats_parser.add_argument("--local", action="store_true", help="View this peer's own metrics instead: its uploads and downloads")
+
+#parser for "profile" command
+profile_parser = subparsers.add_parser("profile", help="switch profiling of this peer on or off. the results are logged when it is switched off")
+profile_parser.add_argument("what", choices=["cpu", "memory"], help="cpu profiles with cProfile, memory traces allocations with tracemalloc")
+
 #parser for "help" command
 help_parser = subparsers.add_parser("help", help="view help menu")
 
@@ -83,6 +104,60 @@ def parse_p2p_reponse(peer_response: str):
     return ret_obj
 
 
+#parse a "bytes=start-end" range header for content of the given length. the end is inclusive and can be left
+#out to mean the end of the content. returns (start, end) clipped to the content, or None if it can't be satisfied
+def parse_range(range_header: str, length: int):
+    unit, _, byte_range = range_header.partition("=")
+    first, dash, last = byte_range.partition("-")
+    if unit.strip() != "bytes" or dash == "":
+        return None
+    try:
+        start = int(first)
+        end = int(last) if last.strip() else length - 1
+    except ValueError:
+        return None
+    end = min(end, length - 1)
+    if start < 0 or start > end:
+        return None
+    return (start, end)
+
+
+#parse a "bytes start-end/total" content range header. returns (start, total), or (None, None) if it is malformed
+def parse_content_range(content_range: str):
+    try:
+        unit, byte_range = content_range.split(" ", 1)
+        first_last, total = byte_range.split("/")
+        if unit != "bytes":
+            return (None, None)
+        return (int(first_last.split("-")[0]), int(total))
+    except ValueError:
+        return (None, None)
+
+
+#content digests are sent as "sha-256=<hex>", in a Digest header or at the end of an entry of the index
+DIGEST_PREFIX = "sha-256="
+DIGEST_PREFIX_BYTES = DIGEST_PREFIX.encode()
+
+def format_digest(digest: str) -> str:
+    return DIGEST_PREFIX + digest
+
+#the upload port in a Port header, or None if it is missing or isn't a port number. the port is kept as the
+#string it was sent as, the way the index stores it, but every port in the index can be sent as a number
+def parse_port(value: str):
+    if value is None or not value.isdigit() or not value.isascii() or int(value) > 65535:
+        return None
+    return value
+
+#the hex digest in a "sha-256=<hex>" value, or None if it is missing or uses another algorithm
+def parse_digest(value: str):
+    if value is None or not value.startswith(DIGEST_PREFIX):
+        return None
+    digest = value[len(DIGEST_PREFIX):].strip().lower()
+    if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+        return None
+    return digest
+
+
 ###########################
 ### S2P Response Parser ###
 ###########################
@@ -98,25 +173,16 @@ def parse_s2p_response(server_message: str):
     status_code = status_line[first_space_index + 1:second_space_index]
     phrase = status_line[second_space_index + 1:]
 
+    #skip the headers, the rfcs start after the first empty line
+    i = 1
+    while i < len(lines) and lines[i].strip() != "":
+        i += 1
+    i += 1
+
     #parse the rfcs
-    i = 2 #it is 2 in order to skip the empty line
     rfcs = []
     while i < len(lines) and lines[i].strip() != "":
-        rfc_line = lines[i]
-        second_space_index = rfc_line.find(' ', rfc_line.find(' ') + 1)
-        last_space_index = rfc_line.rfind(' ')
-        second_last_space_index = rfc_line.rfind(' ', 0, rfc_line.rfind(' '))
-
-        rfc_number = rfc_line[:second_space_index]
-        rfc_title = rfc_line[second_space_index + 1:second_last_space_index]
-        hostname = rfc_line[second_last_space_index + 1:last_space_index]
-        upload_port = rfc_line[last_space_index + 1:]
-        rfcs.append(JSObject(**{
-            "rfc_number": rfc_number,
-            "rfc_title": rfc_title,
-            "hostname": hostname,
-            "upload_port_number": upload_port
-        }))
+        rfcs.append(parse_rfc_line(lines[i]))
         i += 1
     ret_obj = JSObject(**{
         'version': version, 
@@ -127,6 +193,60 @@ def parse_s2p_response(server_message: str):
     return ret_obj
     
 
+#parse one "rfc_number rfc_title hostname upload_port" line of a LOOKUP or LIST response, which may end with the
+#digest of the rfc's content
+def parse_rfc_line(rfc_line: str):
+    (rfc_line, digest) = _split_digest(rfc_line, DIGEST_PREFIX, " ")
+    second_space_index = rfc_line.find(' ', rfc_line.find(' ') + 1)
+    last_space_index = rfc_line.rfind(' ')
+    second_last_space_index = rfc_line.rfind(' ', 0, rfc_line.rfind(' '))
+
+    rfc_number = rfc_line[:second_space_index]
+    rfc_title = rfc_line[second_space_index + 1:second_last_space_index]
+    hostname = rfc_line[second_last_space_index + 1:last_space_index]
+    upload_port = rfc_line[last_space_index + 1:]
+    return JSObject(**{
+        "rfc_number": rfc_number,
+        "rfc_title": rfc_title,
+        "hostname": hostname,
+        "upload_port_number": upload_port,
+        "digest": digest
+    })
+
+#split the digest off the end of an entry line. prefix and space are str or bytes, like the line. returns (the
+#rest of the line, the hex digest or None)
+def _split_digest(line, prefix, space):
+    last_space_index = line.rfind(space)
+    if not line.startswith(prefix, last_space_index + 1):
+        return (line, None)
+    digest = line[last_space_index + 1 + len(prefix):]
+    return (line[:last_space_index], digest if isinstance(digest, str) else digest.decode())
+
+#parse a streamed (chunked) LIST body one rfc at a time. chunks is an iterable of the raw chunks of the body
+def iter_rfc_lines(chunks):
+    for line in _iter_lines(chunks):
+        yield parse_rfc_entry(line)
+
+#parse the lines of a chunked SYNC response as they arrive. each line is ADD or REMOVE followed by an entry of
+#the index. yields (entry, added) pairs
+def iter_sync_lines(chunks):
+    for line in _iter_lines(chunks):
+        (change, _, entry) = line.partition(b" ")
+        yield (parse_rfc_entry(entry), change == b"ADD")
+
+#the non empty lines in a series of chunks
+def _iter_lines(chunks):
+    remainder = b""
+    for chunk in chunks:
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop() #a line can be split across two chunks
+        for line in lines:
+            if line.strip():
+                yield line
+    if remainder.strip():
+        yield remainder
+
+
 ###########################
 ### Peer Request Parser ###
 # (works for requests to peers and server) #
@@ -151,10 +271,172 @@ def parse_peer_request(peer_request: str):
         name, value = line.split(":", 1)
         headers[name.strip()] = value.strip()
 
+    #the body, if there is one, follows the first empty line
+    body_start = peer_request.find("\n\n")
+    data = peer_request[body_start + 2:] if body_start != -1 else ""
+
     ret_obj = JSObject(**{
         'command': command,
         'rfc_number': rfc_number,
         'version': version,
         'headers': headers,
+        'data': data
     })
     return ret_obj
+
+
+##############################
+### Bytes Message Parser ###
+# (works directly on received bytes, bodies are zero copy) #
+##############################
+HEADER_END = b"\n\n"
+
+#a message that can't be read: its Content-Length (or chunk or frame length) isn't a number or is over the reader's
+#limit, or its header block isn't utf-8. the stream can't be framed past it, so the connection has to be closed
+#after answering 400
+class BadMessage(ValueError):
+    pass
+
+#raises BadMessage if length is over max_body. None means there is no limit
+def check_length(length: int, max_body: int = None) -> int:
+    if max_body is not None and length > max_body:
+        raise BadMessage("message of {} bytes is over the limit of {}".format(length, max_body))
+    return length
+
+#a request to a peer or the server. body is a memoryview into the received bytes
+class Request:
+    __slots__ = ("command", "rfc_number", "version", "headers", "body")
+
+    def __init__(self, command: str, rfc_number: str, version: str, headers: dict, body: memoryview):
+        self.command = command
+        self.rfc_number = rfc_number
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+#a response from a peer or the server. body is a memoryview into the received bytes
+class Response:
+    __slots__ = ("version", "status_code", "phrase", "headers", "body")
+
+    def __init__(self, version: str, status_code: str, phrase: str, headers: dict, body: memoryview):
+        self.version = version
+        self.status_code = status_code
+        self.phrase = phrase
+        self.headers = headers
+        self.body = body
+
+#one "rfc_number rfc_title hostname upload_port" entry of a LOOKUP or LIST response. digest is the sha-256 of the
+#content the peer said it has, in hex, or None if the server didn't send it
+class RFCEntry:
+    __slots__ = ("rfc_number", "rfc_title", "hostname", "upload_port_number", "digest")
+
+    def __init__(self, rfc_number: str, rfc_title: str, hostname: str, upload_port_number: str, digest: str = None):
+        self.rfc_number = rfc_number
+        self.rfc_title = rfc_title
+        self.hostname = hostname
+        self.upload_port_number = upload_port_number
+        self.digest = digest
+
+#decode just the header block of a message at data[start:head_end]. returns the start line and the headers
+def _parse_head(data, start: int, head_end: int):
+    try:
+        lines = data[start:head_end].decode().split("\n")
+    except UnicodeDecodeError:
+        raise BadMessage("header block is not utf-8")
+    headers = {}
+    for line in lines[1:]:
+        name, colon, value = line.partition(":")
+        if colon:
+            headers[name.strip()] = value.strip()
+    return (lines[0], headers)
+
+def _build_request(start_line: str, headers: dict, body: memoryview) -> Request:
+    #note: rfc_number can have spaces
+    first_space_index = start_line.find(' ')
+    last_space_index = start_line.rfind(' ')
+    return Request(start_line[:first_space_index], start_line[first_space_index + 1:last_space_index], start_line[last_space_index + 1:], headers, body)
+
+def _build_response(start_line: str, headers: dict, body: memoryview) -> Response:
+    #note: phrase can have spaces
+    (version, _, rest) = start_line.partition(' ')
+    (status_code, _, phrase) = rest.partition(' ')
+    return Response(version, status_code, phrase, headers, body)
+
+#incremental parser for the messages of a connection, one at a time. it is shown the bytes of the message received
+#so far each time more arrive, and only searches the new ones for the end of the header block, so a header block
+#that comes in many pieces is still scanned once. as soon as the header block is in it is parsed, which gives the
+#size of the whole message from its Content-Length. once that many bytes are in, request(data) or response(data)
+#builds the message from them without parsing the header block again. raises BadMessage for a Content-Length that
+#isn't a number or is over max_body (None for no limit), or a header block that isn't utf-8
+class MessageParser:
+    __slots__ = ("max_body", "searched", "head_size", "size", "start_line", "headers")
+
+    def __init__(self, max_body: int = None):
+        self.max_body = max_body
+        self.reset()
+
+    #get ready for the next message
+    def reset(self):
+        #how many bytes of the message have been searched for the end of the header block
+        self.searched = 0
+        #the size of the header block with the empty line ending it, and of the whole message, once they are known
+        self.head_size = None
+        self.size = None
+        self.start_line = None
+        self.headers = None
+
+    #data[start:end] holds the bytes received so far of the message, the same start every time or the offsets
+    #moved together. returns the size of the whole message once its header block is in, None until then
+    def feed(self, data, start: int, end: int):
+        if self.size is not None:
+            return self.size
+        #the end of the header block may straddle the bytes already searched
+        head_end = data.find(HEADER_END, start + max(0, self.searched - len(HEADER_END) + 1), end)
+        if head_end == -1:
+            self.searched = end - start
+            return None
+        (self.start_line, self.headers) = _parse_head(data, start, head_end)
+        self.head_size = head_end - start + len(HEADER_END)
+        self.size = self.head_size + self._content_length()
+        return self.size
+
+    #whether data, the bytes received so far from the start of the message, hold all of it
+    def complete(self, data) -> bool:
+        return self.feed(data, 0, len(data)) is not None and len(data) >= self.size
+
+    #the message in data, which starts at the start of the message and holds all of it
+    def request(self, data) -> Request:
+        return _build_request(self.start_line, self.headers, memoryview(data)[self.head_size:self.size])
+
+    def response(self, data) -> Response:
+        return _build_response(self.start_line, self.headers, memoryview(data)[self.head_size:self.size])
+
+    def _content_length(self) -> int:
+        for (name, value) in self.headers.items():
+            if name.lower() == "content-length" and value:
+                if not value.isdigit() or not value.isascii():
+                    raise BadMessage("Content-Length is not a number: {!r}".format(value[:32]))
+                return check_length(int(value), self.max_body)
+        return 0
+
+#parse one whole message from the start of data (bytes or bytearray). returns None if data doesn't hold all of it
+def parse_request_bytes(data) -> Request:
+    parser = MessageParser()
+    return parser.request(data) if parser.complete(data) else None
+
+def parse_response_bytes(data) -> Response:
+    parser = MessageParser()
+    return parser.response(data) if parser.complete(data) else None
+
+#parse one "rfc_number rfc_title hostname upload_port" line of bytes, which may end with a digest
+def parse_rfc_entry(line: bytes) -> RFCEntry:
+    (line, digest) = _split_digest(line, DIGEST_PREFIX_BYTES, b" ")
+    second_space_index = line.find(b' ', line.find(b' ') + 1)
+    last_space_index = line.rfind(b' ')
+    second_last_space_index = line.rfind(b' ', 0, last_space_index)
+    return RFCEntry(line[:second_space_index].decode(), line[second_space_index + 1:second_last_space_index].decode(),
+                    line[second_last_space_index + 1:last_space_index].decode(), line[last_space_index + 1:].decode(), digest)
+
+#parse every entry in the body of a LOOKUP or LIST response
+def parse_rfc_entries(body) -> list:
+    return [parse_rfc_entry(line) for line in bytes(body).split(b"\n") if line.strip()]
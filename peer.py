@@ -1,127 +1,553 @@
+import logging
+import random
 import socket
 import threading
+import time
 import parsing
 from rfc import RFC
-import platform
+from rfc_store import RFCStore
+from content_store import ContentStore
+import argparse
+from responses import ResponseBuilder, OS_NAME
 import datetime
 import signal
+import select
+from concurrent.futures import ThreadPoolExecutor
 import socket_helper
+import binary_protocol
+from connection_pool import ConnectionPool
+from upload_pool import UploadPool
+from shaping import UploadShaper
+import compression
+from compression import CompressionCache
+import diagnostics
+from metrics import Metrics
+from index_mirror import IndexMirror
+from swarm import SwarmDownloader
 
 SERVER_PORT = 7734
 SERVER_HOST = 'localhost'
+#start of the answer of an upload server that is too busy to serve a download
+BUSY_STATUS = b"P2P-CI/1.0 503 "
+#start of the answer of an upload server that sends a whole rfc
+OK_STATUS = b"P2P-CI/1.0 200 "
+
+log = logging.getLogger("peer")
 
 class Peer:
     #version of p2p system that this peer is implemented on
     P2P_VERSION = "P2P-CI/1.0"
+    #how long the upload server keeps an idle keep-alive connection open
+    KEEP_ALIVE_TIMEOUT = 30.0
+    #how many GETs get_many sends on a connection before reading their responses
+    PIPELINE_DEPTH = 16
+    #how many downloads the upload server serves at once, how many more connections may wait for their turn and
+    #for how many seconds. anyone else is answered 503 so they can download from another holder
+    MAX_UPLOADS = 32
+    UPLOAD_QUEUE_SIZE = 64
+    UPLOAD_QUEUE_TIMEOUT = 5.0
+    #the biggest request body the upload server reads. GET and STATS have none, anything bigger is answered 400
+    MAX_REQUEST_BODY = 64 * 1024
+    #how often the notification watcher looks for notifications that arrived together with a response
+    WATCH_INTERVAL = 0.2
 
-    def __init__(self, rfcs: list[RFC]):
-        self.rfcs = rfcs
+    #store_dir is a directory to keep rfc contents in. without it contents are only kept in memory. binary asks the
+    #server to talk P2P-CI/2.0, the compact binary protocol, and falls back to 1.0 if the server doesn't speak it.
+    #index_cache_ttl keeps a mirror of the server's index that answers list and lookup locally. it is synced with
+    #the server when it is older than that many seconds. max_uploads is how many downloads the upload server serves
+    #at once. upload_rate caps the upload server's bytes per second across all downloads and peer_upload_rate the
+    #bytes per second sent to any one peer, None leaves them uncapped. compression is the encoding (one of
+    #compression.ENCODINGS) the upload server compresses rfcs with for downloaders that accept it, None sends them
+    #as they are
+    def __init__(self, rfcs: list[RFC], server_address: tuple = (SERVER_HOST, SERVER_PORT), store_dir: str = None, binary: bool = False,
+                 index_cache_ttl: float = None, max_uploads: int = MAX_UPLOADS, upload_rate: float = None, peer_upload_rate: float = None,
+                 compression: str = "deflate"):
+        #the rfcs this peer has, indexed by rfc number
+        self.rfcs = RFCStore(rfcs, ContentStore(store_dir) if store_dir is not None else None)
+        #renders the upload server's responses, caching the parts that rarely change
+        self.responses = ResponseBuilder(self.P2P_VERSION)
+        #idle connections to other peers' upload servers, reused by get_cmd
+        self.pool = ConnectionPool(idle_timeout=self.KEEP_ALIVE_TIMEOUT / 2)
+        #local copy of the server's index, None when list and lookup always ask the server
+        self.mirror = IndexMirror() if index_cache_ttl is not None else None
+        self.index_cache_ttl = index_cache_ttl
 
-        ##create variables to manage stopping upload server if/when it is started
-        self.stop_requested = False
-        self.stop_requested_lock = threading.Lock()
+        #the threads serving downloads to other peers, at most max_uploads of them
+        self.uploads = UploadPool(self._handle_peer, self.responses.message(503, "Service Unavailable"), max_uploads,
+                                  self.UPLOAD_QUEUE_SIZE, self.UPLOAD_QUEUE_TIMEOUT)
+        #hands out the upload bandwidth a chunk at a time, None when uploads go out at full speed
+        self.shaper = None
+        if upload_rate is not None or peer_upload_rate is not None:
+            self.shaper = UploadShaper(upload_rate, peer_upload_rate)
+        #compressed copies of the rfcs being uploaded, None when they are always sent as they are
+        self.compression = compression
+        self.compressed = CompressionCache() if compression is not None else None
+        #the upload server's request counts and latencies, bytes and connections, and the downloads' latencies
+        self.metrics = Metrics()
+        self.metrics.gauge("rfcs", lambda: len(self.rfcs))
+        if self.compressed is not None:
+            self.metrics.gauge("compression.cache_bytes", lambda: self.compressed.size)
         ##create the upload server socket
         self.upload_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.upload_socket.bind(("localhost", 0)) #zero means get a random available port
         (self.upload_socket_host, self.upload_socket_port) = self.upload_socket.getsockname()
         ##connect to server
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.connect((SERVER_HOST, SERVER_PORT))
-        msg = "INIT - {}\nHost: {}\nPort: {}\n".format(self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port)
-        self.server_socket.send(msg.encode())
+        self.server_socket.connect(server_address)
+        self.server_reader = socket_helper.MessageReader(self.server_socket)
+        #held by a command from sending its request until it has read the response, so the notification watcher
+        #never reads a response. reentrant because some commands are built out of others
+        self.server_lock = threading.RLock()
+        #called with (entry, added) for every notification of a subscription
+        self.on_notify = None
+        #the thread reading notifications, started by the first subscription
+        self.watcher = None
+        #set once the peer has exited, stops the heartbeat
+        self.closed = threading.Event()
+        #the digests of the rfcs in the index let get skip downloading content this peer already has
+        msg = "INIT - {}\nHost: {}\nPort: {}\nWant-Digest: sha-256\n".format(self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port)
+        if binary:
+            msg += "Upgrade: {}\n".format(binary_protocol.VERSION)
+        socket_helper.send_message(self.server_socket, msg)
+        #the protocol version used with the server and, on 2.0, the peers the server has introduced so far
+        self.server_version = self.P2P_VERSION
+        self.decoder = None
+        if binary:
+            res = parsing.parse_response_bytes(self.server_reader.read_message())
+            if res.status_code == "101" and res.headers.get("Upgrade") == binary_protocol.VERSION:
+                self.server_version = binary_protocol.VERSION
+                self.decoder = binary_protocol.Decoder()
+        threading.Thread(target=self._heartbeat, daemon=True).start()
     
     def __del__(self):
         self.upload_socket.close()
         self.server_socket.close()
+        self.pool.close()
 
-    #this creates a peer with the given number of random rfcs
+    #this creates a peer with the given number of random rfcs. rng is the random.Random they are drawn from, a
+    #seeded one gives the same rfcs every time
     @classmethod
-    def with_random_rfcs(cls, num_rfcs):
+    def with_random_rfcs(cls, num_rfcs, rng = random, **kwargs):
         rfcs = []
         for _ in range(num_rfcs):
-            rfcs.append(RFC.generate_random_rfc())
-        return cls(rfcs)
+            rfcs.append(RFC.generate_random_rfc(rng))
+        return cls(rfcs, **kwargs)
     
     def start_upload_server(self):
+        #listening before returning means other peers can connect as soon as this returns. the backlog is long so a
+        #flood of downloaders is answered 503 quickly instead of having its connections dropped by the kernel
+        self.upload_socket.listen(socket.SOMAXCONN)
         ##start upload server in another thread
-        upload_server_thread = threading.Thread(target=self._run_upload_server, args=(self.upload_socket,))
+        upload_server_thread = threading.Thread(target=self.uploads.serve, args=(self.upload_socket,))
         upload_server_thread.daemon = True #exit when main program exits
-        
-        ##set stop reqested to false to allow the upload server thread's infinite loop to run
-        self.stop_requested_lock.acquire()
-        self.stop_requested = False
-        self.stop_requested_lock.release()
-
         upload_server_thread.start()
 
-    #call this server to change the global flag which all threads are looking at to see if the server should terminate
+    #stop accepting downloads and turn away the ones waiting. returns straight away, downloads being served finish
+    #the request in hand
     def stop_upload_server(self):
-        self.stop_requested_lock.acquire()
-        self.stop_requested = True
-        self.stop_requested_lock.release()
-    
-    def _run_upload_server(self, upload_socket: socket):
-        upload_socket.listen()
-        while not self.stop_requested:
-            peer_socket, peer_addr = upload_socket.accept()
-            print('\nReceived connection from: {}\ncmd>'.format(peer_addr))
-            client_thread = threading.Thread(target=self._handle_peer, args=(peer_socket,))
-            client_thread.daemon = True
-            client_thread.start()
-        self.upload_socket.close()
-    
+        self.uploads.stop()
+
+    #serve GET requests on a connection from another peer, on one of the upload pool's threads. a request with
+    #"Connection: keep-alive" leaves the connection open for more requests, which may be pipelined (sent before the
+    #previous response was read). responses always go out in the order the requests came in. a connection idling
+    #between requests is given up as soon as other downloaders are waiting for a thread
     def _handle_peer(self, peer_socket: socket):
+        if log.isEnabledFor(logging.DEBUG):
+            try:
+                log.debug("Received connection from: %s", peer_socket.getpeername())
+            except OSError:
+                pass
+        self.metrics.add("connections.active")
+        self.metrics.add("connections.total")
         try:
-            request = parsing.parse_peer_request(peer_socket.recv(4096).decode())
-            if request.version != self.P2P_VERSION:
-                peer_socket.send(self._res_msg(self.P2P_VERSION, 505, "P2P-CI Version Not Supported").encode())
-                return
-            
-            retrieved_rfc = None
-            for rfc in self.rfcs:
-                if rfc.rfc_number == request.rfc_number:
-                    retrieved_rfc = rfc
+            peer_socket.settimeout(self.KEEP_ALIVE_TIMEOUT)
+            #responses to pipelined requests are small writes back to back, don't let nagle hold them up
+            peer_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            reader = socket_helper.MessageReader(peer_socket, max_body=self.MAX_REQUEST_BODY)
+            served = 0
+            while True:
+                #closing a new connection before its first request would reset it, and the downloader would never
+                #see an answer
+                if served and reader.buffered() == 0 and not self.uploads.wait_for_request(peer_socket, self.KEEP_ALIVE_TIMEOUT):
                     break
+                request_bytes = reader.read_message()
+                if request_bytes is None: #the peer closed the connection
+                    break
+                start = time.perf_counter()
+                profile = None
+                try:
+                    profile = diagnostics.profiler.begin()
+                    keep_alive = self._serve_request(peer_socket, request_bytes, reader.parser.request(request_bytes))
+                finally:
+                    diagnostics.profiler.end(profile)
+                    self.metrics.observe("requests.STATS" if request_bytes.startswith(b"STATS ") else "requests.GET", time.perf_counter() - start,
+                                         {"bytes.in": len(request_bytes)})
+                if not keep_alive:
+                    break
+                served += 1
+        except socket_helper.BadMessage:
+            #nothing after a request that can't be read can be read either, answer it and hang up
+            try:
+                peer_socket.sendall(self.responses.message(400, "Bad Request"))
+            except OSError:
+                pass
+        except OSError: #the connection was reset or sat idle for too long
+            pass
+        finally:
+            self.metrics.add("connections.active", -1)
+            peer_socket.close()
+
+    #answer one GET request, or a STATS request for this peer's metrics. returns True if the connection should be
+    #kept open for another request. request is the request already parsed by the reader, it is parsed here if not given
+    def _serve_request(self, peer_socket: socket, request_bytes: bytes, request: parsing.Request = None) -> bool:
+        try:
+            request = request if request is not None else parsing.parse_request_bytes(request_bytes)
+            keep_alive = request.headers.get("Connection", "").lower() == "keep-alive"
+            if request.version != self.P2P_VERSION:
+                peer_socket.sendall(self.responses.message(505, "P2P-CI Version Not Supported"))
+                return False
 
+            if request.command == "STATS":
+                body = self.metrics.render().encode()
+                peer_socket.sendall(self.responses.head(200, "OK", keep_alive) + "Content-Length: {}\n\n".format(len(body)).encode() + body)
+                return keep_alive
+            retrieved_rfc = self.rfcs.get(request.rfc_number)
             if retrieved_rfc == None:
-                peer_socket.send(self._res_msg(self.P2P_VERSION, 404, "Not Found").encode())
+                peer_socket.sendall(self.responses.message(404, "Not Found", keep_alive))
             else:
-                peer_socket.send(self._res_msg(self.P2P_VERSION, 200, "OK", retrieved_rfc).encode())
+                sent = self._send_rfc(peer_socket, retrieved_rfc, request.headers.get("Range"), keep_alive, request.headers.get("Accept-Encoding"))
+                self.metrics.add("bytes.out", sent)
+            return keep_alive
+        except OSError:
+            raise
         except:
-            peer_socket.send(self._res_msg(self.P2P_VERSION, 400, "Bad Request").encode())
-        
-        peer_socket.close()
+            peer_socket.sendall(self.responses.message(400, "Bad Request"))
+            return False
+
+    #send an rfc's content. a GET with a "Range: bytes=start-end" header (end is inclusive and may be left out) gets
+    #just those bytes and a Content-Range header saying where they are in the whole content. a whole rfc is sent
+    #compressed if the downloader accepts this peer's encoding and the content shrinks, from a cache so the same
+    #rfc is only compressed once. contents that live in a file are otherwise sent with sendfile, straight from the
+    #page cache, without ever being read into python. returns the number of bytes of body sent
+    def _send_rfc(self, peer_socket: socket, rfc: RFC, range_header: str, keep_alive: bool, accept_encoding: str = None):
+        if range_header is None:
+            if self.compressed is not None and self.compression in compression.parse_accept_encoding(accept_encoding):
+                body = self.compressed.get(rfc, self.compression)
+                if body is not None:
+                    msg = self.responses.head(200, "OK", keep_alive) + self.responses.encoded_rfc_headers(rfc, self.compression, len(body))
+                    self._send_body(peer_socket, msg, body)
+                    return len(body)
+            msg = self.responses.head(200, "OK", keep_alive) + self.responses.rfc_headers(rfc)
+            (start, count) = (0, None)
+        else:
+            size = rfc.content_size()
+            byte_range = parsing.parse_range(range_header, size)
+            if byte_range is None:
+                peer_socket.sendall(self.responses.message(416, "Range Not Satisfiable", keep_alive))
+                return 0
+            (start, end) = byte_range
+            count = end - start + 1
+            #content length is the size of the body on the wire so the receiver knows where the message ends. the
+            #digest is of the whole content, so the receiver can check it once it has every range
+            msg = self.responses.head(206, "Partial Content", keep_alive) + "Last-Modified: {}\nContent-Range: bytes {}-{}/{}\nContent-Type: {}\nContent-Length: {}\nDigest: {}\n\n".format(
+                rfc.last_modified, start, end, size, rfc.content_type, count, parsing.format_digest(rfc.content_digest())).encode()
+        sent = count if count is not None else rfc.content_size()
+
+        if self.shaper is not None:
+            self._send_shaped(peer_socket, msg, rfc, start, count)
+            return sent
+
+        if rfc.content_path is None:
+            content = rfc.content.encode()
+            if count is not None:
+                content = content[start:start + count]
+            self._send_body(peer_socket, msg, content)
+            return sent
+        with open(rfc.content_path, "rb") as f:
+            peer_socket.sendall(msg)
+            if count != 0:
+                peer_socket.sendfile(f, start, count)
+        return sent
+
+    #send the head of a response and a body held in memory
+    def _send_body(self, peer_socket: socket, msg: bytes, body: bytes):
+        if self.shaper is not None:
+            self._send_shaped(peer_socket, msg, None, 0, None, body)
+        elif len(body) < socket_helper.SMALL_BODY:
+            peer_socket.sendall(msg + body)
+        else:
+            peer_socket.sendall(msg)
+            peer_socket.sendall(body)
+
+    #send a response a chunk at a time, each chunk once the shaper gives the downloading peer its turn. count is the
+    #number of content bytes from start, None for all of it. body is sent instead of the rfc's content if it is given
+    def _send_shaped(self, peer_socket: socket, msg: bytes, rfc: RFC, start: int, count: int, body: bytes = None):
+        peer = peer_socket.getpeername()[0]
+        chunk_size = self.shaper.chunk_size
+        self.shaper.acquire(peer, min(len(msg), chunk_size))
+        peer_socket.sendall(msg)
+        if body is not None or rfc.content_path is None:
+            content = memoryview(body if body is not None else rfc.content.encode())
+            content = content[start:] if count is None else content[start:start + count]
+            for offset in range(0, len(content), chunk_size):
+                chunk = content[offset:offset + chunk_size]
+                self.shaper.acquire(peer, len(chunk))
+                peer_socket.sendall(chunk)
+            return
+        if count is None:
+            count = rfc.content_size() - start
+        with open(rfc.content_path, "rb") as f:
+            while count > 0:
+                size = min(count, chunk_size)
+                self.shaper.acquire(peer, size)
+                peer_socket.sendfile(f, start, size)
+                start += size
+                count -= size
 
     #this does not add any headers about file information
     @staticmethod
-    def _res_msg(version: str, status_code: int, phrase: str, rfc: RFC = None):
+    def _res_msg(version: str, status_code: int, phrase: str):
         current_date = datetime.datetime.now(datetime.timezone.utc)
         rfc_date = current_date.strftime("%a, %d %b %Y %H:%M:%S GMT")
-        msg = "{} {} {}\nDate: {}\nOS: {}\n".format(version, status_code, phrase, rfc_date, platform.platform())
-        if (rfc is not None):
-            msg += "Last-Modified: {}\nContent-Length: {}\nContent-Type: {}\n\n{}\n".format(rfc.last_modified, rfc.content_length, rfc.content_type, rfc.content)
-        return msg
+        return "{} {} {}\nDate: {}\nOS: {}\n\n".format(version, status_code, phrase, rfc_date, OS_NAME)
     
+    #tell the server this peer has an rfc. the digest of the local copy's content goes with it, so peers that have
+    #the same content under another rfc number don't need to download it
     def add_cmd(self, rfc: str, title: str):
-        msg = "ADD {} {}\nHost: {}\nPort: {}\nTitle: {}\n".format(rfc, self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port, title)
-        self.server_socket.send(msg.encode())
-
-        res = self.server_socket.recv(4096).decode()
+        local = self.rfcs.find(rfc, title)
+        digest = local.content_digest() if local is not None else None
+        with self.server_lock:
+            if self.decoder is not None:
+                self.server_socket.sendall(binary_protocol.encode_request(binary_protocol.ADD, rfc, title, digest))
+                res = self._binary_response_text()
+            else:
+                msg = "ADD {} {}\nHost: {}\nPort: {}\nTitle: {}\n".format(rfc, self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port, title)
+                if digest is not None:
+                    msg += "Digest: {}\n".format(parsing.format_digest(digest))
+                socket_helper.send_message(self.server_socket, msg)
+                res = self._read_response().decode()
+        if self.mirror is not None:
+            #the mirror sees this peer's own rfcs straight away. the next sync adds them again, which changes nothing
+            for entry in parsing.parse_rfc_entries(parsing.parse_response_bytes(res.encode()).body):
+                self.mirror.index.add(entry.rfc_number, entry.rfc_title, entry.hostname, entry.upload_port_number, entry.digest)
         return res
 
     def lookup_cmd(self, rfc: str, title: str):
-        msg = "LOOKUP {} {}\nHost: {}\nPort: {}\nTitle: {}\n".format(rfc, self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port, title)
-        self.server_socket.send(msg.encode())
+        if self._mirror_synced():
+            entries = self.mirror.lookup(rfc, title)
+            return self._response_text(self.P2P_VERSION, 200 if entries else 404, entries)
+        with self.server_lock:
+            if self.decoder is not None:
+                self.server_socket.sendall(binary_protocol.encode_request(binary_protocol.LOOKUP, rfc, title))
+                return self._binary_response_text()
+            msg = "LOOKUP {} {}\nHost: {}\nPort: {}\nTitle: {}\n".format(rfc, self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port, title)
+            socket_helper.send_message(self.server_socket, msg)
+
+            res = self._read_response().decode()
+            return res
+
+    #read a 2.0 response from the server and write it out the way a 1.0 server would have sent it
+    def _binary_response_text(self) -> str:
+        (status_code, _, entries) = self._read_frame()
+        return self._response_text(self.server_version, status_code, entries)
+
+    #a response holding entries of the index (or text), written out the way the server sends it
+    def _response_text(self, version: str, status_code: int, entries: list, text: str = "") -> str:
+        body = text + "".join(self._rfc_line(rfc) + "\n" for rfc in entries)
+        res = "{} {} {}\n".format(version, status_code, binary_protocol.PHRASES.get(status_code, ""))
+        if body:
+            res += "Content-Length: {}\n".format(len(body.encode()))
+        return res + "\n" + body
 
-        res = self.server_socket.recv(4096).decode()
+    #ask the server to tell this peer whenever an entry for the rfc number, or with a title starting with
+    #title_prefix, is added to or removed from the index. notifications are read in the background and handed to
+    #self.on_notify(entry, added)
+    def subscribe_cmd(self, rfc_number: str = None, title_prefix: str = None) -> str:
+        res = self._subscription_request("SUBSCRIBE", rfc_number, title_prefix)
+        self._start_watcher()
         return res
+
+    def unsubscribe_cmd(self, rfc_number: str = None, title_prefix: str = None) -> str:
+        return self._subscription_request("UNSUBSCRIBE", rfc_number, title_prefix)
+
+    def _subscription_request(self, command: str, rfc_number: str, title_prefix: str) -> str:
+        with self.server_lock:
+            if self.decoder is not None:
+                opcode = binary_protocol.SUBSCRIBE if command == "SUBSCRIBE" else binary_protocol.UNSUBSCRIBE
+                if rfc_number is not None:
+                    request = binary_protocol.encode_request(opcode, binary_protocol.BY_NUMBER, rfc_number)
+                else:
+                    request = binary_protocol.encode_request(opcode, binary_protocol.BY_TITLE_PREFIX, title_prefix)
+                self.server_socket.sendall(request)
+                return self._binary_response_text()
+            #a subscription to a title prefix has - in place of the rfc number
+            msg = "{} {} {}\nHost: {}\nPort: {}\n".format(command, rfc_number if rfc_number is not None else "-", self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port)
+            if rfc_number is None:
+                msg += "Title-Prefix: {}\n".format(title_prefix)
+            socket_helper.send_message(self.server_socket, msg)
+            return self._read_response().decode()
+
+    #read the next 1.0 response from the server. notifications that arrive before it are handed to on_notify
+    def _read_response(self) -> bytes:
+        while True:
+            message = self.server_reader.read_message()
+            if not self._text_notification(message):
+                return message
+
+    #read and decode the next 2.0 response frame from the server. returns (status_code, flags, entries).
+    #notifications that arrive before it are handed to on_notify
+    def _read_frame(self):
+        while True:
+            frame = self.decoder.response(self.server_reader.read_frame())
+            if not self._binary_notification(frame):
+                return frame
+
+    #hand a 1.0 message to on_notify if it is a notification. returns True if it was
+    def _text_notification(self, message: bytes) -> bool:
+        if message is None or not message.startswith(b"NOTIFY "):
+            return False
+        notification = parsing.parse_request_bytes(message)
+        headers = notification.headers
+        port = parsing.parse_port(headers.get("Port"))
+        #a notification missing any of its headers is read and dropped, it isn't an answer either
+        if port is None or "Title" not in headers or "Host" not in headers or "Change" not in headers:
+            return True
+        entry = parsing.RFCEntry(notification.rfc_number, headers["Title"], headers["Host"], port, parsing.parse_digest(headers.get("Digest")))
+        self._notify(entry, headers["Change"] == "ADD")
+        return True
+
+    #hand a decoded 2.0 frame to on_notify if it is a notification. returns True if it was
+    def _binary_notification(self, frame) -> bool:
+        (_, flags, entries) = frame
+        if not flags & binary_protocol.NOTIFY:
+            return False
+        for entry in entries:
+            self._notify(entry, not flags & binary_protocol.REMOVED)
+        return True
+
+    def _notify(self, entry, added: bool):
+        if self.on_notify is not None:
+            self.on_notify(entry, added)
+
+    #start the thread that reads notifications while no command is waiting on the server
+    def _start_watcher(self):
+        if self.watcher is not None:
+            return
+        self.watcher = threading.Thread(target=self._watch_server)
+        self.watcher.daemon = True
+        self.watcher.start()
+
+    #read the notifications the server pushes while the connection is otherwise idle. commands hold server_lock
+    #from sending a request until they have read its response, so anything that arrives while this thread holds
+    #the lock is a notification
+    def _watch_server(self):
+        while True:
+            try:
+                readable = select.select([self.server_socket], [], [], self.WATCH_INTERVAL)[0]
+            except (OSError, ValueError): #the socket was closed
+                return
+            #notifications that came in right behind a response are already in the reader's buffer
+            if not readable and self.server_reader.buffered() == 0:
+                continue
+            with self.server_lock:
+                try:
+                    #a command may have read everything there was while this thread waited for the lock
+                    while self.server_reader.buffered() > 0 or select.select([self.server_socket], [], [], 0)[0]:
+                        if self.decoder is not None:
+                            payload = self.server_reader.read_frame()
+                            if payload is None:
+                                return
+                            self._binary_notification(self.decoder.response(payload))
+                        else:
+                            message = self.server_reader.read_message()
+                            if message is None:
+                                return
+                            self._text_notification(message)
+                except (OSError, ValueError): #the socket was closed
+                    return
+    #bring the index mirror up to date with a SYNC. only the changes since the mirror's version are sent, unless
+    #the server can't tell them (for example after it restarted) and sends its whole index. returns the number of
+    #changes applied
+    def sync_cmd(self) -> int:
+        with self.server_lock:
+            if self.decoder is not None:
+                self.server_socket.sendall(binary_protocol.encode_request(binary_protocol.SYNC, self.mirror.epoch, self.mirror.version))
+                (_, flags, _) = self._read_frame()
+                full = bool(flags & binary_protocol.FULL)
+                def changes():
+                    flags = binary_protocol.MORE
+                    while flags & binary_protocol.MORE:
+                        (_, flags, entries) = self._read_frame()
+                        added = not flags & binary_protocol.REMOVED
+                        for entry in entries:
+                            yield (entry, added)
+                return self.mirror.apply(self.decoder.epoch, self.decoder.version, full, changes())
+
+            msg = "SYNC {} {}\nHost: {}\nPort: {}\nIndex: {}\n".format(self.mirror.version, self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port, self.mirror.epoch)
+            socket_helper.send_message(self.server_socket, msg)
+            res = parsing.parse_response_bytes(self._read_response())
+            changes = parsing.iter_sync_lines(self.server_reader.iter_chunks())
+            return self.mirror.apply(int(res.headers["Index"]), int(res.headers["Version"]), res.headers["Sync"] == "full", changes)
+
+    #True if list and lookup should be answered by the index mirror. the mirror is synced first if it is too old
+    def _mirror_synced(self) -> bool:
+        if self.mirror is None:
+            return False
+        if not self.mirror.is_fresh(self.index_cache_ttl):
+            self.sync_cmd()
+        return True
     
-    def list_cmd(self):
-        msg = "LIST ALL {}\nHost: {}\nPort: {}\n".format(self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port)
-        self.server_socket.send(msg.encode())
+    #stream the server's index one rfc at a time. entries are parsed as the chunks of the response arrive, so
+    #memory stays flat no matter how big the index is. the server lock is held until the generator is used up or
+    #closed, so it has to be finished (or stopped, with a break or close()) before the next command. stopping it
+    #early reads and throws away the rest of the response
+    def iter_list(self, pattern: str = "ALL", limit: int = None, after: str = None):
+        if self._mirror_synced():
+            yield from self.mirror.iter_list(pattern, limit, after)
+            return
+        with self.server_lock:
+            if self.decoder is not None:
+                self.server_socket.sendall(binary_protocol.encode_request(binary_protocol.LIST, pattern, limit or 0, after or ""))
+                flags = binary_protocol.MORE
+                try:
+                    while flags & binary_protocol.MORE:
+                        (_, flags, entries) = self._read_frame()
+                        yield from entries
+                except GeneratorExit:
+                    #stopped early. the rest of the response is read so the next command doesn't get it instead
+                    while flags & binary_protocol.MORE:
+                        (_, flags, _) = self._read_frame()
+                    raise
+                return
+            msg = "LIST {} {}\nHost: {}\nPort: {}\n".format(pattern, self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port)
+            if limit is not None:
+                msg += "Limit: {}\n".format(limit)
+            if after is not None:
+                msg += "After: {}\n".format(after)
+            socket_helper.send_message(self.server_socket, msg)
 
-        res = self.server_socket.recv(4096).decode()
-        return res
+            res = parsing.parse_response_bytes(self._read_response())
+            if res.headers.get("Transfer-Encoding") == "chunked":
+                chunks = self.server_reader.iter_chunks()
+                try:
+                    yield from parsing.iter_rfc_lines(chunks)
+                except GeneratorExit:
+                    for _ in chunks:
+                        pass
+                    raise
+            elif res.status_code == "200":
+                yield from parsing.parse_rfc_entries(res.body)
+
+    def list_cmd(self, pattern: str = "ALL", limit: int = None, after: str = None):
+        lines = [self._rfc_line(rfc) for rfc in self.iter_list(pattern, limit, after)]
+        if len(lines) == 0:
+            return "No RFCs in index."
+        return "\n".join(lines)
+
+    #format an entry of the server's index the same way the server sends it to peers that didn't ask for digests
+    @staticmethod
+    def _rfc_line(rfc):
+        return "{} {} {} {}".format(rfc.rfc_number, rfc.rfc_title, rfc.hostname, rfc.upload_port_number)
     
     def list_local(self):
         retVal = ""
@@ -142,29 +568,260 @@ class Peer:
         rfc = next(filter(lambda r: r.hostname == host, server_res.rfcs), None)
         if rfc == None:
             return self._res_msg(self.P2P_VERSION, 404, "Not Found")
-        
-        upload_port_number = rfc.upload_port_number
-        msg = "GET {} {}\nHost: {}\nOS: {}\n".format(rfc_number, self.P2P_VERSION, host, platform.platform())
-
-        #connect to peer's upload server
-        upload_server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        upload_server_socket.connect((host, int(upload_port_number)))
-        upload_server_socket.send(msg.encode())
-
-        #recieve response, close socket, and return response
-        response_str = socket_helper.recv_all(upload_server_socket).decode()
-        res = parsing.parse_p2p_reponse(response_str)
-        rfc = RFC(rfc_number, rfc.rfc_title, res.headers["Last-Modified"], res.headers["Content-Length"], res.headers["Content-Type"], res.data)
-        self.rfcs.append(rfc)
-        upload_server_socket.close()
-        return response_str
+
+        copy = self._copy_local([rfc])
+        if copy is not None:
+            return str(copy)
+        response = self._get_from_peer(host, rfc.upload_port_number, [rfc_number])[0]
+        if response is None:
+            return self._res_msg(self.P2P_VERSION, 502, "Digest Mismatch")
+        rfc = self._rfc_from_response(rfc_number, rfc.rfc_title, response)
+        if rfc is not None:
+            self.rfcs.add(rfc)
+        return response.decode()
+
+    #find out who has each of rfc_numbers with a single LOOKUP. returns {rfc_number: [entries]}
+    def lookup_many(self, rfc_numbers: list) -> dict:
+        if self._mirror_synced():
+            entries = self.mirror.lookup_many(rfc_numbers)
+        elif self.decoder is not None:
+            with self.server_lock:
+                self.server_socket.sendall(binary_protocol.encode_request(binary_protocol.LOOKUP_BATCH, rfc_numbers))
+                (_, _, entries) = self._read_frame()
+        else:
+            msg = "LOOKUP BATCH {}\nHost: {}\nPort: {}\n".format(self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port)
+            with self.server_lock:
+                socket_helper.send_message(self.server_socket, msg, "".join(rfc_number + "\n" for rfc_number in rfc_numbers).encode())
+                entries = parsing.parse_rfc_entries(parsing.parse_response_bytes(self._read_response()).body)
+        holders = {}
+        for rfc in entries:
+            holders.setdefault(rfc.rfc_number, []).append(rfc)
+        return holders
+
+    #add an rfc from the content this peer already has, if any of the entries for it says a holder has content with
+    #the same digest as one of the local rfcs. returns the new RFC, or None if it has to be downloaded
+    def _copy_local(self, entries: list):
+        for entry in entries:
+            same = self.rfcs.with_digest(entry.digest) if entry.digest is not None else None
+            if same:
+                local = same[0]
+                rfc = RFC(entry.rfc_number, entry.rfc_title, local.last_modified, local.content_size(), local.content_type, local.content, local.content_path, local.digest)
+                self.rfcs.add(rfc)
+                return rfc
+        return None
+
+    #download many rfcs at once. every location is resolved with one LOOKUP, then the rfcs are fetched in parallel
+    #with at most per_peer connections to any one peer, each pipelining its GETs. rfcs whose content this peer
+    #already has under another number are copied instead. downloaded rfcs are added to self.rfcs as soon as they
+    #arrive and on_result(rfc_number, rfc) is called for each one (with None if it could not be downloaded). rfcs
+    #that fail to come from one peer, or whose content doesn't match its digest, are tried again from another peer
+    #that has them. returns {rfc_number: RFC} for the rfcs that were downloaded
+    def get_many(self, rfc_numbers: list, max_workers: int = 16, per_peer: int = 4, on_result = None) -> dict:
+        rfc_numbers = list(dict.fromkeys(rfc_numbers))
+        holders = self.lookup_many(rfc_numbers)
+        downloaded = {}
+        tried = {rfc_number: set() for rfc_number in rfc_numbers}
+        pending = []
+        for rfc_number in rfc_numbers:
+            if rfc_number not in holders:
+                continue
+            copy = self._copy_local(holders[rfc_number])
+            if copy is None:
+                pending.append(rfc_number)
+                continue
+            downloaded[rfc_number] = copy
+            if on_result is not None:
+                on_result(rfc_number, copy)
+
+        #fetch the rfcs assigned to one connection to a peer, a pipelined batch at a time
+        def fetch(address, entries):
+            failed = []
+            for i in range(0, len(entries), self.PIPELINE_DEPTH):
+                batch = entries[i:i + self.PIPELINE_DEPTH]
+                try:
+                    responses = self._get_from_peer(address[0], address[1], [entry.rfc_number for entry in batch])
+                except OSError:
+                    responses = [None] * len(batch)
+                for entry, response in zip(batch, responses):
+                    rfc = self._rfc_from_response(entry.rfc_number, entry.rfc_title, response) if response else None
+                    if rfc is None:
+                        failed.append(entry.rfc_number)
+                        continue
+                    downloaded[entry.rfc_number] = rfc
+                    self.rfcs.add(rfc)
+                    if on_result is not None:
+                        on_result(entry.rfc_number, rfc)
+            return failed
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending:
+                #give each rfc to the least busy peer that has it and hasn't failed to deliver it yet
+                assigned = {}
+                for rfc_number in pending:
+                    untried = [entry for entry in holders[rfc_number] if (entry.hostname, entry.upload_port_number) not in tried[rfc_number]]
+                    if not untried:
+                        continue
+                    entry = min(untried, key=lambda e: len(assigned.get((e.hostname, e.upload_port_number), ())))
+                    address = (entry.hostname, entry.upload_port_number)
+                    tried[rfc_number].add(address)
+                    assigned.setdefault(address, []).append(entry)
+
+                #split each peer's rfcs over at most per_peer connections
+                futures = []
+                for address, entries in assigned.items():
+                    lanes = min(per_peer, len(entries))
+                    for lane in range(lanes):
+                        futures.append(executor.submit(fetch, address, entries[lane::lanes]))
+                pending = [rfc_number for future in futures for rfc_number in future.result()]
+
+        if on_result is not None:
+            for rfc_number in rfc_numbers:
+                if rfc_number not in downloaded:
+                    on_result(rfc_number, None)
+        return downloaded
+
+    #build an RFC from a GET response. returns None unless the response is a 200. _get_from_peer has already checked
+    #the body against its digest
+    @staticmethod
+    def _rfc_from_response(rfc_number: str, title: str, response: bytes):
+        res = parsing.parse_response_bytes(response)
+        if res.status_code != "200":
+            return None
+        return RFC(rfc_number, title, res.headers["Last-Modified"], len(res.body), res.headers["Content-Type"], str(res.body, "utf-8"),
+                   digest=parsing.parse_digest(res.headers.get("Digest")))
     
+    #send GET requests for all of rfc_numbers to one upload server and read the responses in order. the requests
+    #are pipelined over a single pooled connection, which is kept for later downloads if the server allows it.
+    #ranges optionally gives a (start, end) byte range to ask for with each rfc number. timeout limits how long
+    #any one send or receive may take; a timeout raises socket.timeout and the connection is dropped. every body is
+    #decompressed and hashed as it arrives and returned as if it had been sent uncompressed. a whole rfc that can't
+    #be decoded or doesn't match the Digest header it came with is returned as None
+    def _get_from_peer(self, host: str, upload_port, rfc_numbers: list, ranges: list = None, timeout: float = None) -> list:
+        heads = []
+        for i, rfc_number in enumerate(rfc_numbers):
+            head = "GET {} {}\nHost: {}\nOS: {}\nConnection: keep-alive\nAccept-Encoding: {}\n".format(rfc_number, self.P2P_VERSION, host, OS_NAME, compression.ACCEPT_ENCODING)
+            if ranges is not None:
+                head += "Range: bytes={}-{}\n".format(ranges[i][0], ranges[i][1])
+            heads.append(socket_helper.encode_message(head))
+        requests = b"".join(heads)
+        while True:
+            connection = self.pool.acquire(host, upload_port)
+            connection.sock.settimeout(timeout if timeout is not None else self.pool.connect_timeout)
+            responses = []
+            try:
+                start = time.perf_counter()
+                connection.sock.sendall(requests)
+                for _ in rfc_numbers:
+                    decoder = compression.BodyDecoder()
+                    response = connection.reader.read_message(decoder.start)
+                    if response is None:
+                        raise ConnectionError("upload server closed the connection")
+                    #a busy upload server answers once and closes the connection, every request got the same answer
+                    if response.startswith(BUSY_STATUS):
+                        responses += [response] * (len(rfc_numbers) - len(responses))
+                        break
+                    last = response
+                    #the latency of a download is counted from sending the batch, so it includes waiting behind
+                    #the downloads pipelined before it
+                    self.metrics.observe("downloads", time.perf_counter() - start, {"downloads.bytes": len(response)})
+                    response = decoder.decoded_message(response)
+                    if response is None or not self._digest_matches(response, decoder.digest()):
+                        self.metrics.add("downloads.corrupt")
+                        response = None
+                    responses.append(response)
+            except socket.timeout:
+                #the upload server is too slow, don't wait for it all over again on a new connection
+                connection.close()
+                raise
+            except OSError:
+                connection.close()
+                #an idle connection from the pool may have been closed by the upload server, so try a fresh one
+                if connection.reused:
+                    continue
+                raise
+            keep_alive = socket_helper.header_value(responses[-1] or last, b"Connection") == b"keep-alive"
+            self.pool.release(connection, keep_alive)
+            return responses
+
+    #False if a response holding a whole rfc came with a Digest header other than the digest of its body. ranged
+    #responses carry the digest of the whole content, which is checked once every range is in
+    @staticmethod
+    def _digest_matches(response: bytes, digest: str) -> bool:
+        if not response.startswith(OK_STATUS):
+            return True
+        sent = socket_helper.header_value(response, b"Digest")
+        expected = parsing.parse_digest(sent.decode()) if sent is not None else None
+        return expected is None or expected == digest
+
+    #the server's metrics, written out as the 1.0 STATS response
+    def stats_cmd(self) -> str:
+        with self.server_lock:
+            if self.decoder is not None:
+                self.server_socket.sendall(binary_protocol.encode_request(binary_protocol.STATS))
+                (status_code, _, _) = self._read_frame()
+                return self._response_text(self.server_version, status_code, [], self.decoder.text if status_code == 200 else "")
+            msg = "STATS ALL {}\nHost: {}\nPort: {}\n".format(self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port)
+            socket_helper.send_message(self.server_socket, msg)
+            return self._read_response().decode()
+
+    #tell the server this peer is still alive. returns the seconds the server's lease lasts, or None if the server
+    #keeps peers registered without heartbeats
+    def heartbeat_cmd(self) -> float:
+        with self.server_lock:
+            if self.decoder is not None:
+                self.server_socket.sendall(binary_protocol.encode_request(binary_protocol.HEARTBEAT))
+                (status_code, _, _) = self._read_frame()
+                lease = self.decoder.lease if status_code == 200 else None
+            else:
+                msg = "HEARTBEAT - {}\nHost: {}\nPort: {}\n".format(self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port)
+                socket_helper.send_message(self.server_socket, msg)
+                res = parsing.parse_response_bytes(self._read_response())
+                lease = float(res.headers["Lease"]) if res.status_code == "200" and "Lease" in res.headers else None
+        if not lease: #a server without leases, or with leases turned off
+            return None
+        return lease
+
+    #send a HEARTBEAT every third of the lease, so the server keeps this peer registered however long it stays idle
+    def _heartbeat(self):
+        interval = 0 #the first one is sent straight away to learn the lease
+        while not self.closed.wait(interval):
+            try:
+                lease = self.heartbeat_cmd()
+            except (OSError, ValueError, TypeError): #the connection is gone
+                return
+            if lease is None:
+                return
+            interval = lease / 3
+
     def exit_cmd(self):
-        msg = "EXIT - {}\nHost: {}\nPort: {}\n".format(self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port)
-        self.server_socket.send(msg.encode())
+        self.closed.set()
+        with self.server_lock:
+            if self.decoder is not None:
+                self.server_socket.sendall(binary_protocol.encode_request(binary_protocol.EXIT))
+                return
+            msg = "EXIT - {}\nHost: {}\nPort: {}\n".format(self.P2P_VERSION, self.upload_socket_host, self.upload_socket_port)
+            socket_helper.send_message(self.server_socket, msg)
+
+arg_parser = argparse.ArgumentParser(description="P2P-CI peer")
+arg_parser.add_argument("--store", help="A directory to keep RFC contents in. The RFCs in it are shared again the next time the peer starts")
+arg_parser.add_argument("--binary", action="store_true", help="Talk to the server with the compact binary protocol (P2P-CI/2.0) if it supports it")
+arg_parser.add_argument("--max-uploads", type=int, default=Peer.MAX_UPLOADS, help="How many downloads the peer serves at once. Other peers are told it is busy once that many more are waiting")
+arg_parser.add_argument("--upload-rate", type=float, help="Cap the upload server at this many kilobytes per second across all downloads, leaving room for the peer's other traffic")
+arg_parser.add_argument("--peer-upload-rate", type=float, help="Cap the upload server at this many kilobytes per second to any one peer")
+arg_parser.add_argument("--compression", choices=list(compression.ENCODINGS) + ["none"], default="deflate", help="How the peer compresses the RFCs it uploads, for downloaders that accept it")
+arg_parser.add_argument("--log-level", choices=diagnostics.LOG_LEVELS, default="info", help="debug logs every connection to the upload server")
+arg_parser.add_argument("--stats-interval", type=float, help="Log the peer's metrics every this many seconds")
+arg_parser.add_argument("--cache-ttl", type=float, help="Keep a copy of the server's index that answers list and lookup, and sync it with the server when it is older than this many seconds")
 
 def main():
-    peer = Peer.with_random_rfcs(4)
+    args = arg_parser.parse_args()
+    diagnostics.setup_logging(args.log_level)
+    #SIGUSR1 and SIGUSR2 switch profiling on and off too, like on the server
+    diagnostics.install_signal_handlers()
+    peer = Peer.with_random_rfcs(4, store_dir=args.store, binary=args.binary, index_cache_ttl=args.cache_ttl, max_uploads=args.max_uploads,
+                                upload_rate=args.upload_rate * 1024 if args.upload_rate else None,
+                                peer_upload_rate=args.peer_upload_rate * 1024 if args.peer_upload_rate else None,
+                                compression=args.compression if args.compression != "none" else None)
 
     #define a handler for ctrl+c
     def sigint_handler(signum, frame):
@@ -175,6 +832,14 @@ def main():
         exit(1)
 
     signal.signal(signal.SIGINT, sigint_handler)
+    if args.stats_interval:
+        peer.metrics.dump_every(args.stats_interval, peer.closed)
+
+    #notifications come in on a background thread while the user may be typing
+    def print_notification(entry, added):
+        change = "is now available from" if added else "is no longer available from"
+        print("\n{} {} {} {} {}\ncmd> ".format(entry.rfc_number, entry.rfc_title, change, entry.hostname, entry.upload_port_number), end="")
+    peer.on_notify = print_notification
 
     peer.start_upload_server()
 
@@ -190,12 +855,7 @@ def main():
         response = ""
         if args.command == "add":
             #if the rfc does not exist locally, dont do the add_cmd and let the user know
-            rfc_exists = False
-            for rfc in peer.rfcs:
-                if rfc.rfc_number == args.rfc and rfc.title == args.title:
-                    rfc_exists = True
-                    break
-            if rfc_exists:
+            if peer.rfcs.find(args.rfc, args.title) is not None:
                 response = peer.add_cmd(args.rfc, args.title)
             else:
                 response = "The specified RFC does not exist locally on this system."
@@ -205,9 +865,49 @@ def main():
             if args.local:
                 response = peer.list_local()
             else:
-                response = peer.list_cmd()
+                #print the index as it streams in instead of waiting for all of it
+                listed = False
+                for rfc in peer.iter_list(args.pattern, args.limit, args.after):
+                    print(peer._rfc_line(rfc))
+                    listed = True
+                if not listed:
+                    response = "No RFCs in index."
         elif args.command == "get":
-            response = peer.get_cmd(args.rfc, args.host)
+            if args.batch is not None:
+                try:
+                    with open(args.batch) as batch_file:
+                        rfc_numbers = [line.strip() for line in batch_file if line.strip()]
+                except OSError as ex:
+                    print(ex)
+                    continue
+                def report(rfc_number, rfc):
+                    print("{}: {}".format(rfc_number, "downloaded" if rfc is not None else "not found"))
+                downloaded = peer.get_many(rfc_numbers, on_result=report)
+                response = "Downloaded {} of {} RFCs".format(len(downloaded), len(set(rfc_numbers)))
+            elif args.swarm and args.rfc is not None:
+                rfc = SwarmDownloader(peer).download(args.rfc)
+                response = str(rfc) if rfc is not None else "The RFC could not be downloaded from any peer"
+            elif args.rfc is None or args.host is None:
+                response = "get needs an rfc and a host, or --batch"
+            else:
+                response = peer.get_cmd(args.rfc, args.host)
+        elif args.command == "subscribe" or args.command == "unsubscribe":
+            if (args.rfc is None) == (args.title is None):
+                response = "{} needs either an rfc or --title".format(args.command)
+            elif args.command == "subscribe":
+                response = peer.subscribe_cmd(args.rfc, args.title)
+            else:
+                response = peer.unsubscribe_cmd(args.rfc, args.title)
+        elif args.command == "stats":
+            response = peer.metrics.render() if args.local else peer.stats_cmd()
+        elif args.command == "profile":
+            if args.what == "cpu" and diagnostics.profiler.profiling:
+                response = "Profiling off, profile written to {}".format(diagnostics.profiler.stop_profiling())
+            elif args.what == "cpu":
+                diagnostics.profiler.start_profiling()
+                response = "Profiling on"
+            else:
+                response = "Memory tracing on" if diagnostics.profiler.toggle_tracing() else "Memory tracing off"
         elif args.command == "help":
             parsing.user_cmd_parser.print_help()
         elif args.command == "details": #print info about this peer
@@ -215,14 +915,15 @@ def main():
                 response = "Upload Server Host: {}\nUpload Server Port: {}\n".format(peer.upload_socket_host, peer.upload_socket_port)
             else:
                 #if not self, look for the rfc specified
-                for rfc in peer.rfcs:
-                    if rfc.rfc_number == args.what:
-                       response = str(rfc)
-                if response == "": #no rfc found
+                rfc = peer.rfcs.get(args.what)
+                if rfc is not None:
+                    response = str(rfc)
+                else: #no rfc found
                     response = "The RFC specified does not exist"
         elif args.command == "exit":
             peer.exit_cmd()
             peer.server_socket.close()
+            peer.stop_upload_server()
             peer.upload_socket.close()
             quit()
         else:
@@ -0,0 +1,63 @@
+import datetime
+import platform
+import threading
+import time
+import parsing
+
+#the OS header never changes while a peer runs, so it is only worked out once
+OS_NAME = platform.platform()
+
+#builds the bytes of upload server responses without redoing work that rarely changes. the status line, Date and
+#OS headers are rendered at most once a second for each status, and the headers describing an rfc are rendered
+#once and reused until the rfc is replaced, changed or its content moves
+class ResponseBuilder:
+    def __init__(self, version: str):
+        self.version = version
+        self.lock = threading.Lock()
+        #the second the cached heads were rendered in
+        self.second = None
+        #(status_code, phrase, keep_alive) -> rendered status line, Date, OS and Connection headers
+        self.heads = {}
+        #rfc_number -> (rfc, content, content_path, last_modified, content_type, rendered headers)
+        self.rfc_headers_cache = {}
+
+    #the status line and the headers every response has, without the empty line that ends the headers
+    def head(self, status_code: int, phrase: str, keep_alive: bool = False) -> bytes:
+        now = int(time.time())
+        key = (status_code, phrase, keep_alive)
+        with self.lock:
+            if now != self.second:
+                self.second = now
+                self.heads = {}
+            head = self.heads.get(key)
+            if head is None:
+                date = datetime.datetime.fromtimestamp(now, datetime.timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")
+                head = "{} {} {}\nDate: {}\nOS: {}\n".format(self.version, status_code, phrase, date, OS_NAME)
+                if keep_alive:
+                    head += "Connection: keep-alive\n"
+                head = head.encode()
+                self.heads[key] = head
+            return head
+
+    #a whole response that has no body
+    def message(self, status_code: int, phrase: str, keep_alive: bool = False) -> bytes:
+        return self.head(status_code, phrase, keep_alive) + b"\n"
+
+    #the headers describing an rfc's whole content, ending with the empty line that ends the headers. the Digest
+    #header lets the downloader check it got exactly that content. the cached copy is only used while it was
+    #rendered for the very same rfc object, content and metadata
+    def rfc_headers(self, rfc) -> bytes:
+        cached = self.rfc_headers_cache.get(rfc.rfc_number)
+        if cached is not None and cached[0] is rfc and cached[1] is rfc.content and cached[2] == rfc.content_path \
+                and cached[3] == rfc.last_modified and cached[4] == rfc.content_type:
+            return cached[5]
+        headers = "Last-Modified: {}\nContent-Type: {}\nContent-Length: {}\nDigest: {}\n\n".format(
+            rfc.last_modified, rfc.content_type, rfc.content_size(), parsing.format_digest(rfc.content_digest())).encode()
+        self.rfc_headers_cache[rfc.rfc_number] = (rfc, rfc.content, rfc.content_path, rfc.last_modified, rfc.content_type, headers)
+        return headers
+
+    #the headers describing an rfc's content sent compressed: the Content-Length is the size of the compressed body
+    #and the Digest is still of the content itself
+    def encoded_rfc_headers(self, rfc, encoding: str, length: int) -> bytes:
+        return "Last-Modified: {}\nContent-Type: {}\nContent-Encoding: {}\nContent-Length: {}\nDigest: {}\n\n".format(
+            rfc.last_modified, rfc.content_type, encoding, length, parsing.format_digest(rfc.content_digest())).encode()
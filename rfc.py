@@ -1,15 +1,46 @@
+import hashlib
 import random
 import string
 from datetime import datetime
 
+#the sha-256 in hex of some content. rfcs with the same content have the same digest whatever their number
+def content_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
 class RFC:
-    def __init__(self, rfc_number, title, last_modified, content_length, content_type, content):
+    #no per object __dict__, a peer can hold a great many of these
+    __slots__ = ("rfc_number", "title", "last_modified", "content_length", "content_type", "content", "content_path", "digest")
+
+    #content_path is set instead of content when the content lives in a file of a ContentStore. digest is the
+    #sha-256 of the content in hex, worked out the first time it is needed if it isn't given
+    def __init__(self, rfc_number, title, last_modified, content_length, content_type, content, content_path = None, digest = None):
         self.rfc_number = rfc_number
         self.title = title
         self.last_modified = last_modified
         self.content_length = content_length
         self.content_type = content_type
         self.content = content
+        self.content_path = content_path
+        self.digest = digest
+
+    #the content as bytes, read from its file if it is stored on disk
+    def read_content(self) -> bytes:
+        if self.content_path is not None:
+            with open(self.content_path, "rb") as f:
+                return f.read()
+        return self.content.encode()
+
+    #the size of the content in bytes
+    def content_size(self) -> int:
+        if self.content_path is not None:
+            return self.content_length
+        return len(self.content.encode())
+
+    #the sha-256 of the content in hex. rfcs never change their content, so it is only hashed once
+    def content_digest(self) -> str:
+        if self.digest is None:
+            self.digest = content_digest(self.read_content())
+        return self.digest
 
     #initialize an rfc with a non random number and title
     @classmethod
@@ -19,18 +50,19 @@ class RFC:
         rfc.title = title
         return rfc
 
+    #rng is the random.Random the data is drawn from, pass a seeded one to get the same rfc every time
     @staticmethod
-    def generate_random_rfc():
+    def generate_random_rfc(rng = random):
         #generate random data for the RFC object
-        rfc_number = "RFC " + str(random.randint(100, 999))
-        rfc_title = "Random Title " + str(random.randint(1, 1000000))
-        last_modified = datetime.fromtimestamp(random.randint(0, 1000000000)).strftime("%a, %d %b %Y %H:%M:%S GMT")
-        content_length = random.randint(100, 1000)
-        content_type = random.choice(["text/plain", "application/pdf", "image/jpeg"])
-        content = ''.join(random.choices(string.ascii_uppercase + string.digits, k=content_length))
+        rfc_number = "RFC " + str(rng.randint(100, 999))
+        rfc_title = "Random Title " + str(rng.randint(1, 1000000))
+        last_modified = datetime.fromtimestamp(rng.randint(0, 1000000000)).strftime("%a, %d %b %Y %H:%M:%S GMT")
+        content_length = rng.randint(100, 1000)
+        content_type = rng.choice(["text/plain", "application/pdf", "image/jpeg"])
+        content = ''.join(rng.choices(string.ascii_uppercase + string.digits, k=content_length))
 
         #create and return an RFC object with the random data
         return RFC(rfc_number, rfc_title, last_modified, content_length, content_type, content)
     
     def __str__(self) -> str:
-        return "RFC-Number: {}\nRFC-Title: {}\nLast-Modified: {}\nContent-Length: {}\nContent-Type: {}\n\n{}\n".format(self.rfc_number, self.title, self.last_modified, self.content_length, self.content_type, self.content)
\ No newline at end of file
+        return "RFC-Number: {}\nRFC-Title: {}\nLast-Modified: {}\nContent-Length: {}\nContent-Type: {}\n\n{}\n".format(self.rfc_number, self.title, self.last_modified, self.content_length, self.content_type, self.read_content().decode())
\ No newline at end of file
@@ -0,0 +1,228 @@
+import bisect
+import random
+import threading
+from jsobject import JSObject
+
+#index of the rfcs known by the server. entries are keyed by rfc number (and by rfc number + title)
+#with a reverse map from each peer to its entries so that lookups and peer removal never scan the whole index.
+#every change bumps the index version and is kept in a bounded change log, so a peer that mirrors the index can
+#catch up with just the changes since the version it last saw. on_change(entry, added) is called after every
+#change, outside the lock, so it can do slow things like writing to sockets
+class RFCIndex:
+    #how many of the latest changes are kept. a peer that is further behind than this gets the whole index again
+    CHANGE_LOG_SIZE = 100000
+
+    def __init__(self, change_log_size: int = CHANGE_LOG_SIZE, on_change = None):
+        self.lock = threading.Lock()
+        #every entry, keyed by (rfc_number, rfc_title, peer_hostname, peer_port)
+        self.entries = {}
+        #rfc_number -> {entry key: entry}
+        self.by_number = {}
+        #(rfc_number, rfc_title) -> {entry key: entry}
+        self.by_title = {}
+        #(peer_hostname, peer_port) -> {entry key: entry}. a registered peer with no rfcs maps to an empty dict
+        self.by_peer = {}
+        #every rfc number in the index, sorted so it can be walked in pages and by prefix. changes don't keep it
+        #sorted, which would cost O(n) each: a new rfc number goes into unsorted and a removed one is left in
+        #place (stale). it is brought up to date by the first walk after a change, see _sort_numbers
+        self.numbers = []
+        self.unsorted = set()
+        self.stale = False
+        #identifies this index, so a version from an index the server had before it restarted is never trusted
+        self.epoch = random.randint(1, 2**31 - 1)
+        #bumped by every change
+        self.version = 0
+        #(entry key, entry, added) for the latest changes, oldest first. the last one is the change to self.version
+        self.changes = []
+        self.change_log_size = change_log_size
+        self.on_change = on_change
+
+    def __len__(self):
+        return len(self.entries)
+
+    #add a peer to the registered peers
+    def register_peer(self, peer_hostname: str, peer_port):
+        with self.lock:
+            self.by_peer.setdefault((peer_hostname, peer_port), {})
+
+    def is_registered(self, peer_hostname: str, peer_port) -> bool:
+        return (peer_hostname, peer_port) in self.by_peer
+
+    def peers(self) -> list:
+        with self.lock:
+            return list(self.by_peer)
+
+    #add an rfc to the index. digest is the sha-256 of the content the peer has, in hex, or None if it didn't say.
+    #adding the same rfc for the same peer twice keeps a single entry, with the digest it was added with last
+    def add(self, rfc_number: str, rfc_title: str, peer_hostname: str, peer_port, digest: str = None):
+        key = (rfc_number, rfc_title, peer_hostname, peer_port)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if digest is None or entry.digest == digest:
+                    return entry
+                #the peer's content changed, which mirrors and subscribers hear about like a new entry
+                entry.digest = digest
+            else:
+                entry = JSObject(**{
+                    'rfc_number': rfc_number,
+                    'rfc_title': rfc_title,
+                    'peer_hostname': peer_hostname,
+                    'peer_port': peer_port,
+                    'digest': digest
+                })
+                self.entries[key] = entry
+                if rfc_number not in self.by_number:
+                    self.unsorted.add(rfc_number)
+                self.by_number.setdefault(rfc_number, {})[key] = entry
+                self.by_title.setdefault((rfc_number, rfc_title), {})[key] = entry
+                self.by_peer.setdefault((peer_hostname, peer_port), {})[key] = entry
+            self._log_change(key, entry, True)
+        if self.on_change is not None:
+            self.on_change(entry, True)
+        return entry
+
+    #remove a single entry. returns the removed entry, or None if it wasn't in the index
+    def remove(self, rfc_number: str, rfc_title: str, peer_hostname: str, peer_port):
+        key = (rfc_number, rfc_title, peer_hostname, peer_port)
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            self._unlink(key, entry)
+            self._discard(self.by_peer, (peer_hostname, peer_port), key, keep_empty=True)
+            self._log_change(key, entry, False)
+        if self.on_change is not None:
+            self.on_change(entry, False)
+        return entry
+
+    #find every entry for an rfc number. an empty title matches any title
+    def lookup(self, rfc_number: str, rfc_title: str = "") -> list:
+        with self.lock:
+            if rfc_title == "":
+                matches = self.by_number.get(rfc_number)
+            else:
+                matches = self.by_title.get((rfc_number, rfc_title))
+            return list(matches.values()) if matches else []
+
+    #find every entry for each of the rfc numbers, taking the lock once
+    def lookup_many(self, rfc_numbers: list) -> list:
+        matches = []
+        with self.lock:
+            for rfc_number in rfc_numbers:
+                entries = self.by_number.get(rfc_number)
+                if entries:
+                    matches.extend(entries.values())
+        return matches
+
+    #walk the entries whose rfc number starts with prefix, in rfc number order. the lock is only held while a
+    #batch of rfc numbers is copied out, so walking a huge index needs a bounded amount of memory and never blocks
+    #adds for long. when after is given the walk starts after that rfc number. limit stops the walk once that many
+    #entries were produced, but always finishes the current rfc number so a page can be continued with after
+    def iter_entries(self, prefix: str = "", after: str = None, limit: int = None, batch_size: int = 256):
+        produced = 0
+        while True:
+            with self.lock:
+                if self.unsorted or self.stale:
+                    self._sort_numbers()
+                start = bisect.bisect_left(self.numbers, prefix)
+                if after is not None:
+                    start = max(start, bisect.bisect_right(self.numbers, after))
+                batch = []
+                done = True
+                for rfc_number in self.numbers[start:start + batch_size]:
+                    if not rfc_number.startswith(prefix) or (limit is not None and produced >= limit):
+                        break
+                    entries = self.by_number[rfc_number].values()
+                    batch.extend(entries)
+                    produced += len(entries)
+                    after = rfc_number
+                else:
+                    done = start + batch_size >= len(self.numbers)
+            yield from batch
+            if done:
+                return
+
+    #remove a peer and every entry it registered. returns the removed entries
+    def remove_peer(self, peer_hostname: str, peer_port) -> list:
+        return self.remove_peers([(peer_hostname, peer_port)])
+
+    #remove many peers and every entry they registered, taking the lock once. returns the removed entries
+    def remove_peers(self, peers: list) -> list:
+        removed = []
+        with self.lock:
+            for peer in peers:
+                peer_entries = self.by_peer.pop(peer, None)
+                if not peer_entries:
+                    continue
+                for key, entry in peer_entries.items():
+                    del self.entries[key]
+                    self._unlink(key, entry)
+                    self._log_change(key, entry, False)
+                removed.extend(peer_entries.values())
+        if self.on_change is not None:
+            for entry in removed:
+                self.on_change(entry, False)
+        return removed
+
+    #the changes since the given version of this index (which has to have the given epoch), with only the last
+    #change to each entry kept. returns (current version, [(entry, added)]). the list is None when the changes
+    #can't be told, because the version is too old, from the future or from another epoch, and the whole index
+    #has to be fetched again instead
+    def changes_since(self, epoch: int, version: int):
+        with self.lock:
+            current = self.version
+            if epoch != self.epoch or version > current or version < current - len(self.changes):
+                return (current, None)
+            recent = self.changes[len(self.changes) - (current - version):]
+        latest = {}
+        for key, entry, added in recent:
+            latest[key] = (entry, added)
+        return (current, list(latest.values()))
+
+    #the epoch and version of the index and a walk over every entry in it. entries added or removed during the walk
+    #may or may not be seen, but replaying changes_since(version) on top of the walk always gives the right index
+    def snapshot(self):
+        with self.lock:
+            (epoch, version) = (self.epoch, self.version)
+        return (epoch, version, self.iter_entries())
+
+    #drop an entry that was just removed from self.entries from the number and title maps. the lock must be held
+    def _unlink(self, key, entry):
+        if self._discard(self.by_number, entry.rfc_number, key):
+            self.stale = True
+        self._discard(self.by_title, (entry.rfc_number, entry.rfc_title), key)
+
+    #drop the removed rfc numbers from self.numbers and merge in the new ones, in O(n + k log k) for k new numbers:
+    #sort() finds the two sorted runs and merges them. a number removed and added again since the last sort is in
+    #both, so its old place is dropped. the lock must be held
+    def _sort_numbers(self):
+        numbers = [rfc_number for rfc_number in self.numbers if rfc_number in self.by_number and rfc_number not in self.unsorted]
+        numbers.extend(sorted(rfc_number for rfc_number in self.unsorted if rfc_number in self.by_number))
+        numbers.sort()
+        self.numbers = numbers
+        self.unsorted.clear()
+        self.stale = False
+
+    #record a change and bump the version. the lock must be held
+    def _log_change(self, key, entry, added: bool):
+        self.version += 1
+        if self.change_log_size == 0:
+            return
+        self.changes.append((key, entry, added))
+        #trimmed in bulk so that each change costs O(1) on average
+        if len(self.changes) >= 2 * self.change_log_size:
+            del self.changes[:len(self.changes) - self.change_log_size]
+
+    #remove a key from one of the secondary maps, dropping the bucket once it is empty unless keep_empty is set.
+    #returns True if it was dropped
+    @staticmethod
+    def _discard(secondary: dict, bucket_key, key, keep_empty: bool = False):
+        bucket = secondary.get(bucket_key)
+        if bucket is None:
+            return False
+        bucket.pop(key, None)
+        if not bucket and not keep_empty:
+            del secondary[bucket_key]
+            return True
+        return False
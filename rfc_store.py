@@ -0,0 +1,130 @@
+import threading
+from rfc import RFC
+
+#the rfcs a peer has locally, keyed by rfc number with secondary maps from title and from content digest to rfcs.
+#the upload server looks rfcs up from many threads while downloads add to it, so every change happens under a
+#lock. lookups are single dict reads, which are atomic, so they don't need to take it. with a content_store, the
+#library already in it is loaded and the content of every rfc that is added is moved to disk. without one, rfcs
+#with the same content share a single copy of it in memory
+class RFCStore:
+    def __init__(self, rfcs: list[RFC] = (), content_store = None):
+        self.lock = threading.Lock()
+        self.content_store = content_store
+        #rfc_number -> RFC
+        self.by_number = {}
+        #title -> RFC, or a tuple of RFCs when several share a title
+        self.by_title = {}
+        #digest -> RFC, or a tuple of RFCs with the same content
+        self.by_digest = {}
+        if content_store is not None:
+            for rfc in content_store.load():
+                self._insert(rfc)
+        for rfc in rfcs:
+            self.add(rfc)
+
+    def __len__(self):
+        return len(self.by_number)
+
+    def __contains__(self, rfc_number: str):
+        return rfc_number in self.by_number
+
+    #iterate over a snapshot, so other threads can keep adding rfcs meanwhile
+    def __iter__(self):
+        with self.lock:
+            rfcs = list(self.by_number.values())
+        return iter(rfcs)
+
+    #get the rfc with the given number, or None
+    def get(self, rfc_number: str):
+        return self.by_number.get(rfc_number)
+
+    #get the rfc with the given number and title, or None
+    def find(self, rfc_number: str, title: str):
+        rfc = self.by_number.get(rfc_number)
+        if rfc is None or rfc.title != title:
+            return None
+        return rfc
+
+    #every rfc with the given title
+    def with_title(self, title: str) -> list:
+        return self._bucket(self.by_title, title)
+
+    #every rfc whose content has the given digest
+    def with_digest(self, digest: str) -> list:
+        return self._bucket(self.by_digest, digest)
+
+    #add an rfc unless there already is one with the same number. returns True if it was added
+    def add(self, rfc: RFC) -> bool:
+        with self.lock:
+            if rfc.rfc_number in self.by_number:
+                return False
+            self._persist(rfc)
+            self._insert(rfc)
+            return True
+
+    #add an rfc, replacing any rfc with the same number
+    def replace(self, rfc: RFC):
+        with self.lock:
+            self._remove(rfc.rfc_number)
+            self._persist(rfc)
+            self._insert(rfc)
+
+    #remove the rfc with the given number. returns the removed rfc, or None
+    def remove(self, rfc_number: str):
+        with self.lock:
+            rfc = self._remove(rfc_number)
+            if rfc is not None and self.content_store is not None:
+                self.content_store.remove(rfc_number)
+            return rfc
+
+    #move the content to the content store, or in memory point it at the copy another rfc with the same content has
+    def _persist(self, rfc: RFC):
+        if self.content_store is not None:
+            self.content_store.put(rfc)
+            return
+        same = self.by_digest.get(rfc.content_digest())
+        if same is not None and rfc.content_path is None:
+            rfc.content = (same if isinstance(same, RFC) else same[0]).content
+
+    def _insert(self, rfc: RFC):
+        self.by_number[rfc.rfc_number] = rfc
+        self._link(self.by_title, rfc.title, rfc)
+        self._link(self.by_digest, rfc.content_digest(), rfc)
+
+    def _remove(self, rfc_number: str):
+        rfc = self.by_number.pop(rfc_number, None)
+        if rfc is None:
+            return None
+        self._unlink(self.by_title, rfc.title, rfc)
+        self._unlink(self.by_digest, rfc.content_digest(), rfc)
+        return rfc
+
+    #the rfcs under a key of a secondary map, which holds an RFC when there is one and a tuple when there are several.
+    #nearly every key has a single rfc, so this avoids a container per key
+    @staticmethod
+    def _bucket(secondary: dict, key) -> list:
+        found = secondary.get(key)
+        if found is None:
+            return []
+        if isinstance(found, RFC):
+            return [found]
+        return list(found)
+
+    @staticmethod
+    def _link(secondary: dict, key, rfc: RFC):
+        found = secondary.get(key)
+        if found is None:
+            secondary[key] = rfc
+        elif isinstance(found, RFC):
+            secondary[key] = (found, rfc)
+        else:
+            secondary[key] = found + (rfc,)
+
+    @staticmethod
+    def _unlink(secondary: dict, key, rfc: RFC):
+        found = secondary.get(key)
+        if found is rfc:
+            del secondary[key]
+        elif isinstance(found, tuple):
+            rest = tuple(other for other in found if other is not rfc)
+            secondary[key] = rest[0] if len(rest) == 1 else rest
@@ -1,103 +1,560 @@
+import argparse
+import collections
+import logging
+import os
 import socket
 import threading
+import time
 import parsing
-from jsobject import JSObject
+import socket_helper
+import binary_protocol
+import diagnostics
+from leases import LeaseTable
+from metrics import Metrics
+from rfc_index import RFCIndex
+from subscriptions import Subscriptions
 
 P2P_VERSION = "P2P-CI/1.0"
 SERVER_PORT = 7734
 SERVER_HOST = 'localhost'
+#how many pending connections the listening socket queues before refusing new ones
+LISTEN_BACKLOG = 1024
+#a streamed LIST response is written in chunks of about this many bytes
+LIST_CHUNK_SIZE = 16 * 1024
+#seconds a peer stays registered after its last request. peers send a HEARTBEAT when they have nothing else to say
+LEASE_SECONDS = 60
+#seconds between looks for peers whose lease ran out
+REAP_INTERVAL = 1.0
+#the biggest request body (or 2.0 frame) a peer may send. only batched lookups have bodies at all
+MAX_REQUEST_BODY = 1024 * 1024
 
-#stores registered peers with lock for thread safety
-peers_lock = threading.Lock()
-registered_peers = []
+arg_parser = argparse.ArgumentParser(description="P2P-CI central index server")
+arg_parser.add_argument("--mode", choices=["threaded", "asyncio", "sharded"], default="threaded", help="threaded starts a thread per peer, asyncio serves every peer from a single event loop, sharded splits the index between worker processes that each serve peers with threads")
+arg_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes in sharded mode")
+arg_parser.add_argument("--host", default=SERVER_HOST, help="The host to listen on")
+arg_parser.add_argument("--port", type=int, default=SERVER_PORT, help="The port to listen on")
+arg_parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help="seconds a silent peer stays registered, 0 keeps peers until they disconnect")
+arg_parser.add_argument("--log-level", choices=diagnostics.LOG_LEVELS, default="info", help="debug logs every request, info every peer connecting and leaving")
+arg_parser.add_argument("--stats-interval", type=float, default=None, help="log the server's metrics every this many seconds")
 
-#index of rfsc with lock for thread safety
-rfcs_lock = threading.Lock()
-rfcs = []
+#named rather than __name__, which is __main__ when this file is run as the server
+log = logging.getLogger("server")
 
-#add an rfc to the index
-def add_rfc(rfc_number: str, rfc_title: str, peer_hostname: str, peer_port):
-    with rfcs_lock:
-        rfcs.append(JSObject(**{
-                'rfc_number': rfc_number,
-                'rfc_title': rfc_title,
-                'peer_hostname': peer_hostname,
-                'peer_port': peer_port
-            }))
+#peers waiting to hear about rfcs being added or removed
+subscriptions = Subscriptions()
+#index of rfcs and registered peers. it has its own lock for thread safety. every change is pushed to the
+#peers that subscribed to it
+index = RFCIndex(on_change=subscriptions.notify)
+#leases of the connected peers, keyed by their ClientSession
+leases = LeaseTable(LEASE_SECONDS)
+#request counts and latencies, bytes in and out and connections, answered to STATS requests
+metrics = Metrics()
+metrics.gauge("index.entries", lambda: len(index))
+#the metric the latency of each command is recorded under, by the command's bytes in 1.0 and its opcode in 2.0.
+#anything else is recorded as requests.OTHER, so a peer sending junk can't make up any number of metrics
+REQUEST_NAMES = {command.encode(): "requests." + command for command in binary_protocol.COMMANDS.values()}
+BINARY_REQUEST_NAMES = {opcode: "requests." + command for (opcode, command) in binary_protocol.COMMANDS.items()}
+
+#add an rfc to the index. digest is the sha-256 of the peer's content in hex, or None if it didn't send one
+def add_rfc(rfc_number: str, rfc_title: str, peer_hostname: str, peer_port, digest: str = None):
+    return index.add(rfc_number, rfc_title, peer_hostname, peer_port, digest)
 
 #remove all records of a peer from the system based on the hostname and peer port
 def remove_peer_from_system(peer_hostname: str, peer_port: int):
-    with rfcs_lock:
-        for rfc in rfcs:
-            if (rfc.peer_hostname == peer_hostname and rfc.peer_port == peer_port):
-                rfcs.remove(rfc)
-    with peers_lock:
-        for peer in registered_peers:
-            if peer.peer_hostname == peer_hostname and peer.peer_port == peer_port:
-                registered_peers.remove(peer)
+    index.remove_peer(peer_hostname, peer_port)
 
 #add a peer to to the registered peers list
 def register_peer(peer_hostname: str, peer_port: int):
-    with peers_lock:
-        registered_peers.append(JSObject(**{
-                'peer_hostname': peer_hostname,
-                'peer_port': peer_port
-            }))
+    index.register_peer(peer_hostname, peer_port)
+
+#remove every peer whose lease ran out from the index in one go and close their connections. returns how many
+#peers were reaped
+def reap_expired_peers() -> int:
+    expired = leases.pop_expired()
+    if not expired:
+        return 0
+    index.remove_peers([session.peer for (session, _) in expired])
+    metrics.add("leases.expired", len(expired))
+    for (session, close) in expired:
+        log.info("Lease expired for host: %s port: %s", *session.peer)
+        try:
+            close()
+        except OSError: #already gone
+            pass
+    return len(expired)
+
+#look for expired leases every REAP_INTERVAL seconds, forever
+def reap_forever():
+    while True:
+        time.sleep(REAP_INTERVAL)
+        reap_expired_peers()
+
+#register the peer that sent the INIT request. returns the host and upload port of the peer, the protocol version
+#it asked to upgrade to (None if it didn't ask) and whether it asked for the digests of the rfcs in the index with
+#a "Want-Digest: sha-256" header. peers that didn't ask get entries in the old format. returns None, registering
+#nothing, if the request has no Host or its Port isn't a port number
+def init_client(init_request: bytes, init_msg: parsing.Request = None):
+    init_msg = init_msg if init_msg is not None else parsing.parse_request_bytes(init_request)
+    client_host = init_msg.headers.get("Host")
+    client_port = parsing.parse_port(init_msg.headers.get("Port"))
+    if not client_host or client_port is None:
+        log.warning("Received a malformed INIT request:\n%s\n", init_request.decode(errors="replace"))
+        return None
+    register_peer(client_host, client_port)
+    log.info("Received connection from host: %s port: %s", client_host, client_port)
+    digests = "sha-256" in init_msg.headers.get("Want-Digest", "").lower()
+    return (client_host, client_port, init_msg.headers.get("Upgrade"), digests)
+
+#the answer to an INIT that asked to upgrade to another protocol version. an INIT without an Upgrade header gets
+#no answer at all, like it always has, so 1.0 peers see no difference
+def upgrade_response(version: str) -> bytes:
+    if version == binary_protocol.VERSION:
+        return socket_helper.encode_message("{} 101 Switching Protocols\nUpgrade: {}\n".format(P2P_VERSION, version))
+    #a version this server doesn't speak, so the connection stays on 1.0
+    return response_msg("200 OK")
+
+#log a request at debug level. it is only decoded if debug messages are logged
+def log_request(command: str, request_bytes: bytes):
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Received %s request:\n%s\n", command, request_bytes.decode(errors="replace"))
+
+#the name the latency of a request is recorded under
+def request_name(request: bytes, binary: bool) -> str:
+    if binary:
+        return BINARY_REQUEST_NAMES.get(request[0] if request else None, "requests.OTHER")
+    return REQUEST_NAMES.get(request[:request.find(b" ")], "requests.OTHER")
+
+#record one request that took seconds to answer and was answered with bytes_out bytes
+def record_request(request: bytes, binary: bool, bytes_out: int, seconds: float):
+    metrics.observe(request_name(request, binary), seconds, {"bytes.in": len(request), "bytes.out": bytes_out})
+
+#frame a response to a peer with the given status (for example "200 OK") and body
+def response_msg(status: str, body: str = "") -> bytes:
+    return socket_helper.encode_message("{} {}\n".format(P2P_VERSION, status), body.encode())
+
+#one "rfc_number rfc_title hostname upload_port" line of a response, ended by a newline. with digests the digest
+#of the peer's content follows as "sha-256=<hex>" when the peer sent one
+def entry_line(entry, digests: bool = False) -> str:
+    if digests and entry.digest is not None:
+        return "{} {} {} {} {}\n".format(entry.rfc_number, entry.rfc_title, entry.peer_hostname, entry.peer_port, parsing.format_digest(entry.digest))
+    return "{} {} {} {}\n".format(entry.rfc_number, entry.rfc_title, entry.peer_hostname, entry.peer_port)
+
+#stream the entries matching a LIST pattern as a chunked response. the pattern is either ALL, a prefix ending
+#with * (for example "RFC 1*") or a single rfc number. the index is walked in pages and written in bounded chunks,
+#so the server never holds the whole listing in memory no matter how big the index is
+def list_response(pattern: str, limit: int = None, after: str = None, digests: bool = False):
+    yield socket_helper.encode_message("{} 200 OK\nTransfer-Encoding: chunked\n".format(P2P_VERSION))
+    lines = (entry_line(rfc, digests).encode() for rfc in list_entries(pattern, limit, after))
+    yield from chunked_lines(lines)
+
+#group encoded lines into chunks of about LIST_CHUNK_SIZE bytes, followed by the empty chunk ending the body
+def chunked_lines(lines):
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= LIST_CHUNK_SIZE:
+            yield socket_helper.encode_chunk(b"".join(chunk))
+            chunk = []
+            size = 0
+    if chunk:
+        yield socket_helper.encode_chunk(b"".join(chunk))
+    yield socket_helper.encode_chunk(b"")
+
+#the changes a peer needs to bring its mirror of the index from the given epoch and version up to date. returns
+#(epoch, version, full, changes) where changes are (entry, added) pairs. when the index can't tell what changed
+#since that version, full is True and changes adds every entry of the index
+def sync_changes(epoch: int, version: int):
+    (current, changes) = index.changes_since(epoch, version)
+    if changes is not None:
+        return (index.epoch, current, False, changes)
+    (epoch, current, entries) = index.snapshot()
+    return (epoch, current, True, ((entry, True) for entry in entries))
+
+#stream the answer to a SYNC as a chunked response. each line is ADD or REMOVE followed by an entry
+def sync_response(epoch: int, version: int, digests: bool = False):
+    (epoch, version, full, changes) = sync_changes(epoch, version)
+    yield socket_helper.encode_message("{} 200 OK\nIndex: {}\nVersion: {}\nSync: {}\nTransfer-Encoding: chunked\n".format(
+        P2P_VERSION, epoch, version, "full" if full else "delta"))
+    lines = (("ADD " if added else "REMOVE ").encode() + entry_line(rfc, digests).encode() for (rfc, added) in changes)
+    yield from chunked_lines(lines)
+
+#the entries of the index matching a LIST pattern, walked in pages
+def list_entries(pattern: str, limit: int = None, after: str = None):
+    if pattern == "ALL":
+        return index.iter_entries("", after, limit)
+    elif pattern.endswith("*"):
+        return index.iter_entries(pattern[:-1], after, limit)
+    return index.lookup(pattern)
+
+#the connection to one peer as far as writing to it goes. the connection's own thread (or coroutine) handles a
+#request and writes its response between acquire() and release(). notifications for the peer's subscriptions come
+#from whichever thread made the change, and are only ever queued by it: they are written once the connection is
+#idle, so they never land in the middle of a response, and only by something that can wait on this peer alone.
+#here that is the thread that changed the index when write(data) never blocks (the asyncio server only buffers the
+#data), ThreadedSession has a thread of its own for them. a peer more than MAX_PENDING notifications behind, or with
+#more than MAX_BUFFERED bytes written to it but not yet sent (buffered() says how many, None when it can't be
+#told), has stopped reading and is dropped by calling drop(), which closes the connection without waiting.
+#digests says the peer asked for the digest of every entry it is sent
+class ClientSession:
+    MAX_PENDING = 4096
+    MAX_BUFFERED = 1024 * 1024
+
+    def __init__(self, write, encoder: binary_protocol.Encoder = None, peer: tuple = None, digests: bool = False,
+                 drop = None, buffered = None):
+        self.write = write
+        #(host, upload port) of the peer
+        self.peer = peer
+        #the connection's P2P-CI/2.0 encoder, None on 1.0
+        self.encoder = encoder
+        self.digests = digests
+        self.drop = drop
+        self.buffered = buffered
+        self.dropped = False
+        self.lock = threading.Lock()
+        #(entry, added) notifications waiting to be written
+        self.pending = collections.deque()
+
+    def acquire(self):
+        self.lock.acquire()
+
+    #write out the notifications that came in while the lock was held, then release it
+    def release(self):
+        while True:
+            try:
+                while self.pending:
+                    self.write(self.notification(*self.pending.popleft()))
+            finally:
+                self.lock.release()
+            #a notification may have been queued after the last check but before the lock was released
+            if not self.pending or not self.lock.acquire(blocking=False):
+                return
+
+    #called by Subscriptions.notify from any thread. never waits on the peer
+    def push(self, entry, added: bool):
+        if self.dropped:
+            return
+        if len(self.pending) >= self.MAX_PENDING or (self.buffered is not None and self.buffered() > self.MAX_BUFFERED):
+            self.dropped = True
+            self.pending.clear()
+            metrics.add("subscriptions.dropped")
+            log.warning("Dropping host: %s port: %s, it stopped reading its notifications", *self.peer)
+            if self.drop is not None:
+                try:
+                    self.drop()
+                except OSError: #already gone
+                    pass
+            return
+        self.pending.append((entry, added))
+        self.wake()
+
+    #get the queued notifications written. they are written here and now if no response is being written
+    def wake(self):
+        if self.lock.acquire(blocking=False):
+            try:
+                self.release()
+            except OSError: #the connection is gone, its own thread cleans up after it
+                pass
+
+    #the connection is closing, nothing more will be written to it
+    def close(self):
+        self.dropped = True
+
+    #the notification of an entry being added to or removed from the index. it is encoded only when it is written,
+    #as the 2.0 encoder must see frames in the order they are sent
+    def notification(self, entry, added: bool) -> bytes:
+        if self.encoder is not None:
+            return self.encoder.frame(200, [entry], flags=binary_protocol.NOTIFY | (0 if added else binary_protocol.REMOVED))
+        message = "NOTIFY {} {}\nChange: {}\nTitle: {}\nHost: {}\nPort: {}\n".format(
+            entry.rfc_number, P2P_VERSION, "ADD" if added else "REMOVE", entry.rfc_title, entry.peer_hostname, entry.peer_port)
+        if self.digests and entry.digest is not None:
+            message += "Digest: {}\n".format(parsing.format_digest(entry.digest))
+        return socket_helper.encode_message(message)
+
+#the session of a connection of the threaded server, where write(data) is a blocking sendall. notifications are
+#written by a thread of the session's own, started by the first one, so a peer that stops reading holds up no other
+#connection nor the lease reaper
+class ThreadedSession(ClientSession):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wakeup = threading.Event()
+        self.writer = None
+        #not the session lock, which the writer may hold for as long as the peer isn't reading
+        self.writer_lock = threading.Lock()
+
+    def wake(self):
+        if self.writer is None:
+            with self.writer_lock:
+                if self.writer is None:
+                    self.writer = threading.Thread(target=self._write_notifications, daemon=True)
+                    self.writer.start()
+        self.wakeup.set()
+
+    def close(self):
+        super().close()
+        self.wakeup.set()
+
+    def _write_notifications(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            if self.dropped:
+                return
+            self.acquire()
+            try:
+                self.release()
+            except OSError: #the connection is gone, its own thread cleans up after it
+                return
+
+#build the response to a single request from a peer. returns None once the peer has exited. the response is
+#either the bytes of a whole message or, for a streamed response, a generator of the pieces of the message
+#this is shared by every server mode so that they all speak exactly the same protocol. req is the request already
+#parsed by the parser that read it, it is parsed here if not given
+def handle_request(request_bytes: bytes, client_host: str, client_port, session: ClientSession = None, req: parsing.Request = None) -> bytes:
+    req = req if req is not None else parsing.parse_request_bytes(request_bytes)
+    digests = session is not None and session.digests
+
+    if req.version != P2P_VERSION:
+        log.warning("Received request from an incompatible version from host: %s port: %s\nRequest:\n%s\n", client_host, client_port, request_bytes.decode(errors="replace"))
+        return response_msg("505 P2P-CI Version Not Supported")
+    elif req.command == "ADD":
+        log_request(req.command, request_bytes)
+        #the port is sent as a number to 2.0 peers, so an entry must never have any other
+        port = parsing.parse_port(req.headers.get("Port"))
+        if port is None or "Title" not in req.headers or "Host" not in req.headers:
+            return response_msg("400 Bad Request")
+        entry = add_rfc(req.rfc_number,
+                        req.headers["Title"],
+                        req.headers["Host"],
+                        port,
+                        parsing.parse_digest(req.headers.get("Digest")))
+        return response_msg("200 OK", entry_line(entry, digests))
+    elif req.command == "LOOKUP":
+        log_request(req.command, request_bytes)
+        if req.rfc_number == "BATCH":
+            #the body holds one rfc number per line. every entry for any of them is returned
+            entries = index.lookup_many([line.strip().decode() for line in bytes(req.body).split(b"\n") if line.strip()])
+        elif "Title" not in req.headers:
+            return response_msg("400 Bad Request")
+        else:
+            entries = index.lookup(req.rfc_number, req.headers["Title"])
+        body = "".join(entry_line(rfc, digests) for rfc in entries)
+        if body == "":
+            return response_msg("404 Not Found")
+        return response_msg("200 OK", body)
+    elif req.command == "LIST":
+        log_request(req.command, request_bytes)
+        limit = req.headers.get("Limit")
+        try:
+            limit = int(limit) if limit else None
+        except ValueError:
+            return response_msg("400 Bad Request")
+        if limit is not None and limit < 0:
+            return response_msg("400 Bad Request")
+        return list_response(req.rfc_number, limit, req.headers.get("After"), digests)
+    elif req.command == "SYNC":
+        log_request(req.command, request_bytes)
+        try:
+            return sync_response(int(req.headers.get("Index") or 0), int(req.rfc_number), digests)
+        except ValueError:
+            return response_msg("400 Bad Request")
+    elif req.command == "SUBSCRIBE" or req.command == "UNSUBSCRIBE":
+        log_request(req.command, request_bytes)
+        #the subscription is either an rfc number or, when the rfc number is -, the prefix in the Title-Prefix header
+        if req.rfc_number == "-":
+            (rfc_number, title_prefix) = (None, req.headers.get("Title-Prefix"))
+        else:
+            (rfc_number, title_prefix) = (req.rfc_number, None)
+        #an index that doesn't report its changes (the sharded one) has nothing to subscribe to
+        if session is None or index.on_change is None or (rfc_number is None and title_prefix is None):
+            return response_msg("400 Bad Request")
+        if req.command == "SUBSCRIBE":
+            subscriptions.subscribe(session, rfc_number, title_prefix)
+        else:
+            subscriptions.unsubscribe(session, rfc_number, title_prefix)
+        return response_msg("200 OK")
+    elif req.command == "HEARTBEAT":
+        #the request itself renewed the lease. the answer tells the peer how often it has to send one
+        return socket_helper.encode_message("{} 200 OK\nLease: {:g}\n".format(P2P_VERSION, leases.duration))
+    elif req.command == "STATS":
+        #the server's metrics, a "name value" line for each
+        return response_msg("200 OK", metrics.render())
+    elif req.command == "EXIT":
+        log_request(req.command, request_bytes)
+        #checked the way ADD and INIT check it, so it matches the port the peer's entries were stored under
+        port = parsing.parse_port(req.headers.get("Port"))
+        if port is None or "Host" not in req.headers:
+            return response_msg("400 Bad Request")
+        remove_peer_from_system(req.headers["Host"], port)
+        return None
+    else:
+        log.warning("Received a malformed request from host: %s port: %s\nRequest:\n%s\n", client_host, client_port, request_bytes.decode(errors="replace"))
+        return response_msg("400 Bad Request")
+
+#handle_request for a request read from a connection. a request it can't make sense of (a header that isn't what
+#it should be, a body that isn't utf-8) is answered with 400, like one that can't be framed, but the connection
+#stays open since the next request can still be read
+def answer_request(request_bytes: bytes, client_host: str, client_port, session: ClientSession, req: parsing.Request):
+    try:
+        return handle_request(request_bytes, client_host, client_port, session, req)
+    except (KeyError, ValueError):
+        log.warning("Received a malformed request from host: %s port: %s\nRequest:\n%s\n", client_host, client_port, request_bytes.decode(errors="replace"))
+        metrics.add("requests.bad")
+        return response_msg("400 Bad Request")
+
+#build the response to a single P2P-CI/2.0 request. session.encoder is the connection's binary_protocol.Encoder,
+#which remembers the peers already sent on it. returns None once the peer has exited. like handle_request the
+#response is either bytes or a generator of the frames of the response
+def handle_binary_request(payload: bytes, session: ClientSession, client_host: str, client_port):
+    encoder = session.encoder
+    try:
+        (opcode, fields) = binary_protocol.decode_request(payload)
+    except ValueError:
+        log.warning("Received a malformed request from host: %s port: %s\n", client_host, client_port)
+        return encoder.frame(400)
+    log.debug("Received %s request from host: %s port: %s\n%s\n", binary_protocol.COMMANDS[opcode], client_host, client_port, fields)
+
+    if opcode == binary_protocol.ADD:
+        (rfc_number, rfc_title, digest) = fields
+        return encoder.frame(200, [add_rfc(rfc_number, rfc_title, client_host, client_port, digest)])
+    elif opcode == binary_protocol.LOOKUP or opcode == binary_protocol.LOOKUP_BATCH:
+        if opcode == binary_protocol.LOOKUP:
+            entries = index.lookup(fields[0], fields[1])
+        else:
+            entries = index.lookup_many(fields[0])
+        if not entries:
+            return encoder.frame(404)
+        return encoder.frame(200, entries)
+    elif opcode == binary_protocol.LIST:
+        #a limit of zero means no limit and an empty after means from the start
+        (pattern, limit, after) = fields
+        return encoder.frames(200, list_entries(pattern, limit or None, after or None), LIST_CHUNK_SIZE)
+    elif opcode == binary_protocol.SYNC:
+        return encoder.sync_frames(*sync_changes(fields[0], fields[1]), LIST_CHUNK_SIZE)
+    elif opcode == binary_protocol.SUBSCRIBE or opcode == binary_protocol.UNSUBSCRIBE:
+        (kind, value) = fields
+        if index.on_change is None:
+            return encoder.frame(400)
+        (rfc_number, title_prefix) = (value, None) if kind == binary_protocol.BY_NUMBER else (None, value)
+        if opcode == binary_protocol.SUBSCRIBE:
+            subscriptions.subscribe(session, rfc_number, title_prefix)
+        else:
+            subscriptions.unsubscribe(session, rfc_number, title_prefix)
+        return encoder.frame(200)
+    elif opcode == binary_protocol.HEARTBEAT:
+        return encoder.frame(200, lease=leases.duration)
+    elif opcode == binary_protocol.STATS:
+        return encoder.frame(200, text=metrics.render())
+    else:
+        remove_peer_from_system(client_host, client_port)
+        return None
+
+#answer a request that can't be read (see socket_helper.BadMessage), or an INIT the peer can't be registered with,
+#with 400 before the connection is closed. encoder is the connection's 2.0 encoder, None on 1.0
+def reject_message(write, encoder: binary_protocol.Encoder = None):
+    metrics.add("requests.bad")
+    try:
+        write(response_msg("400 Bad Request") if encoder is None else encoder.frame(400))
+    except OSError:
+        pass
 
 #handle each client concurrently until they exit
 def handle_client(client_socket: socket):
-    init_msg = parsing.parse_peer_request(client_socket.recv(1024).decode())
-    client_host = init_msg.headers["Host"]
-    client_port = init_msg.headers["Port"]
-    register_peer(client_host, client_port)
-    print('Received connection from host: {} port: {}'.format(client_host, client_port))
-    
-    while True:
-        request = client_socket.recv(1024).decode()
-        req =  parsing.parse_peer_request(request)
-        
-        response = ""
-        if req.version != P2P_VERSION:
-            print("Received request from an incompatible version from host: {} port: {}\nRequest:\n{}\n".format(client_host, client_port, request))
-            response = P2P_VERSION + " " + "505 P2P-CI Version Not Supported\n\n"
-        elif req.command == "ADD":
-            print("Received ADD request:\n{}\n".format(request))
-            add_rfc(req.rfc_number,
-                    req.headers["Title"], 
-                    req.headers["Host"], 
-                    req.headers["Port"])
-            response = "{} 200 OK\n\n{} {} {} {}\n".format(P2P_VERSION, req.rfc_number, req.headers["Title"], req.headers["Host"], req.headers["Port"])
-        elif req.command == "LOOKUP":
-            print("Received LOOKUP request:\n{}\n".format(request))
-            for rfc in rfcs:
-                if rfc.rfc_number == req.rfc_number and (rfc.rfc_title == req.headers["Title"] or req.headers["Title"] == ""):
-                    response += "{} {} {} {}\n".format(rfc.rfc_number, rfc.rfc_title, rfc.peer_hostname, rfc.peer_port)
-            if response == "":
-                response = P2P_VERSION + " " + "404 Not Found\n\n"
-            else:
-                response = P2P_VERSION + " " + "200 OK\n\n" + response
-        elif req.command == "LIST":
-            print("Received LIST request:\n{}\n".format(request))
-            response = P2P_VERSION + " " + "200 OK\n\n"
-            for rfc in rfcs:
-                response += "{} {} {} {}\n".format(rfc.rfc_number, rfc.rfc_title, rfc.peer_hostname, rfc.peer_port)
-            if len(rfcs) == 0:
-                response += "No RFCs in index."
-        elif req.command == "EXIT":
-            print("Received EXIT request.\n{}\n".format(request))
+    #streamed responses are written in several pieces, don't let nagle hold the last ones back (asyncio streams
+    #already turn it off)
+    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    reader = socket_helper.MessageReader(client_socket, max_body=MAX_REQUEST_BODY)
+    try:
+        init_request = reader.read_message()
+        if init_request is None: #the peer closed the connection before its INIT
             client_socket.close()
-            remove_peer_from_system(req.headers["Host"], req.headers["Port"])
-            break
-        else:
-            print("Received a malformed request from host: {} port: {}\nRequest:\n{}\n".format(client_host, client_port, request))
-            response = P2P_VERSION + " " + "400 Bad Request\n\n"
-        client_socket.send(response.encode())
+            return
+        init = init_client(init_request, reader.parser.request(init_request))
+    except socket_helper.BadMessage:
+        init = None
+    if init is None:
+        reject_message(client_socket.sendall)
+        client_socket.close()
+        return
+    (client_host, client_port, upgrade, digests) = init
+    encoder = None
+    if upgrade is not None:
+        client_socket.sendall(upgrade_response(upgrade))
+        if upgrade == binary_protocol.VERSION:
+            encoder = binary_protocol.Encoder(digests)
+    #shutting the socket down wakes this thread up from its read, and it cleans up like after any disconnect
+    shutdown = lambda: client_socket.shutdown(socket.SHUT_RDWR)
+    session = ThreadedSession(client_socket.sendall, encoder, (client_host, client_port), digests, shutdown)
+    leases.grant(session, shutdown)
+    metrics.add("connections.active")
+    metrics.add("connections.total")
 
-def start_server():
+    try:
+        while True:
+            if encoder is None:
+                request = reader.read_message()
+            else:
+                request = reader.read_frame()
+            if request is None: #the peer closed the connection
+                break
+            start = time.perf_counter()
+            profile = None
+            sent = 0
+            #requests are handled under the session lock too, so changes they make are only pushed to this
+            #peer after its response
+            session.acquire()
+            try:
+                profile = diagnostics.profiler.begin()
+                if encoder is None:
+                    response = answer_request(request, client_host, client_port, session, reader.parser.request(request))
+                else:
+                    response = handle_binary_request(request, session, client_host, client_port)
+                leases.renew(session)
+                if response is None:
+                    break
+                if isinstance(response, bytes):
+                    client_socket.sendall(response)
+                    sent = len(response)
+                else:
+                    for piece in response:
+                        client_socket.sendall(piece)
+                        sent += len(piece)
+            finally:
+                session.release()
+                diagnostics.profiler.end(profile)
+                record_request(request, encoder is not None, sent, time.perf_counter() - start)
+    except socket_helper.BadMessage:
+        #under the session lock, so it doesn't land in the middle of a notification
+        session.close()
+        with session.lock:
+            reject_message(client_socket.sendall, encoder)
+    except OSError: #the connection was reset
+        pass
+    finally:
+        metrics.add("connections.active", -1)
+        leases.release(session)
+        #a peer that went away without an EXIT can't serve its rfcs any more either
+        remove_peer_from_system(client_host, client_port)
+        subscriptions.remove_subscriber(session)
+        session.close()
+        client_socket.close()
+
+#stats_interval logs the server's metrics every that many seconds, None never does
+def start_server(host: str = SERVER_HOST, port: int = SERVER_PORT, lease: float = LEASE_SECONDS, stats_interval: float = None):
+    leases.duration = lease
+    if stats_interval:
+        metrics.dump_every(stats_interval)
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind((SERVER_HOST, SERVER_PORT))
-    server_socket.listen()
-    print("Listening on port " + str(SERVER_PORT))
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(LISTEN_BACKLOG)
+    log.info("Listening on port %s", port)
+    serve(server_socket)
+
+#accept peers on a listening socket forever, with a thread for each
+def serve(server_socket: socket):
+    threading.Thread(target=reap_forever, daemon=True).start()
 
     while True:
         client_socket, client_addr = server_socket.accept()
@@ -106,8 +563,18 @@ def start_server():
         client_thread.start()
 
 def main():
-    start_server()
+    args = arg_parser.parse_args()
+    diagnostics.setup_logging(args.log_level)
+    diagnostics.install_signal_handlers()
+    if args.mode == "asyncio":
+        #imported here so the threaded server never pays for asyncio
+        import async_server
+        async_server.start_server(args.host, args.port, args.lease, args.stats_interval)
+    elif args.mode == "sharded":
+        import sharded_server
+        sharded_server.start_server(args.host, args.port, args.workers, args.lease, args.log_level, args.stats_interval)
+    else:
+        start_server(args.host, args.port, args.lease, args.stats_interval)
 
 if __name__ == '__main__':
     main()
-        
\ No newline at end of file
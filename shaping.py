@@ -0,0 +1,128 @@
+import collections
+import itertools
+import threading
+import time
+
+#a token bucket holding up to burst bytes, refilled at rate bytes per second. the lock of the UploadShaper that
+#owns it must be held to use it
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    #seconds until count bytes can be taken, 0 if they can be taken now
+    def delay(self, count: int, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= count:
+            return 0.0
+        return (count - self.tokens) / self.rate
+
+    def take(self, count: int):
+        self.tokens -= count
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+#one upload waiting for its turn to send a chunk
+class _Waiter:
+    __slots__ = ("peer", "count", "order")
+
+    def __init__(self, peer, count: int, order: int):
+        self.peer = peer
+        self.count = count
+        self.order = order
+
+#shapes the upload server's traffic. every upload asks for its chunks one at a time with acquire(), which waits
+#until the chunk fits in both the global bucket (rate bytes per second across all uploads) and the bucket of the
+#peer being uploaded to (peer_rate bytes per second). when several uploads are waiting the next chunk goes to the
+#peer served longest ago, so peers get an equal share of the bandwidth however many connections each of them opens.
+#a rate of None leaves that limit off
+class UploadShaper:
+    #the most bytes a bucket lets through at once after sitting idle, in seconds of its rate
+    BURST_SECONDS = 0.1
+    #per peer buckets are only looked at for cleanup once there are this many
+    MAX_IDLE_PEERS = 1024
+
+    def __init__(self, rate: float = None, peer_rate: float = None, chunk_size: int = 16 * 1024):
+        self.chunk_size = chunk_size
+        self.peer_rate = peer_rate
+        self.condition = threading.Condition()
+        self.bucket = self._new_bucket(rate)
+        #peer -> TokenBucket, only when there is a per peer rate
+        self.peer_buckets = {}
+        #peer -> order number of its last chunk, to find the peer served longest ago
+        self.last_served = {}
+        self.waiting = collections.deque()
+        self.order = itertools.count()
+
+    def _new_bucket(self, rate: float):
+        if rate is None:
+            return None
+        #a chunk always has to fit, or it could never be sent
+        return TokenBucket(rate, max(rate * self.BURST_SECONDS, self.chunk_size))
+
+    #wait until count bytes (at most chunk_size) may be sent to peer
+    def acquire(self, peer, count: int):
+        with self.condition:
+            waiter = _Waiter(peer, count, next(self.order))
+            self.waiting.append(waiter)
+            #a waiter asleep until its bucket refills may be the one to go now
+            self.condition.notify_all()
+            while True:
+                (chosen, delay) = self._next(time.monotonic())
+                if chosen is waiter:
+                    break
+                #woken by another upload taking its turn, or when the next chunk can go
+                self.condition.wait(delay)
+            self.waiting.remove(waiter)
+            if self.bucket is not None:
+                self.bucket.take(count)
+            if self.peer_rate is not None:
+                self.peer_buckets[peer].take(count)
+            self.last_served[peer] = waiter.order
+            if len(self.last_served) > self.MAX_IDLE_PEERS:
+                self._forget_idle_peers(time.monotonic())
+            self.condition.notify_all()
+
+    #the waiter whose chunk goes next and, if none can go yet, seconds until one might. the condition must be held
+    def _next(self, now: float):
+        if self.bucket is not None:
+            delay = self.bucket.delay(min(waiter.count for waiter in self.waiting), now)
+            if delay > 0:
+                return (None, delay)
+        chosen = None
+        delay = None
+        for waiter in self.waiting:
+            wait = 0.0
+            if self.bucket is not None:
+                wait = self.bucket.delay(waiter.count, now)
+            if self.peer_rate is not None:
+                bucket = self.peer_buckets.get(waiter.peer)
+                if bucket is None:
+                    bucket = self.peer_buckets[waiter.peer] = self._new_bucket(self.peer_rate)
+                wait = max(wait, bucket.delay(waiter.count, now))
+            if wait > 0:
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            if chosen is None or self.last_served.get(waiter.peer, -1) < self.last_served.get(chosen.peer, -1):
+                chosen = waiter
+        return (chosen, delay)
+
+    #drop what is kept about peers that have nothing waiting and a full bucket. they are no different from peers
+    #never seen. the condition must be held
+    def _forget_idle_peers(self, now: float):
+        busy = {waiter.peer for waiter in self.waiting}
+        for peer in list(self.last_served):
+            bucket = self.peer_buckets.get(peer)
+            if peer not in busy and (bucket is None or bucket.is_full(now)):
+                del self.last_served[peer]
+                self.peer_buckets.pop(peer, None)
@@ -0,0 +1,222 @@
+import heapq
+import itertools
+import queue
+import threading
+import zlib
+from operator import attrgetter
+from jsobject import JSObject
+from rfc_index import RFCIndex
+
+#the index of one worker of the sharded server. rfcs are split between the workers by a hash of their rfc number
+#and each worker keeps its own part in an RFCIndex. calls for an rfc go straight to the local part or over a link
+#to the worker that owns it, calls that concern every rfc (LIST, LOOKUP BATCH, removing a peer) go to every worker
+#at once and their answers are gathered. it has the methods of RFCIndex the server uses, so the server's request
+#handling works on it unchanged. links is a list with a multiprocessing Connection to every other worker and None
+#at this worker's own place
+class ShardedIndex:
+    #entries fetched from another worker in one go when walking the index
+    PAGE_SIZE = 1024
+    #the index doesn't report its changes, so peers can't subscribe to them
+    on_change = None
+
+    def __init__(self, shard: int, links: list, epoch: int):
+        self.shard = shard
+        self.local = RFCIndex(change_log_size=0)
+        #every worker is given the same epoch so a peer that reconnects to another worker sees the same index
+        self.epoch = epoch
+        self.links = [ShardLink(link, self.local) if link is not None else None for link in links]
+
+    def __len__(self):
+        return sum(self._gather("len", ()))
+
+    #the worker that owns an rfc number. the hash has to be the same in every worker, so str's own hash (which is
+    #randomised per process) won't do
+    def shard_of(self, rfc_number: str) -> int:
+        return zlib.crc32(rfc_number.encode()) % len(self.links)
+
+    #peers are registered with the worker they are connected to, their entries are kept by the workers that own
+    #their rfcs
+    def register_peer(self, peer_hostname: str, peer_port):
+        self.local.register_peer(peer_hostname, peer_port)
+
+    def add(self, rfc_number: str, rfc_title: str, peer_hostname: str, peer_port, digest: str = None):
+        shard = self.shard_of(rfc_number)
+        if shard == self.shard:
+            return self.local.add(rfc_number, rfc_title, peer_hostname, peer_port, digest)
+        return _entry(self.links[shard].call("add", (rfc_number, rfc_title, peer_hostname, peer_port, digest)).result())
+
+    def lookup(self, rfc_number: str, rfc_title: str = "") -> list:
+        shard = self.shard_of(rfc_number)
+        if shard == self.shard:
+            return self.local.lookup(rfc_number, rfc_title)
+        return [_entry(t) for t in self.links[shard].call("lookup", (rfc_number, rfc_title)).result()]
+
+    def lookup_many(self, rfc_numbers: list) -> list:
+        by_shard = {}
+        for rfc_number in rfc_numbers:
+            by_shard.setdefault(self.shard_of(rfc_number), []).append(rfc_number)
+        #every other worker is asked before the local part is looked at, so they all work at the same time
+        calls = [self.links[shard].call("lookup_many", (numbers,)) for shard, numbers in by_shard.items() if shard != self.shard]
+        matches = self.local.lookup_many(by_shard.get(self.shard, []))
+        for call in calls:
+            matches.extend(_entry(t) for t in call.result())
+        return matches
+
+    #walk the entries whose rfc number starts with prefix in rfc number order, like RFCIndex.iter_entries. the walks
+    #of every worker are merged as they go, each one fetched a page at a time
+    def iter_entries(self, prefix: str = "", after: str = None, limit: int = None, batch_size: int = 256):
+        walks = [self.local.iter_entries(prefix, after, batch_size=batch_size) if link is None else self._remote_entries(link, prefix, after)
+                 for link in self.links]
+        produced = 0
+        last = None
+        for entry in heapq.merge(*walks, key=attrgetter("rfc_number")):
+            #an rfc number is owned by a single worker, so its entries come one after the other and the current
+            #one can be finished before stopping
+            if limit is not None and produced >= limit and entry.rfc_number != last:
+                return
+            yield entry
+            produced += 1
+            last = entry.rfc_number
+
+    def _remote_entries(self, link, prefix: str, after: str):
+        #the next page is asked for before the current one is handed out
+        call = link.call("page", (prefix, after, self.PAGE_SIZE))
+        while True:
+            page = call.result()
+            if len(page) >= self.PAGE_SIZE:
+                call = link.call("page", (prefix, page[-1][0], self.PAGE_SIZE))
+            for t in page:
+                yield _entry(t)
+            if len(page) < self.PAGE_SIZE:
+                return
+
+    def remove_peer(self, peer_hostname: str, peer_port) -> list:
+        return self.remove_peers([(peer_hostname, peer_port)])
+
+    #a peer's entries may be kept by any worker, so every worker removes its own
+    def remove_peers(self, peers: list) -> list:
+        calls = [link.call("remove_peers", (peers,)) for link in self.links if link is not None]
+        removed = self.local.remove_peers(peers)
+        for call in calls:
+            removed.extend(_entry(t) for t in call.result())
+        return removed
+
+    #the sharded index keeps no change log, so every SYNC gets the whole index
+    def changes_since(self, epoch: int, version: int):
+        return (0, None)
+
+    def snapshot(self):
+        return (self.epoch, 0, self.iter_entries())
+
+    #call a method on every worker, this one included. returns their answers
+    def _gather(self, method: str, args: tuple) -> list:
+        calls = [link.call(method, args) for link in self.links if link is not None]
+        return [serve_shard(self.local, method, args)] + [call.result() for call in calls]
+
+#what a worker answers to a call from another worker on its part of the index. entries are sent as tuples, which
+#pickle far smaller and faster than entry objects
+def serve_shard(local: RFCIndex, method: str, args: tuple):
+    if method == "add":
+        return _pack(local.add(*args))
+    elif method == "lookup":
+        return [_pack(entry) for entry in local.lookup(*args)]
+    elif method == "lookup_many":
+        return [_pack(entry) for entry in local.lookup_many(*args)]
+    elif method == "page":
+        (prefix, after, limit) = args
+        return [_pack(entry) for entry in local.iter_entries(prefix, after, limit)]
+    elif method == "remove_peers":
+        return [_pack(entry) for entry in local.remove_peers(*args)]
+    elif method == "len":
+        return len(local)
+    raise ValueError("unknown shard method " + method)
+
+def _pack(entry) -> tuple:
+    return (entry.rfc_number, entry.rfc_title, entry.peer_hostname, entry.peer_port, entry.digest)
+
+def _entry(t: tuple):
+    return JSObject(rfc_number=t[0], rfc_title=t[1], peer_hostname=t[2], peer_port=t[3], digest=t[4])
+
+#a call sent to another worker, waiting for its answer
+class ShardCall:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self):
+        self.done.wait()
+        if self.error is not None:
+            raise ConnectionError(self.error)
+        return self.value
+
+#the link between two workers. both ends send calls and answer the other end's calls over the same connection.
+#any number of calls can be waiting for their answers at once. the reader thread only ever reads, calls from the
+#other end are answered by a second thread, so two workers answering each other at once can't both get stuck
+#writing to a full pipe
+class ShardLink:
+    def __init__(self, connection, local: RFCIndex):
+        self.connection = connection
+        self.local = local
+        self.send_lock = threading.Lock()
+        #call id -> ShardCall waiting for its answer
+        self.waiting = {}
+        self.ids = itertools.count()
+        #why the link stopped working, None while it works
+        self.error = None
+        #(call id, method, args) of the calls from the other end
+        self.incoming = queue.SimpleQueue()
+        threading.Thread(target=self._read, daemon=True).start()
+        threading.Thread(target=self._answer, daemon=True).start()
+
+    def call(self, method: str, args: tuple) -> ShardCall:
+        call = ShardCall()
+        call_id = next(self.ids)
+        self.waiting[call_id] = call
+        if self.error is not None:
+            self._fail(self.error)
+            return call
+        self._send((call_id, method, args))
+        return call
+
+    def _send(self, message: tuple):
+        with self.send_lock:
+            self.connection.send(message)
+
+    #messages are (call id, method, args) for a call and (call id, None, (value, error)) for an answer
+    def _read(self):
+        while True:
+            try:
+                (call_id, method, args) = self.connection.recv()
+            except (EOFError, OSError): #the other worker is gone
+                self.error = "shard worker exited"
+                self._fail(self.error)
+                return
+            if method is not None:
+                self.incoming.put((call_id, method, args))
+                continue
+            call = self.waiting.pop(call_id)
+            (call.value, call.error) = args
+            call.done.set()
+
+    #fail every call waiting for an answer
+    def _fail(self, error: str):
+        for call_id in list(self.waiting):
+            call = self.waiting.pop(call_id, None)
+            if call is not None:
+                call.error = error
+                call.done.set()
+
+    def _answer(self):
+        while True:
+            (call_id, method, args) = self.incoming.get()
+            try:
+                answer = (serve_shard(self.local, method, args), None)
+            except Exception as e: #sent back to the caller instead of killing the link
+                answer = (None, repr(e))
+            try:
+                self._send((call_id, None, answer))
+            except OSError:
+                return
@@ -0,0 +1,54 @@
+import multiprocessing
+import random
+import signal
+import socket
+import sys
+import diagnostics
+import server
+from sharded_index import ShardedIndex
+
+#sharded version of the central index server, for machines with many cores. the index is split between worker
+#processes by a hash of the rfc number, so no lock or GIL is shared by all requests. every worker also accepts peers
+#on the same listening socket and serves them with a thread each, exactly like the threaded server, routing each
+#request to the worker that owns its rfc. there is no single front-end process, as one would be the new bottleneck:
+#parsing and answering requests costs far more than the index lookups themselves
+
+#run one worker. links holds a multiprocessing Connection to every other worker and None at the worker's own place.
+#each worker has its own metrics, answers STATS with them and logs them every stats_interval seconds. a worker is
+#profiled by sending the signals to its own process
+def run_worker(shard: int, links: list, epoch: int, server_socket: socket.socket, lease: float, log_level: str, stats_interval: float):
+    #the log writing thread of the parent is not in this process
+    diagnostics.setup_logging(log_level)
+    server.index = ShardedIndex(shard, links, epoch)
+    server.leases.duration = lease
+    if stats_interval:
+        server.metrics.dump_every(stats_interval)
+    server.serve(server_socket)
+
+def start_server(host: str = server.SERVER_HOST, port: int = server.SERVER_PORT, workers: int = 1, lease: float = server.LEASE_SECONDS,
+                 log_level: str = "info", stats_interval: float = None):
+    workers = max(1, workers)
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(server.LISTEN_BACKLOG)
+
+    #a pipe between every pair of workers
+    links = [[None] * workers for _ in range(workers)]
+    for i in range(workers):
+        for j in range(i + 1, workers):
+            (links[i][j], links[j][i]) = multiprocessing.Pipe()
+    epoch = random.randint(1, 2**31 - 1)
+    processes = [multiprocessing.Process(target=run_worker, args=(shard, links[shard], epoch, server_socket, lease, log_level, stats_interval), daemon=True)
+                 for shard in range(workers)]
+    for process in processes:
+        process.start()
+    server.log.info("Listening on port %s with %s workers", port, workers)
+
+    #stopping this process stops the workers (they are daemons), whether it is interrupted or terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
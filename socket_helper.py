@@ -1,17 +1,208 @@
 import socket
+import parsing
 
-#this makes it so that all data is received from a socket
-def recv_all(socket: socket):
-    socket.settimeout(0.25)
-    response = b""
-    while True:
-        try:
-            chunk = socket.recv(1024)
-        except:
-            break
-
-        if not chunk: # break the loop if no more data is received
-            break
-        response += chunk
-    socket.settimeout(None)
-    return response
\ No newline at end of file
+#every P2P-CI message is a block of header lines ended by an empty line, optionally followed by a body.
+#the length of the body is given by the Content-Length header, so a reader knows exactly where a message
+#ends without waiting for a timeout and a message can be bigger than any single recv. bodies that are produced
+#while they are sent (like a big LIST) use "Transfer-Encoding: chunked" instead: a series of chunks, each one
+#a hex length line followed by that many bytes, ended by a chunk of length zero
+HEADER_END = b"\n\n"
+
+#messages with bodies smaller than this are joined with their headers and sent with one call
+SMALL_BODY = 64 * 1024
+#the biggest body (or chunk, or 2.0 frame) a reader accepts unless it is given another limit. the buffer for a
+#message is allocated as soon as its length is known, so the length a peer claims must be checked before then
+MAX_BODY = 256 * 1024 * 1024
+
+#raised by the readers for a message that can't be read, see parsing.BadMessage
+BadMessage = parsing.BadMessage
+
+#the value of a header in a message (or just its header block), or None if it isn't there
+def header_value(message: bytes, name: bytes):
+    head_end = message.find(HEADER_END)
+    prefix = name.lower() + b":"
+    for line in message[:head_end if head_end != -1 else len(message)].split(b"\n"):
+        if line[:len(prefix)].lower() == prefix:
+            return line[len(prefix):].strip()
+    return None
+
+#frame a message. head is the start line and headers, each ending with a newline
+def encode_message(head: str, body: bytes = b"") -> bytes:
+    if body:
+        head += "Content-Length: {}\n".format(len(body))
+    return head.encode() + b"\n" + body
+
+#frame one chunk of a chunked body. an empty chunk ends the body
+def encode_chunk(data: bytes) -> bytes:
+    return "{:x}\n".format(len(data)).encode() + data
+
+def send_message(sock: socket, head: str, body: bytes = b""):
+    if len(body) < SMALL_BODY:
+        sock.sendall(encode_message(head, body))
+    else:
+        #don't copy big bodies just to put the headers in front of them
+        sock.sendall("{}Content-Length: {}\n\n".format(head, len(body)).encode())
+        sock.sendall(body)
+
+#reads whole messages from a socket. bytes received past the end of a message are kept for the next one,
+#so a connection can carry any number of messages back to back. messages are framed by a parsing.MessageParser
+#fed every piece as it is received, which is left holding the parsed header block of the last message read: the
+#reader's parser.request(message) or parser.response(message) builds it without parsing it again. a message with a
+#body bigger than max_body raises BadMessage, as does one whose Content-Length isn't a number
+class MessageReader:
+    def __init__(self, sock: socket, buffer_size: int = 16 * 1024, max_body: int = MAX_BODY):
+        self.sock = sock
+        self.max_body = max_body
+        self.parser = parsing.MessageParser(max_body)
+        self.buffer = bytearray(buffer_size)
+        self.start = 0 #start of the bytes that have not been returned yet
+        self.end = 0 #end of the bytes received so far
+
+    #how many received bytes have not been read yet
+    def buffered(self) -> int:
+        return self.end - self.start
+
+    #read the next message. returns None if the connection closes before a whole message arrives. start_body(head)
+    #is called with the header block as soon as it is in and returns a function that is fed the body a piece at a
+    #time as it is received, so a big body can be hashed or decompressed while it downloads instead of in another
+    #pass over it afterwards
+    def read_message(self, start_body = None):
+        parser = self.parser
+        parser.reset()
+        #the whole size of the message is known once its header block is in, from then on the buffer grows at most
+        #once more
+        size = parser.feed(self.buffer, self.start, self.end)
+        while size is None:
+            if not self._fill(self.end - self.start + 1):
+                return None
+            size = parser.feed(self.buffer, self.start, self.end)
+        if start_body is not None:
+            feed = start_body(bytes(self.buffer[self.start:self.start + parser.head_size - len(HEADER_END)]))
+            #offset from self.start of the bytes not fed yet. _fill may move the unread bytes, offsets survive that
+            fed = parser.head_size
+            while self.end - self.start < size:
+                with memoryview(self.buffer) as view:
+                    feed(view[self.start + fed:self.end])
+                fed = self.end - self.start
+                if not self._fill(size):
+                    return None
+            with memoryview(self.buffer) as view:
+                feed(view[self.start + fed:self.start + size])
+        return self.read_exactly(size)
+
+    #read exactly size bytes. returns None if the connection closes first
+    def read_exactly(self, size: int):
+        while self.end - self.start < size:
+            if not self._fill(size):
+                return None
+        data = bytes(self.buffer[self.start:self.start + size])
+        self.start += size
+        if self.start == self.end:
+            self.start = self.end = 0
+        return data
+
+    #read the payload of the next length prefixed frame of a P2P-CI/2.0 connection. returns None if the
+    #connection closes before a whole frame arrives
+    def read_frame(self):
+        length = 0
+        shift = 0
+        while True:
+            byte = self.read_exactly(1)
+            if byte is None:
+                return None
+            length |= (byte[0] & 0x7f) << shift
+            if byte[0] < 0x80:
+                break
+            shift += 7
+            if shift > 63:
+                raise BadMessage("frame length is too long")
+        return self.read_exactly(parsing.check_length(length, self.max_body))
+
+    #read the chunks of a chunked body (sent after a header block with "Transfer-Encoding: chunked") as they arrive
+    def iter_chunks(self):
+        while True:
+            line_end = self._find(b"\n")
+            if line_end == -1:
+                raise ConnectionError("connection closed in the middle of a chunked message")
+            line = self.read_exactly(line_end - self.start + 1)
+            try:
+                size = parsing.check_length(int(line, 16), self.max_body)
+            except ValueError:
+                raise BadMessage("bad chunk size: {!r}".format(line[:32]))
+            if size == 0:
+                return
+            chunk = self.read_exactly(size)
+            if chunk is None:
+                raise ConnectionError("connection closed in the middle of a chunked message")
+            yield chunk
+
+    #position of the next delimiter in the buffer, receiving more bytes until it shows up. -1 on eof
+    def _find(self, delimiter: bytes) -> int:
+        position = self.buffer.find(delimiter, self.start, self.end)
+        while position == -1:
+            #the delimiter may straddle the bytes we already searched
+            searched = max(0, self.end - self.start - len(delimiter) + 1)
+            if not self._fill(self.end - self.start + 1):
+                return -1
+            position = self.buffer.find(delimiter, self.start + searched, self.end)
+        return position
+
+    #receive more bytes, making sure there is room for at least `needed` unread bytes. returns False on eof
+    def _fill(self, needed: int) -> bool:
+        if self.start + needed > len(self.buffer):
+            unread = self.end - self.start
+            if needed > len(self.buffer):
+                #at least doubled, so a header block trickling in isn't copied over again for every piece
+                buffer = bytearray(max(needed, 2 * len(self.buffer)))
+                buffer[:unread] = self.buffer[self.start:self.end]
+                self.buffer = buffer
+            else:
+                self.buffer[:unread] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, unread
+
+        with memoryview(self.buffer) as view:
+            received = self.sock.recv_into(view[self.end:])
+        if received == 0:
+            return False
+        self.end += received
+        return True
+
+#asyncio version of MessageReader.read_message. returns None if the connection closes before a whole message
+#arrives, raises BadMessage like it. the message is framed by parser (a new parsing.MessageParser if not given),
+#which is left holding its parsed header block
+async def read_message_async(reader, max_body: int = MAX_BODY, parser: parsing.MessageParser = None) -> bytes:
+    parser = parser if parser is not None else parsing.MessageParser(max_body)
+    parser.reset()
+    try:
+        head = await reader.readuntil(HEADER_END)
+    except Exception: #IncompleteReadError, LimitOverrunError or a reset connection
+        return None
+    size = parser.feed(head, 0, len(head))
+    try:
+        return head + await reader.readexactly(size - len(head)) if size > len(head) else head
+    except Exception:
+        return None
+
+#asyncio version of MessageReader.read_frame. returns None if the connection closes before a whole frame arrives,
+#raises BadMessage if the frame is bigger than max_body
+async def read_frame_async(reader, max_body: int = MAX_BODY) -> bytes:
+    try:
+        length = 0
+        shift = 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+            if shift > 63:
+                raise BadMessage("frame length is too long")
+    except BadMessage:
+        raise
+    except Exception: #IncompleteReadError or a reset connection
+        return None
+    parsing.check_length(length, max_body)
+    try:
+        return await reader.readexactly(length)
+    except Exception:
+        return None
@@ -0,0 +1,83 @@
+import threading
+
+#the peers that asked the server to tell them when rfcs appear in or leave the index. a subscription is either an
+#exact rfc number or a title prefix. subscribers are indexed by what they subscribed to, so a change only looks
+#at the subscribers it matches: one dict read for its rfc number and one for each distinct length of subscribed
+#title prefix, however many subscribers there are. a subscriber is anything with a push(entry, added) method
+class Subscriptions:
+    def __init__(self):
+        self.lock = threading.Lock()
+        #rfc number -> set of subscribers
+        self.by_number = {}
+        #title prefix -> set of subscribers
+        self.by_title_prefix = {}
+        #length of a subscribed title prefix -> how many distinct prefixes have that length
+        self.prefix_lengths = {}
+        #subscriber -> set of ("number", rfc_number) and ("title", prefix) keys it subscribed to
+        self.by_subscriber = {}
+
+    def subscribe(self, subscriber, rfc_number: str = None, title_prefix: str = None):
+        with self.lock:
+            keys = self.by_subscriber.setdefault(subscriber, set())
+            if rfc_number is not None:
+                self.by_number.setdefault(rfc_number, set()).add(subscriber)
+                keys.add(("number", rfc_number))
+            if title_prefix is not None:
+                if title_prefix not in self.by_title_prefix:
+                    self.by_title_prefix[title_prefix] = set()
+                    self.prefix_lengths[len(title_prefix)] = self.prefix_lengths.get(len(title_prefix), 0) + 1
+                self.by_title_prefix[title_prefix].add(subscriber)
+                keys.add(("title", title_prefix))
+
+    def unsubscribe(self, subscriber, rfc_number: str = None, title_prefix: str = None):
+        with self.lock:
+            keys = self.by_subscriber.get(subscriber)
+            if keys is None:
+                return
+            if rfc_number is not None:
+                self._drop(subscriber, ("number", rfc_number))
+                keys.discard(("number", rfc_number))
+            if title_prefix is not None:
+                self._drop(subscriber, ("title", title_prefix))
+                keys.discard(("title", title_prefix))
+            if not keys:
+                del self.by_subscriber[subscriber]
+
+    #forget every subscription of a subscriber, for example when its connection closes
+    def remove_subscriber(self, subscriber):
+        with self.lock:
+            for key in self.by_subscriber.pop(subscriber, ()):
+                self._drop(subscriber, key)
+
+    #the subscribers interested in an entry of the index
+    def matching(self, entry) -> set:
+        with self.lock:
+            matches = set(self.by_number.get(entry.rfc_number, ()))
+            title = entry.rfc_title
+            for length in self.prefix_lengths:
+                if length <= len(title):
+                    matches.update(self.by_title_prefix.get(title[:length], ()))
+        return matches
+
+    #tell every interested subscriber that an entry was added to or removed from the index. used as the index's
+    #on_change callback
+    def notify(self, entry, added: bool):
+        for subscriber in self.matching(entry):
+            subscriber.push(entry, added)
+
+    #remove one subscription. the lock must be held
+    def _drop(self, subscriber, key):
+        (kind, value) = key
+        subscribers = (self.by_number if kind == "number" else self.by_title_prefix).get(value)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if subscribers:
+            return
+        if kind == "number":
+            del self.by_number[value]
+        else:
+            del self.by_title_prefix[value]
+            self.prefix_lengths[len(value)] -= 1
+            if self.prefix_lengths[len(value)] == 0:
+                del self.prefix_lengths[len(value)]
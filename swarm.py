@@ -0,0 +1,138 @@
+import collections
+import threading
+import parsing
+import socket_helper
+from jsobject import JSObject
+from rfc import RFC, content_digest
+
+#downloads a single rfc from every peer that has it at the same time. the content is split into pieces that are
+#fetched with ranged GETs, one connection per holder, and written straight into place in a preallocated buffer.
+#a holder that fails or is too slow has its pieces handed to the others, and once no pieces are left to hand out
+#idle holders also fetch pieces that are still in flight (whichever copy arrives first is kept). every piece is
+#checked against the first one: same total length, same Last-Modified, same digest and exactly the bytes that were
+#asked for. the whole content is then checked against the digest the first piece came with. the buffer is only
+#allocated for a total of at most max_size, and a piece has to lie inside the total it claims
+class SwarmDownloader:
+    def __init__(self, peer, piece_size: int = 64 * 1024, piece_timeout: float = 5.0, max_failures: int = 2,
+                 max_size: int = socket_helper.MAX_BODY):
+        self.peer = peer
+        self.piece_size = piece_size
+        self.piece_timeout = piece_timeout
+        #a holder is dropped from the swarm after this many failed pieces
+        self.max_failures = max_failures
+        self.max_size = max_size
+
+    #download an rfc and add it to the peer's rfcs. returns the RFC, or None if it could not be downloaded
+    def download(self, rfc_number: str):
+        holders = self.peer.lookup_many([rfc_number]).get(rfc_number, [])
+        copy = self.peer._copy_local(holders)
+        if copy is not None:
+            return copy
+
+        #the first piece tells us how big the rfc is
+        first = None
+        for entry in holders:
+            first = self._fetch_piece(entry, rfc_number, 0, self.piece_size - 1)
+            if first is not None:
+                break
+        if first is None:
+            return None
+
+        if first.total == len(first.body):
+            content = bytes(first.body)
+        else:
+            content = self._download_pieces(holders, rfc_number, first)
+            if content is None:
+                return None
+        if first.digest is not None and content_digest(content) != first.digest:
+            return None
+
+        rfc = RFC(rfc_number, holders[0].rfc_title, first.last_modified, len(content), first.content_type, content.decode(), digest=first.digest)
+        self.peer.rfcs.add(rfc)
+        return rfc
+
+    #fetch every piece after the first one from all the holders at once. returns the whole content or None
+    def _download_pieces(self, holders: list, rfc_number: str, first):
+        total = first.total
+        num_pieces = (total + self.piece_size - 1) // self.piece_size
+        content = bytearray(total)
+        content[:len(first.body)] = first.body
+        done = [False] * num_pieces
+        done[0] = True
+        queue = collections.deque(range(1, num_pieces))
+        lock = threading.Lock()
+        state = {"remaining": num_pieces - 1}
+
+        #the next piece for a holder: a piece nobody has started, or (in the endgame) one that is still in flight
+        def next_piece():
+            with lock:
+                while queue:
+                    piece = queue.popleft()
+                    if not done[piece]:
+                        return piece
+                for piece in range(num_pieces):
+                    if not done[piece]:
+                        return piece
+                return None
+
+        def worker(entry):
+            failures = 0
+            while failures < self.max_failures:
+                piece = next_piece()
+                if piece is None:
+                    return
+                start = piece * self.piece_size
+                end = min(total, start + self.piece_size) - 1
+                res = self._fetch_piece(entry, rfc_number, start, end)
+                ok = res is not None and res.start == start and len(res.body) == end - start + 1 \
+                    and res.total == total and res.last_modified == first.last_modified and res.digest == first.digest
+                with lock:
+                    if ok and not done[piece]:
+                        content[start:end + 1] = res.body
+                        done[piece] = True
+                        state["remaining"] -= 1
+                    elif not ok:
+                        failures += 1
+                        if not done[piece]:
+                            queue.appendleft(piece)
+
+        workers = [threading.Thread(target=worker, args=(entry,), daemon=True) for entry in holders]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        if state["remaining"] != 0:
+            return None
+        return bytes(content)
+
+    #fetch bytes start to end (inclusive) of an rfc from one holder. returns None if the holder fails to deliver
+    def _fetch_piece(self, entry, rfc_number: str, start: int, end: int):
+        try:
+            response = self.peer._get_from_peer(entry.hostname, entry.upload_port_number, [rfc_number], [(start, end)], self.piece_timeout)[0]
+        except OSError:
+            return None
+        if response is None: #a whole rfc that didn't match its digest
+            return None
+        res = parsing.parse_response_bytes(response)
+        body = res.body
+        if res.status_code == "200": #the holder sent the whole rfc
+            (piece_start, piece_total) = (0, len(body))
+        elif res.status_code == "206":
+            (piece_start, piece_total) = parsing.parse_content_range(res.headers.get("Content-Range", ""))
+        else:
+            return None
+        if piece_start is None or piece_start < 0 or piece_start + len(body) > piece_total:
+            return None
+        try:
+            parsing.check_length(piece_total, self.max_size)
+        except parsing.BadMessage: #a total we won't allocate a buffer for
+            return None
+        return JSObject(**{
+            'start': piece_start,
+            'total': piece_total,
+            'body': body,
+            'last_modified': res.headers.get("Last-Modified"),
+            'content_type': res.headers.get("Content-Type"),
+            'digest': parsing.parse_digest(res.headers.get("Digest"))
+        })
@@ -0,0 +1,66 @@
+import unittest
+import binary_protocol
+from jsobject import JSObject
+
+DIGEST = "ab" * 32
+
+def entry(rfc_number: str, rfc_title: str, host: str, port: str, digest: str = None):
+    return JSObject(rfc_number=rfc_number, rfc_title=rfc_title, peer_hostname=host, peer_port=port, digest=digest)
+
+#the payload of a frame
+def payload(frame: bytes):
+    (length, pos) = binary_protocol.decode_varint(frame, 0)
+    return frame[pos:pos + length]
+
+class BinaryProtocolTest(unittest.TestCase):
+    def test_varint_round_trip(self):
+        for value in [0, 1, 127, 128, 300, 2**31, 2**63 - 1]:
+            out = bytearray()
+            binary_protocol.encode_varint(value, out)
+            self.assertEqual(binary_protocol.decode_varint(out, 0), (value, len(out)))
+
+    def test_request_round_trip(self):
+        requests = [
+            (binary_protocol.ADD, ["RFC 123", "A Title", DIGEST]),
+            (binary_protocol.ADD, ["RFC 123", "A Title", None]),
+            (binary_protocol.LOOKUP, ["RFC 9", ""]),
+            (binary_protocol.LOOKUP_BATCH, [["RFC 1", "RFC 22", "RFC 333"]]),
+            (binary_protocol.LIST, ["RFC 1*", 50, "RFC 10"]),
+            (binary_protocol.SYNC, [12345, 678]),
+            (binary_protocol.SUBSCRIBE, [binary_protocol.BY_TITLE_PREFIX, "Net"]),
+            (binary_protocol.EXIT, []),
+        ]
+        for (opcode, fields) in requests:
+            frame = binary_protocol.encode_request(opcode, *fields)
+            self.assertEqual(binary_protocol.decode_request(payload(frame)), (opcode, fields))
+
+    def test_malformed_request(self):
+        frame = binary_protocol.encode_request(binary_protocol.LOOKUP, "RFC 9", "A Title")
+        for bad in [payload(frame)[:-3], bytes([200]), b""]:
+            with self.assertRaises(ValueError):
+                binary_protocol.decode_request(bad)
+
+    def test_response_round_trip(self):
+        encoder = binary_protocol.Encoder(digests=True)
+        decoder = binary_protocol.Decoder()
+        first = [entry("RFC 1", "One", "a", "10", DIGEST), entry("RFC 2", "Two", "b", "20")]
+        second = [entry("RFC 3", "Three", "a", "10"), entry("RFC 4", "Four", "c", "30", DIGEST)]
+        for (entries, flags) in [(first, binary_protocol.MORE), (second, 0)]:
+            (status_code, got_flags, decoded) = decoder.response(payload(encoder.frame(200, entries, more=bool(flags))))
+            self.assertEqual(status_code, 200)
+            self.assertEqual(got_flags & binary_protocol.MORE, flags)
+            self.assertEqual([(e.rfc_number, e.rfc_title, e.hostname, e.upload_port_number, e.digest) for e in decoded],
+                             [(e.rfc_number, e.rfc_title, e.peer_hostname, e.peer_port, e.digest) for e in entries])
+        #each peer is introduced once per connection
+        self.assertEqual(decoder.peers, [("a", "10"), ("b", "20"), ("c", "30")])
+
+    def test_version_lease_and_text(self):
+        decoder = binary_protocol.Decoder()
+        frame = binary_protocol.Encoder().frame(200, version=(7, 42), lease=1.5, text="requests 3")
+        (_, flags, entries) = decoder.response(payload(frame))
+        self.assertEqual(entries, [])
+        self.assertEqual((decoder.epoch, decoder.version, decoder.lease, decoder.text), (7, 42, 1.5, "requests 3"))
+        self.assertTrue(flags & binary_protocol.VERSION_FLAG and flags & binary_protocol.LEASE and flags & binary_protocol.TEXT)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import unittest
+import compression
+import rfc
+
+def message(body: bytes, encoding: str = None) -> bytes:
+    head = "P2P-CI/1.0 200 OK\nContent-Length: {}\n".format(len(body))
+    if encoding is not None:
+        head += "Content-Encoding: {}\n".format(encoding)
+    return head.encode() + b"\n" + body
+
+#feed a message's body to a decoder in pieces of size bytes. returns the decoder
+def decode(data: bytes, encoding: str, max_size: int, size: int = 1000):
+    decoder = compression.BodyDecoder(max_size)
+    body = compression.compress(data, encoding)
+    feed = decoder.start(message(body, encoding))
+    for start in range(0, len(body), size):
+        feed(body[start:start + size])
+    return (decoder, message(body, encoding))
+
+class BodyDecoderTest(unittest.TestCase):
+    def test_round_trip(self):
+        data = b"the quick brown fox\n" * 5000
+        for encoding in compression.ENCODINGS:
+            (decoder, received) = decode(data, encoding, len(data))
+            self.assertEqual(decoder.digest(), rfc.content_digest(data))
+            self.assertEqual(decoder.decoded_message(received), message(data))
+
+    def test_body_over_max_size_fails(self):
+        data = bytes(1024 * 1024)
+        for encoding in compression.ENCODINGS:
+            (decoder, received) = decode(data, encoding, len(data) - 1)
+            self.assertTrue(decoder.failed)
+            self.assertIsNone(decoder.decoded_message(received))
+            self.assertEqual(decoder.pieces, [])
+
+    def test_truncated_or_trailing_data_fails(self):
+        data = os.urandom(5000)
+        for encoding in compression.ENCODINGS:
+            body = compression.compress(data, encoding)
+            decoder = compression.BodyDecoder()
+            decoder.start(message(body, encoding))(body[:-10])
+            self.assertIsNone(decoder.decoded_message(message(body, encoding)))
+            decoder = compression.BodyDecoder()
+            feed = decoder.start(message(body, encoding))
+            feed(body)
+            feed(body)
+            self.assertIsNone(decoder.decoded_message(message(body, encoding)))
+
+    def test_unknown_encoding_fails(self):
+        decoder = compression.BodyDecoder()
+        decoder.start(message(b"x", "br"))(b"x")
+        self.assertIsNone(decoder.decoded_message(message(b"x", "br")))
+
+    def test_identity_is_passed_through(self):
+        decoder = compression.BodyDecoder()
+        decoder.start(message(b"abc"))(b"abc")
+        self.assertEqual(decoder.decoded_message(message(b"abc")), message(b"abc"))
+        self.assertEqual(decoder.digest(), rfc.content_digest(b"abc"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import time
+import unittest
+from leases import LeaseTable
+
+class LeaseTableTest(unittest.TestCase):
+    def test_expired_peers_are_reaped_once(self):
+        leases = LeaseTable(0.05)
+        leases.grant("a", "close a")
+        leases.grant("b", "close b")
+        self.assertEqual(leases.pop_expired(), [])
+        time.sleep(0.1)
+        self.assertEqual(sorted(leases.pop_expired()), [("a", "close a"), ("b", "close b")])
+        self.assertEqual(leases.pop_expired(), [])
+
+    def test_renewed_peer_is_kept(self):
+        leases = LeaseTable(0.1)
+        leases.grant("a", None)
+        leases.grant("b", None)
+        time.sleep(0.06)
+        leases.renew("a")
+        time.sleep(0.06)
+        self.assertEqual([peer for (peer, _) in leases.pop_expired()], ["b"])
+        time.sleep(0.06)
+        self.assertEqual([peer for (peer, _) in leases.pop_expired()], ["a"])
+
+    def test_released_peer_is_never_reaped(self):
+        leases = LeaseTable(0.01)
+        leases.grant("a", None)
+        leases.release("a")
+        time.sleep(0.02)
+        self.assertEqual(leases.pop_expired(), [])
+
+    def test_zero_duration_turns_leases_off(self):
+        leases = LeaseTable(0)
+        leases.grant("a", None)
+        self.assertEqual(leases.pop_expired(), [])
+        self.assertEqual(leases.expiry, {})
+
+if __name__ == '__main__':
+    unittest.main()
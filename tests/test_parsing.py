@@ -0,0 +1,58 @@
+import unittest
+import parsing
+
+class ParseContentRangeTest(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(parsing.parse_content_range("bytes 0-99/1000"), (0, 1000))
+        self.assertEqual(parsing.parse_content_range("bytes 900-999/1000"), (900, 1000))
+
+    def test_invalid(self):
+        for value in ["", "bytes", "bytes 0-99", "items 0-99/1000", "bytes a-99/1000", "bytes 0-99/x", "bytes 0-99/1000/2"]:
+            self.assertEqual(parsing.parse_content_range(value), (None, None), value)
+
+class ParsePortTest(unittest.TestCase):
+    def test_port(self):
+        self.assertEqual(parsing.parse_port("7734"), "7734")
+        self.assertEqual(parsing.parse_port("65535"), "65535")
+
+    def test_not_a_port(self):
+        for value in [None, "", "abc", "-1", "65536", "1.5", " 80", "٣"]:
+            self.assertIsNone(parsing.parse_port(value), value)
+
+class MessageParserTest(unittest.TestCase):
+    MESSAGE = b"LOOKUP BATCH P2P-CI/1.0\nHost: h\nPort: 5\nContent-Length: 12\n\nRFC 1\nRFC 2\n"
+
+    def test_fed_a_byte_at_a_time(self):
+        parser = parsing.MessageParser()
+        sizes = [parser.feed(self.MESSAGE, 0, end) for end in range(len(self.MESSAGE) + 1)]
+        head_size = self.MESSAGE.find(b"\n\n") + 2
+        self.assertEqual(sizes[:head_size], [None] * head_size)
+        self.assertEqual(set(sizes[head_size:]), {len(self.MESSAGE)})
+        req = parser.request(self.MESSAGE)
+        self.assertEqual((req.command, req.rfc_number, req.version), ("LOOKUP", "BATCH", "P2P-CI/1.0"))
+        self.assertEqual(req.headers["Port"], "5")
+        self.assertEqual(bytes(req.body), b"RFC 1\nRFC 2\n")
+
+    def test_reset_for_the_next_message(self):
+        data = self.MESSAGE + b"EXIT - P2P-CI/1.0\nHost: h\nPort: 5\n\n"
+        parser = parsing.MessageParser()
+        size = parser.feed(data, 0, len(data))
+        parser.reset()
+        self.assertEqual(parser.feed(data, size, len(data)), len(data) - size)
+        self.assertEqual(parser.request(data[size:]).command, "EXIT")
+
+    def test_incomplete_message(self):
+        self.assertIsNone(parsing.parse_request_bytes(self.MESSAGE[:-1]))
+        self.assertIsNone(parsing.parse_request_bytes(self.MESSAGE[:10]))
+
+    def test_bad_content_length(self):
+        for value in [b"abc", b"-1", b"2000"]:
+            with self.assertRaises(parsing.BadMessage):
+                parsing.MessageParser(1000).feed(b"GET RFC 1 P2P-CI/1.0\nContent-Length: " + value + b"\n\n", 0, 100)
+
+    def test_head_not_utf8(self):
+        with self.assertRaises(parsing.BadMessage):
+            parsing.parse_request_bytes(b"GET RFC 1 P2P-CI/1.0\nHost: \xff\n\n")
+
+if __name__ == '__main__':
+    unittest.main()
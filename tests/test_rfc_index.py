@@ -0,0 +1,73 @@
+import unittest
+from rfc_index import RFCIndex
+
+class RFCIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = RFCIndex()
+
+    def numbers(self, **kwargs) -> list:
+        return [entry.rfc_number for entry in self.index.iter_entries(**kwargs)]
+
+    def test_walks_in_rfc_number_order(self):
+        for number in ["RFC 30", "RFC 10", "RFC 20"]:
+            self.index.add(number, "Title", "host", "1")
+        self.assertEqual(self.numbers(), ["RFC 10", "RFC 20", "RFC 30"])
+
+    def test_pages_continue_after_the_last_rfc_number(self):
+        for n in range(100, 200):
+            self.index.add("RFC {}".format(n), "Title", "host", "1")
+        pages = []
+        after = None
+        while True:
+            page = self.numbers(after=after, limit=7, batch_size=3)
+            if not page:
+                break
+            pages += page
+            after = page[-1]
+        self.assertEqual(pages, ["RFC {}".format(n) for n in range(100, 200)])
+
+    def test_limit_finishes_the_last_rfc_number(self):
+        for port in ["1", "2", "3"]:
+            self.index.add("RFC 1", "Title", "host", port)
+        self.index.add("RFC 2", "Title", "host", "1")
+        self.assertEqual(self.numbers(limit=1), ["RFC 1"] * 3)
+
+    def test_prefix(self):
+        for number in ["RFC 1", "RFC 12", "RFC 2", "RFC 123"]:
+            self.index.add(number, "Title", "host", "1")
+        self.assertEqual(self.numbers(prefix="RFC 1"), ["RFC 1", "RFC 12", "RFC 123"])
+
+    def test_removed_and_added_again_is_listed_once(self):
+        self.index.add("RFC 1", "Title", "host", "1")
+        self.index.add("RFC 2", "Title", "host", "1")
+        self.assertEqual(self.numbers(), ["RFC 1", "RFC 2"])
+        self.index.remove("RFC 1", "Title", "host", "1")
+        self.index.add("RFC 1", "Title", "host", "2")
+        self.index.remove_peer("host", "1")
+        self.assertEqual(self.numbers(), ["RFC 1"])
+
+    def test_changes_since(self):
+        self.index.add("RFC 1", "Title", "host", "1")
+        (epoch, version, _) = self.index.snapshot()
+        self.index.add("RFC 2", "Title", "host", "1")
+        self.index.remove("RFC 1", "Title", "host", "1")
+        (current, changes) = self.index.changes_since(epoch, version)
+        self.assertEqual(current, version + 2)
+        self.assertEqual(sorted((entry.rfc_number, added) for (entry, added) in changes), [("RFC 1", False), ("RFC 2", True)])
+
+    def test_changes_since_another_epoch_or_version_cannot_be_told(self):
+        self.index.add("RFC 1", "Title", "host", "1")
+        (epoch, version, _) = self.index.snapshot()
+        self.assertIsNone(self.index.changes_since(epoch + 1, version)[1])
+        self.assertIsNone(self.index.changes_since(epoch, version + 1)[1])
+
+    def test_changes_since_a_version_older_than_the_log_cannot_be_told(self):
+        index = RFCIndex(change_log_size=2)
+        (epoch, version, _) = index.snapshot()
+        for n in range(5):
+            index.add("RFC {}".format(n), "Title", "host", "1")
+        self.assertIsNone(index.changes_since(epoch, version)[1])
+        self.assertEqual(len(index.changes_since(epoch, index.version - 1)[1]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from jsobject import JSObject
+from swarm import SwarmDownloader
+
+HOLDER = JSObject(hostname="localhost", upload_port_number="1")
+
+#answers every GET with the same response
+class FakePeer:
+    def __init__(self, response: bytes):
+        self.response = response
+
+    def _get_from_peer(self, *args):
+        return [self.response]
+
+def partial(content_range: str, body: bytes = b"abc") -> bytes:
+    return "P2P-CI/1.0 206 Partial Content\nContent-Range: {}\nContent-Length: {}\n\n".format(content_range, len(body)).encode() + body
+
+class FetchPieceTest(unittest.TestCase):
+    def fetch(self, response: bytes, max_size: int = 1000):
+        return SwarmDownloader(FakePeer(response), max_size=max_size)._fetch_piece(HOLDER, "RFC 1", 0, 2)
+
+    def test_piece(self):
+        piece = self.fetch(partial("bytes 0-2/10"))
+        self.assertEqual((piece.start, piece.total, bytes(piece.body)), (0, 10, b"abc"))
+
+    def test_total_over_max_size(self):
+        self.assertIsNone(self.fetch(partial("bytes 0-2/1001")))
+        self.assertIsNotNone(self.fetch(partial("bytes 0-2/1000")))
+
+    def test_piece_outside_its_total(self):
+        self.assertIsNone(self.fetch(partial("bytes 0-2/2")))
+        self.assertIsNone(self.fetch(partial("bytes -1-2/10")))
+        self.assertIsNone(self.fetch(partial("bytes 0-2")))
+
+if __name__ == '__main__':
+    unittest.main()
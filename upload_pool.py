@@ -0,0 +1,202 @@
+import collections
+import queue
+import selectors
+import socket
+import threading
+import time
+
+#the accept loop and bounded pool of threads behind a peer's upload server. at most max_workers connections are
+#served at once, up to queue_size more wait for a worker, and a connection that can't get in (the queue is full,
+#it waited longer than queue_timeout, or the server is stopping) is told the peer is busy with busy_message and
+#closed, so the downloader can go to another holder straight away instead of hanging. handle(sock) serves an
+#accepted connection until it is done with it and closes it
+class UploadPool:
+    #how long a rejected connection is drained before it is closed. closing a socket with unread data resets the
+    #connection, and the reset can destroy the busy message before the other side reads it
+    LINGER_TIME = 1.0
+    #how often a worker waiting on an idle keep-alive connection checks whether it is needed elsewhere
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, handle, busy_message: bytes, max_workers: int = 32, queue_size: int = 64, queue_timeout: float = 5.0):
+        self.handle = handle
+        self.busy_message = busy_message
+        self.max_workers = max(1, max_workers)
+        self.queue_timeout = queue_timeout
+        self.queue_size = max(1, queue_size)
+        #(time queued, socket) of accepted connections waiting for a worker, None tells a worker to exit. it is bounded
+        #by submit() rather than by the queue itself, so telling the workers to exit never blocks
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.workers = []
+        #workers waiting for a connection
+        self.idle = 0
+        self.stopped = False
+        #rejected sockets being drained by the accept loop before they are closed, with when to give up on them
+        self.closing = {}
+        #sockets rejected by workers, waiting for the accept loop to take them
+        self.rejected = collections.deque()
+        self.accept_thread = None
+        #a byte on this pair wakes the accept loop up, so stop() doesn't wait for the next connection
+        (self.wake_reader, self.wake_writer) = socket.socketpair()
+
+    #accept connections on a listening socket until stop() is called, then close it. a pool serves only once
+    def serve(self, listen_socket: socket.socket):
+        self.accept_thread = threading.current_thread()
+        #a selector rather than select(), which can't watch sockets numbered past 1024
+        self.selector = selectors.DefaultSelector()
+        try:
+            self.selector.register(listen_socket, selectors.EVENT_READ)
+            self.selector.register(self.wake_reader, selectors.EVENT_READ)
+            while not self.stopped:
+                timeout = None
+                if self.closing:
+                    timeout = max(0.0, min(self.closing.values()) - time.monotonic())
+                for (key, _) in self.selector.select(timeout):
+                    sock = key.fileobj
+                    if sock is listen_socket:
+                        try:
+                            (peer_socket, _) = listen_socket.accept()
+                        except OSError: #out of file descriptors for now, or the connection was reset already
+                            time.sleep(0.01)
+                            continue
+                        self.submit(peer_socket)
+                    elif sock is self.wake_reader:
+                        self.wake_reader.recv(4096)
+                    else:
+                        self._drain(sock)
+                while self.rejected:
+                    self._linger(self.rejected.popleft())
+                now = time.monotonic()
+                for sock in [sock for sock, deadline in self.closing.items() if deadline <= now]:
+                    self._close(sock)
+        finally:
+            listen_socket.close()
+            self._shut_down_workers()
+            for sock in list(self.closing) + list(self.rejected):
+                self._close(sock)
+            self.selector.close()
+            self.wake_reader.close()
+            self.wake_writer.close()
+
+    #give an accepted connection to a worker, or turn it away if too many are already waiting
+    def submit(self, sock: socket.socket):
+        with self.lock:
+            #another worker is started unless there are idle ones for every connection waiting, this one included
+            if self.queue.qsize() >= self.idle and len(self.workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+        if self.queue.qsize() >= self.queue_size:
+            self.reject(sock)
+            return
+        self.queue.put((time.monotonic(), sock))
+
+    #number of accepted connections waiting for a worker. a worker holding an idle keep-alive connection gives it up
+    #when this isn't zero
+    def waiting(self) -> int:
+        return self.queue.qsize()
+
+    #wait for the next request on a kept alive connection. returns False if the connection should be closed instead:
+    #it sat idle for idle_timeout seconds, the pool is stopping, or other connections are waiting for a worker
+    def wait_for_request(self, sock: socket.socket, idle_timeout: float) -> bool:
+        deadline = time.monotonic() + idle_timeout
+        timeout = sock.gettimeout()
+        try:
+            while True:
+                if self.stopped or self.waiting():
+                    return False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                sock.settimeout(min(remaining, self.POLL_INTERVAL))
+                try:
+                    #a closed connection counts as a request too, reading it tells the caller the peer went away
+                    sock.recv(1, socket.MSG_PEEK)
+                    return True
+                except socket.timeout:
+                    pass
+        finally:
+            sock.settimeout(timeout)
+
+    #tell a connection the peer is busy and close it once the other side has had the chance to read that. can be
+    #called from any thread
+    def reject(self, sock: socket.socket):
+        try:
+            sock.setblocking(False)
+            sock.send(self.busy_message)
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            sock.close()
+            return
+        if threading.current_thread() is self.accept_thread:
+            self._linger(sock)
+        elif self.stopped: #the accept loop may be gone already
+            sock.close()
+        else:
+            self.rejected.append(sock)
+            self._wake()
+
+    #stop accepting and turn away every connection still waiting. connections being served finish the request in
+    #hand. returns straight away
+    def stop(self):
+        self.stopped = True
+        self._wake()
+
+    def _work(self):
+        while True:
+            with self.lock:
+                self.idle += 1
+            item = self.queue.get()
+            with self.lock:
+                self.idle -= 1
+            if item is None:
+                return
+            (queued_at, sock) = item
+            if self.stopped or time.monotonic() - queued_at > self.queue_timeout:
+                self.reject(sock)
+                continue
+            try:
+                self.handle(sock)
+            except Exception: #a broken connection must never take a worker down with it
+                sock.close()
+
+    #tell every worker to exit once it is done with its connection, turning away the connections still queued
+    def _shut_down_workers(self):
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.reject(item[1])
+        for _ in self.workers:
+            self.queue.put(None)
+
+    #drain a rejected socket on the accept loop until the other side closes it or LINGER_TIME runs out
+    def _linger(self, sock: socket.socket):
+        self.closing[sock] = time.monotonic() + self.LINGER_TIME
+        self.selector.register(sock, selectors.EVENT_READ)
+
+    def _drain(self, sock: socket.socket):
+        try:
+            if sock.recv(4096):
+                return
+        except BlockingIOError:
+            return
+        except OSError:
+            pass
+        self._close(sock)
+
+    def _close(self, sock: socket.socket):
+        if self.closing.pop(sock, None) is not None:
+            self.selector.unregister(sock)
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def _wake(self):
+        try:
+            self.wake_writer.send(b"x")
+        except OSError:
+            pass